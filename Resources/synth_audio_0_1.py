@@ -0,0 +1,161 @@
+############
+## This picks the audio output format, and finds how small its buffer can go
+##   A project can ask for a sample rate, block size and channel count in its
+##   Config.txt. A block size of "auto" uses the smallest buffer this machine
+##   has played without underruns: tuning plays a calibration tone through
+##   the NumPy mixer at smaller and smaller buffers, counting the blocks that
+##   weren't ready in time, and keeps the last one that kept up. What it finds
+##   is remembered in the user's home folder, for each machine. Tuning takes
+##   a while and plays a tone, so it's only ever run by hand:
+##       python synth_audio_0_1.py tune [rate] [channels]
+##   and a machine that hasn't been tuned yet uses pygame's own buffer size.
+##   -- (0.1) Initial version
+############
+
+import math
+import os
+import platform
+import time
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import numpy
+import pygame
+
+import synth_mixer_0_1 as synth_mixer
+
+import logging
+logger = logging.getLogger(__name__)
+logger.addHandler( logging.StreamHandler() )
+logger.setLevel(logging.INFO)
+
+# The tuned buffers live in the user's home folder, not a project, since they belong to the machine
+tuningFile = os.path.join(os.path.expanduser("~"), ".synthea_audio")
+# Bump this whenever the tuning entries change shape
+tuningVersion = 1
+# The sample rate to tune for when a project doesn't give one
+DEFAULT_RATE = 44100
+DEFAULT_CHANNELS = 2
+# pygame's own buffer size, when it isn't given one
+DEFAULT_BUFFER = 512 if pygame.version.vernum[0] >= 2 else 4096
+# The buffer sizes to try, from the largest down, in frames
+MAX_BUFFER = 4096
+MIN_BUFFER = 64
+# How long to play the calibration tone at each buffer size, in seconds
+CALIBRATION_TIME = 3.0
+# The calibration tone, in Hz
+CALIBRATION_TONE = 440.0
+
+
+# This machine's name, which the tuned buffers are filed under
+def machine():
+    return platform.node() or "localhost"
+
+# Read every machine's tuned buffers, or return none
+def loadTuning():
+    try:
+        with open(tuningFile, "rb") as f:
+            tuning = pickle.load(f)
+        if tuning.get("version") == tuningVersion:
+            return tuning["buffers"]
+    except(IOError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+        pass
+    return {}
+
+# Write the tuned buffers, being careful not to leave a half-written file behind
+def saveTuning(buffers):
+    try:
+        with open(tuningFile+".tmp", "wb") as f:
+            pickle.dump({"version": tuningVersion, "buffers": buffers}, f, pickle.HIGHEST_PROTOCOL)
+        # Windows won't rename over an existing file
+        if os.path.exists(tuningFile):
+            os.remove(tuningFile)
+        os.rename(tuningFile+".tmp", tuningFile)
+    except(IOError, OSError):
+        logger.warn("  ! Warning: unable to save the tuned audio buffer")
+
+# The smallest stable buffer this machine has found at a rate and channel count, or None if it hasn't been tuned
+def tunedBuffer(rate, channels):
+    return loadTuning().get((machine(), rate, channels))
+
+def rememberBuffer(rate, channels, buffer):
+    buffers = loadTuning()
+    buffers[(machine(), rate, channels)] = buffer
+    saveTuning(buffers)
+
+# The arguments for pygame.mixer.init, from a project's settings (leaving out anything it doesn't set)
+#   A block size of "auto" uses this machine's tuned buffer, or pygame's own until it has been tuned
+def outputSettings(sampleRate=None, blockSize=None, channels=None):
+    settings = {}
+    if sampleRate:
+        settings["frequency"] = sampleRate
+    if channels:
+        settings["channels"] = channels
+    if blockSize == "auto":
+        rate = sampleRate or DEFAULT_RATE
+        settings["frequency"] = rate
+        buffer = tunedBuffer(rate, channels or DEFAULT_CHANNELS)
+        if buffer is None:
+            logger.info("The audio buffer hasn't been tuned for %s at %d Hz yet, using %d frames (run \"python synth_audio_0_1.py tune %d %d\" to tune it)" %
+                (machine(), rate, DEFAULT_BUFFER, rate, channels or DEFAULT_CHANNELS))
+            buffer = DEFAULT_BUFFER
+        settings["buffer"] = buffer
+    elif blockSize:
+        settings["buffer"] = blockSize
+    return settings
+
+# How long it takes a sound to get through an output buffer, and any blocks the NumPy mixer has waiting ahead of it, in ms
+def outputLatency(rate, buffer, blocksize=None):
+    frames = buffer
+    if blocksize:
+        # The engine keeps one block playing and another queued behind it
+        frames += 2 * blocksize
+    return 1000.0 * frames / rate
+
+# Play a calibration tone through the NumPy mixer for a while with a given buffer size, returning how many
+#   times the output ran dry
+def calibrate(rate, channels, buffer, seconds=CALIBRATION_TIME):
+    pygame.mixer.quit()
+    pygame.mixer.init(frequency=rate, channels=channels, buffer=buffer)
+    try:
+        engine = synth_mixer.NumpyEngine(*pygame.mixer.get_init(), blocksize=buffer)
+        # A whole number of cycles, so the loop is seamless
+        frames = int(round(rate / CALIBRATION_TONE)) * int(CALIBRATION_TONE)
+        tone = 0.25 * numpy.sin(2 * math.pi * CALIBRATION_TONE * numpy.arange(frames) / rate).astype(numpy.float32)
+        voice = engine.voice()
+        voice.play(synth_mixer.NumpySound(numpy.repeat(tone[:, None], engine.channels, axis=1), rate), loops=-1)
+        engine.start()
+        time.sleep(seconds)
+        engine.close()
+        return engine.underruns
+    finally:
+        pygame.mixer.quit()
+
+# Step the buffer down from the largest size, stopping at the first one that underruns, and remember the
+#   smallest one that didn't (or the largest, if none of them kept up)
+def autoTune(rate=DEFAULT_RATE, channels=DEFAULT_CHANNELS, largest=MAX_BUFFER, smallest=MIN_BUFFER, seconds=CALIBRATION_TIME):
+    logger.info("Tuning the audio buffer for %s at %d Hz..." % (machine(), rate))
+    stable = None
+    buffer = largest
+    while buffer >= smallest:
+        underruns = calibrate(rate, channels, buffer, seconds)
+        logger.info("  %5d frames (%.1f ms): %d underruns" % (buffer, outputLatency(rate, buffer), underruns))
+        if underruns:
+            break
+        stable = buffer
+        buffer //= 2
+    if stable is None:
+        logger.warn("  ! Warning: even a %d frame buffer underruns on this machine" % largest)
+        stable = largest
+    rememberBuffer(rate, channels, stable)
+    logger.info("Using a %d frame buffer (%.1f ms)" % (stable, outputLatency(rate, stable)))
+    return stable
+
+
+# python synth_audio_0_1.py tune [rate] [channels]
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "tune":
+        autoTune(int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_RATE, int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_CHANNELS)
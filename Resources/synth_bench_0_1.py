@@ -0,0 +1,301 @@
+############
+## This measures how long a cue takes to be heard, from its trigger to its first sample
+##   A board is generated with every kind of cue on it: cached, NOCACHE, looped
+##   (with a separate loop file) and random (with several variants). It is
+##   opened headless, and cues are triggered one at a time through the same
+##   MasterQueue and Mixer as the buttons use, timestamping the first sample
+##   that isn't silent once it comes out the other end. pygame and the NumPy
+##   mixer play into SDL's disk audio driver, which writes out whatever it
+##   plays in real time; VLC hands its samples to a callback instead, along
+##   with when each of them is due to be played. The 50th, 95th and 99th
+##   percentiles are reported by backend, kind of cue and size of board.
+##   -- (0.1) Initial version
+############
+
+import ctypes
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+import numpy
+
+# Nothing here needs a window, or a sound card
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import vlc
+
+import synth_headless_0_1 as synth_headless
+
+import logging
+logger = logging.getLogger(__name__)
+logger.addHandler( logging.StreamHandler() )
+logger.setLevel(logging.INFO)
+
+# The kinds of cue on a benchmark board, one after another
+cueKinds = ("cached", "nocache", "looped", "random")
+backends = ("pygame", "numpy", "vlc")
+# How long a cue may take to be heard before it counts as missed, in seconds
+TRIGGER_TIMEOUT = 2.0
+# How much silence there has to be before the next trigger, and how long to wait for it, in seconds
+SETTLE = 0.25
+SETTLE_TIMEOUT = 5.0
+# How often the disk sink looks for more output, in seconds
+SINK_POLL = 0.001
+# The format the benchmark sounds are written (and played back) in
+RATE = 44100
+CHANNELS = 2
+SOUND_LENGTH = 0.5
+
+
+# --------------------------------------------------------
+# Somewhere the board's output ends up, which notes when it's first heard after a trigger
+#   Every time is on the wall clock, in seconds
+# --------------------------------------------------------
+class Sink(object):
+
+    def __init__(self):
+        self.heard = None
+        self.lastSound = 0
+        self._expecting = False
+        self._cond = threading.Condition()
+
+    # Listen for the next sound
+    def expect(self):
+        with self._cond:
+            self.heard = None
+            self._expecting = True
+
+    # When the next sound was heard, or None if it didn't turn up in time
+    def wait(self, timeout=TRIGGER_TIMEOUT):
+        deadline = time.time() + timeout
+        with self._cond:
+            while self.heard is None and time.time() < deadline:
+                self._cond.wait(deadline - time.time())
+            self._expecting = False
+            return self.heard
+
+    # Wait for the output to go quiet for a while, returning whether it did
+    def settle(self, quiet=SETTLE, timeout=SETTLE_TIMEOUT):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if time.time() - self.lastSound >= quiet:
+                return True
+            time.sleep(quiet / 5)
+        return False
+
+    # Some samples have come out, and are heard at a given time
+    def _output(self, samples, when):
+        if not samples.any():
+            return
+        with self._cond:
+            self.lastSound = max(self.lastSound, when)
+            if self._expecting and self.heard is None:
+                self.heard = when
+                self._cond.notify_all()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+# --------------------------------------------------------
+# SDL's disk audio driver, which writes out what it plays (as fast as it would play it) to a file we follow
+# --------------------------------------------------------
+class DiskSink(Sink):
+
+    def __init__(self, path):
+        Sink.__init__(self)
+        self.path = path
+        self._stopped = False
+
+    # SDL reads these when the mixer is initialised, so set them beforehand
+    def install(self):
+        os.environ["SDL_AUDIODRIVER"] = "disk"
+        os.environ["SDL_DISKAUDIOFILE"] = self.path
+
+    def start(self):
+        self._file = open(self.path, "rb")
+        self._thread = threading.Thread(target=self._run, name="DiskSink")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._thread.join()
+        self._file.close()
+
+    def _run(self):
+        leftover = b""
+        while not self._stopped:
+            data = self._file.read()
+            if not data:
+                time.sleep(SINK_POLL)
+                continue
+            now = time.time()
+            # Writes can split a sample in two
+            data = leftover + data
+            whole = len(data) - len(data) % 2
+            leftover = data[whole:]
+            self._output(numpy.frombuffer(data[:whole], numpy.int16), now)
+
+
+# --------------------------------------------------------
+# VLC's audio callbacks, which every player in the pool plays into instead of a sound card
+# --------------------------------------------------------
+class CallbackSink(Sink):
+
+    def __init__(self, rate=RATE, channels=CHANNELS):
+        Sink.__init__(self)
+        self.rate = rate
+        self.channels = channels
+        # The callback has to live as long as the players do
+        self._play = vlc.AudioPlayCb(self._played)
+
+    # SDL still gets initialised for VLC, but doesn't need to play anything
+    def install(self):
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+    def attach(self, player):
+        player.audio_set_callbacks(self._play, None, None, None, None, None)
+        player.audio_set_format("S16N", self.rate, self.channels)
+
+    # pts is when VLC means the samples to be played, in microseconds on its own clock
+    def _played(self, opaque, samples, count, pts):
+        when = time.time() + (pts - vlc.libvlc_clock()) / 1000000.0
+        self._output(numpy.frombuffer(ctypes.string_at(samples, count * 2 * self.channels), numpy.int16), when)
+
+
+# A sound of noise, which is loud from its very first sample
+def writeSound(path, length=SOUND_LENGTH, rate=RATE, channels=CHANNELS):
+    count = int(length * rate) * channels
+    samples = numpy.random.randint(1000, 8000, count) * numpy.random.choice([-1, 1], count)
+    f = wave.open(path, "wb")
+    f.setnchannels(channels)
+    f.setsampwidth(2)
+    f.setframerate(rate)
+    f.writeframes(samples.astype(numpy.int16).tobytes())
+    f.close()
+
+# Write a project with a given number of cues on it, of each kind in turn, 8 to a frame and 32 to a page
+def makeBoard(docroot, cues, playback):
+    modeDir = os.path.join(docroot, "normal")
+    os.mkdir(modeDir)
+    with open(os.path.join(docroot, "Config.txt"), "w") as f:
+        f.write("name:Latency benchmark\ntype:sfx\nmodes:normal\nplayback:%s\ncrossfade:cross,full\nfadetime:1,1\n" % playback)
+    with open(os.path.join(docroot, "Layout.txt"), "w") as f:
+        for n in range(cues):
+            kind = cueKinds[n % len(cueKinds)]
+            files = ["cue_%d.wav" % n]
+            options = ""
+            if kind == "nocache":
+                options = "NOCACHE"
+            elif kind == "looped":
+                options = "LOOPEXT=_loop"
+                writeSound(os.path.join(modeDir, "cue_%d_loop.wav" % n))
+            elif kind == "random":
+                files = ["cue_%d_%s.wav" % (n, variant) for variant in "abc"]
+            for filename in files:
+                writeSound(os.path.join(modeDir, filename))
+            f.write("Page %d|Frame %d|%s %d|%s|%s\n" % (n // 32, n // 8, kind, n, ",".join(files), options))
+
+# The value a given percentage of the values are at or below
+def percentile(values, percent):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, int(math.ceil(percent / 100.0 * len(ordered))) - 1)]
+
+# Trigger every kind of cue on an open board in turn, returning kind -> (latencies in ms, number missed)
+def measure(frame, sink, triggers):
+    cues = dict((kind, [cue for cue in frame.buttons if cue.name.startswith(kind + " ")]) for kind in cueKinds)
+    results = dict((kind, ([], 0)) for kind in cueKinds)
+    for trigger in range(triggers):
+        for kind in cueKinds:
+            if not cues[kind]:
+                continue
+            cue = random.choice(cues[kind])
+            sink.expect()
+            start = time.time()
+            cue.queue()
+            heard = sink.wait()
+            latencies, missed = results[kind]
+            if heard is None:
+                results[kind] = (latencies, missed + 1)
+            else:
+                latencies.append((heard - start) * 1000)
+            # Cut it off and wait for it to go quiet, so nothing is left over for the next trigger
+            frame.cancel(fadeOut=False)
+            frame.pump()
+            if not sink.settle():
+                logger.warn("  ! Output didn't go quiet after %s" % cue.name)
+    return results
+
+# Open a generated board on a backend and time its triggers
+def benchmarkBoard(playback, cues, triggers):
+    docroot = tempfile.mkdtemp()
+    try:
+        makeBoard(docroot, cues, playback)
+        if playback == "vlc":
+            sink = CallbackSink()
+        else:
+            sink = DiskSink(os.path.join(docroot, "output.raw"))
+        sink.install()
+        master = synth_headless.openBoard(docroot)
+        try:
+            if playback == "vlc":
+                master.mixer.players.prepare(sink.attach)
+            # Everything but the NOCACHE cues is decoded before the show, as the loader would
+            master.frame.preload()
+            sink.start()
+            try:
+                return measure(master.frame, sink, triggers)
+            finally:
+                sink.stop()
+        finally:
+            master.frame.shutdown()
+            master.mixer.close()
+            pygame.mixer.quit()
+    finally:
+        shutil.rmtree(docroot)
+
+def benchmark(playbacks=backends, sizes=(16, 64, 256), triggers=25):
+    rows = []
+    for playback in playbacks:
+        for cues in sizes:
+            logger.info("Triggering %d of each kind of cue on a %d cue %s board..." % (triggers, cues, playback))
+            results = benchmarkBoard(playback, cues, triggers)
+            for kind in cueKinds:
+                latencies, missed = results[kind]
+                rows.append((playback, cues, kind, len(latencies), missed) + tuple(percentile(latencies, percent) for percent in (50, 95, 99)))
+    logger.info("%-7s %6s  %-8s %6s %6s %9s %9s %9s" % ("Backend", "Cues", "Kind", "Heard", "Missed", "p50 ms", "p95 ms", "p99 ms"))
+    for row in rows:
+        logger.info("%-7s %6d  %-8s %6d %6d " % row[:5] + " ".join("%9s" % ("%.1f" % value if value is not None else "-") for value in row[5:]))
+    return rows
+
+
+# python synth_bench_0_1.py [pygame|numpy|vlc ...] [--sizes 16,64,256] [--triggers 25]
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    playbacks = []
+    sizes = (16, 64, 256)
+    triggers = 25
+    while args:
+        arg = args.pop(0)
+        if arg == "--sizes":
+            sizes = tuple(int(size) for size in args.pop(0).split(","))
+        elif arg == "--triggers":
+            triggers = int(args.pop(0))
+        elif arg in backends:
+            playbacks.append(arg)
+        else:
+            sys.exit("Unknown option %s" % arg)
+    benchmark(playbacks or backends, sizes, triggers)
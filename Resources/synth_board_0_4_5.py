@@ -55,9 +55,31 @@ sys.path.append("Resources")
 ### FUNCTION-LEVEL IMPORTS
 # The current version of gui import includes numerous sorting and other improvements
 import synth_layout_0_92 as synth_layout
+# The watcher notices when project files are edited
+import synth_watch_0_1 as synth_watch
+# The media table knows about every sound file, so we don't have to look for them one by one
+import synth_media_0_1 as synth_media
+# The sound cache holds every decoded sound, within a memory budget
+import synth_cache_0_1 as synth_cache
+# The cue loader decodes sounds in the background, so the board can be used right away
+import synth_loader_0_1 as synth_loader
+# Decoded sounds can be kept on disk between launches
+import synth_pcm_0_1 as synth_pcm
+# The software mixer, for numpy playback
+import synth_mixer_0_1 as synth_mixer
+# Deferred actions are scheduled against the mixer's audio clock
+import synth_schedule_0_1 as synth_schedule
+# Every fade is ramped by one fade engine
+import synth_fade_0_1 as synth_fade
+# The voices report what they're doing on the playback event bus
+import synth_events_0_1 as synth_events
+# The output format, and the buffer size tuned for this machine
+import synth_audio_0_1 as synth_audio
 # The game module that provides our audio interface
 import pygame
 import vlc
+# VLC media is parsed in the background
+import synth_vlc_0_1 as synth_vlc
 # Import the random module for randomizing sound clips
 import random
 # Import numpy for creating the sound of silence (Posluns)
@@ -67,6 +89,8 @@ import subprocess, re
 
 # For manual fadeouts, we need to sleep
 import threading
+import contextlib
+import math
 import logging
 logger = logging.getLogger(__name__)
 logger.addHandler( logging.StreamHandler() )
@@ -74,9 +98,16 @@ logger.setLevel(logging.DEBUG)
 
 BUFFERLOOP = False
 DEFAULT_DEFER = 500
+# How many pygame channels to leave outside the voice pools, for sounds played directly
+SPARE_CHANNELS = 2
+# The pygame event our channels send when they finish, and how often we collect them, in ms
+CHANNEL_END = pygame.USEREVENT + 1
+EVENT_PUMP = 50
 
 # Dan Posluns made a little loader status counter
 displayLoadingProgress = True
+# Buttons whose sounds are still loading are shown in grey
+loadingColour = "#999999"
 
 # Define the hotkey actions
 hotkeyFunctions = {
@@ -88,6 +119,15 @@ hotkeyFunctions = {
     "ENABLE_CROSSFADE": "self.setCrossfadeEnabled(True)",
     "DISABLE_CROSSFADE": "self.setCrossfadeEnabled(False)",
     "STOP_SOUND": "self.cancel(disableFade=True)",
+    "BUS_GAIN": "self.setBusGain(\"%s\",%s,%s)",
+    "BUS_NUDGE": "self.nudgeBusGain(\"%s\",%s,%s)",
+    "BUS_MUTE": "self.toggleBusMute(\"%s\")",
+    "BUS_SOLO": "self.toggleBusSolo(\"%s\")",
+}
+# The arguments a hotkey can leave off the end, and what they default to
+hotkeyDefaults = {
+    "BUS_GAIN": ("0",),
+    "BUS_NUDGE": ("0",),
 }
 # Define the hotkey modifiers
 hotkeyModifiers = {
@@ -113,15 +153,32 @@ class MyFrame(wx.Frame):
         self.modes = master.config["modes"]
 
 
-        # A time-remaining timer
+        # A time-remaining timer, for the button that's playing now
         self.timecounter = wx.Timer(self)
         self.timeremaining = 0
+        self.nowPlaying = None
         self.Bind(wx.EVT_TIMER, self.timeRemaining, self.timecounter)
 
+        # The status bar and DJ mode hear when voices start and end from the playback events, on the GUI thread
+        master.mixer.events.dispatch = wx.CallAfter
+        master.mixer.events.subscribe(self.playbackEvent, (synth_events.STARTED, synth_events.ENDED))
+        # pygame leaves its channels' end events in its event queue, for us to collect
+        if master.mixer.mode == 'pygame':
+            self.eventPump = wx.Timer(self)
+            self.Bind(wx.EVT_TIMER, lambda event: master.mixer.pump(), self.eventPump)
+            self.eventPump.Start(EVENT_PUMP)
+
         self.mode = -1
         self.master_queue = MasterQueue(self)
         # A dictionary of all buttons, for easy access!
         self.master_buttons = {}
+        # Sounds are loaded by background workers, which hand each button back to the GUI thread when done
+        self.loader = synth_loader.CueLoader(lambda button: button.preload(), lambda button: wx.CallAfter(button.loadFinished))
+        # The page prefetcher gets the cues around the visible page ready, within half the cache by default
+        prefetchBudget = master.config["prefetch"]
+        if prefetchBudget is None and master.config["cache_budget"]:
+            prefetchBudget = master.config["cache_budget"] / 2
+        self.prefetcher = synth_loader.PagePrefetcher(self.loader, lambda button: button.prefetch(), prefetchBudget or None)
         # A default or custom (or no) crash noise
         if master.config.has_key("crashnoise"):
             if master.config["crashnoise"] == "none":
@@ -141,13 +198,17 @@ class MyFrame(wx.Frame):
         self.statusBar = wx.StatusBar(self, -1)
         # If we have multiple modes or DJ mode, include a status bar field for it
         if len(self.modes) > 1 or master.config["dj"]:
-            self.statusBar.SetFieldsCount(6)
-            self.statusBar.SetStatusWidths([-3,-3,-2,-2,-2,-2])
+            self.statusBar.SetFieldsCount(8)
+            self.statusBar.SetStatusWidths([-3,-3,-2,-2,-2,-2,-2,-2])
         else:
-            self.statusBar.SetFieldsCount(5)
-            self.statusBar.SetStatusWidths([-2,-2,-1,-1,-1])
+            self.statusBar.SetFieldsCount(7)
+            self.statusBar.SetStatusWidths([-2,-2,-1,-1,-1,-1,-1])
+        # The output latency and the sound cache's memory use always go in the last two fields
+        self.latencyField = self.statusBar.GetFieldsCount() - 2
+        self.cacheField = self.statusBar.GetFieldsCount() - 1
         self.SetStatusBar(self.statusBar)
         self.updateFadeDisplay()
+        self.updateLatencyDisplay()
 
 
 
@@ -201,6 +262,9 @@ class MyFrame(wx.Frame):
             # SHIFT-CAPS will go into DJ mode, if we have it!
             global_hotkeys.append( (0, wx.WXK_F12, "self.playDj()") )
             self.djplay = []
+            # The channel the DJ is playing on, and how long until the next track once it starts, in ms
+            self.djChannel = None
+            self.djCountdown = 0
             self.djtimer = wx.Timer(self)
             #self.djtimer = wx.Timer(self)
             self.Bind(wx.EVT_TIMER, self.playDj, self.djtimer)
@@ -230,28 +294,11 @@ class MyFrame(wx.Frame):
             self.parseEvent(type)
         self.Bind(wx.EVT_MENU, passKeyCode)
 
+        # Keep the built-in hotkeys apart, so the project hotkeys can be re-bound on reload
+        self.builtin_events = dict(self.global_events)
+        self.builtin_shortcuts = shortcut_table
         # Add any events to capture from the project hotkeys file
-        for hotkey in master.layout_hotkeys:
-            # Gather the hotkey information
-            modifiers = hotkey[0]
-            key = ord(hotkey[1])
-            fn = hotkeyFunctions[hotkey[2]]
-            params = hotkey[3]
-            # Determine key modifiers
-            wxModifier = wx.ACCEL_NORMAL
-            # With bitshifting we can combine the modifiers and remain unique
-            for modifier in modifiers:
-                wxModifier = wxModifier | hotkeyModifiers[modifier]
-            # Build a hotkeyID as a combination of modifier(s) and the key itself
-            hotkeyID = key | (wxModifier << 16)
-            # Set the hotkey
-            self.global_events[hotkeyID] = fn % params
-            shortcut_table.append( (wxModifier, key, hotkeyID) )
-
-        # Create an accelerator table from the list of tuples we just made
-        shortcuts = wx.AcceleratorTable(shortcut_table)
-        # Give the accelerator table global scope in the program
-        self.SetAcceleratorTable(shortcuts)
+        self.bindHotkeys()
 
         # Create a titlebar icon for the Windows platform
         if sys.platform == "win32":
@@ -303,9 +350,51 @@ class MyFrame(wx.Frame):
         self.SetSizer(masterbox)
         self.Layout()
 
+    # Build the accelerator table from the built-in hotkeys plus the project hotkeys file
+    def bindHotkeys(self):
+        self.global_events = dict(self.builtin_events)
+        shortcut_table = list(self.builtin_shortcuts)
+        for hotkey in master.layout_hotkeys:
+            # A PLAY hotkey is only useful if the button it names exists
+            if hotkey[2] == "PLAY" and not master.layout_index.buttonNamed(hotkey[3][0] if hotkey[3] else None):
+                logger.warn("  ! Warning: hotkey %s plays unknown button %s" % (hotkey[1], hotkey[3]))
+                continue
+            # Gather the hotkey information
+            modifiers = hotkey[0]
+            key = ord(hotkey[1])
+            fn = hotkeyFunctions[hotkey[2]]
+            params = tuple(hotkey[3])
+            # Fill in any arguments that were left off, and skip a hotkey that still has the wrong number
+            needed = fn.count("%s")
+            defaults = hotkeyDefaults.get(hotkey[2], ())
+            if needed - len(defaults) <= len(params) < needed:
+                params += defaults[len(defaults) - (needed - len(params)):]
+            if len(params) != needed:
+                logger.warn("  ! Warning: hotkey %s needs %d arguments for %s, not %d, skipping it" % (hotkey[1], needed, hotkey[2], len(hotkey[3])))
+                continue
+            # Determine key modifiers
+            wxModifier = wx.ACCEL_NORMAL
+            # With bitshifting we can combine the modifiers and remain unique
+            for modifier in modifiers:
+                wxModifier = wxModifier | hotkeyModifiers[modifier]
+            # Build a hotkeyID as a combination of modifier(s) and the key itself
+            hotkeyID = key | (wxModifier << 16)
+            # Set the hotkey
+            self.global_events[hotkeyID] = fn % params
+            shortcut_table.append( (wxModifier, key, hotkeyID) )
+
+        # Create an accelerator table from the list of tuples we just made
+        shortcuts = wx.AcceleratorTable(shortcut_table)
+        # Give the accelerator table global scope in the program
+        self.SetAcceleratorTable(shortcuts)
+
     # Proper closure
     def OnCloseWindow(self,Event):
+        # Stop watching for changes
+        master.unwatch()
+        self.shutdown()
         # Stop the noise!
+        master.mixer.close()
         pygame.mixer.stop()
         pygame.quit()
 
@@ -321,11 +410,35 @@ class MyFrame(wx.Frame):
         self.Destroy()
         sys.exit()
 
+    # Stop the background threads that belong to this frame: loading, prefetching and deferrals
+    def shutdown(self):
+        self.loader.stop()
+        self.prefetcher.stop()
+        # Keep whatever was hashed or probed since loading finished, such as on-demand sounds
+        master.metadata.save()
+        self.master_queue.scheduler.stop()
+        master.mixer.events.unsubscribe(self.playbackEvent)
+        master.mixer.events.unsubscribe(self.master_queue.playbackEvent)
+        if master.mixer.mode == 'pygame' and self.eventPump.IsRunning():
+            self.eventPump.Stop()
+        logger.info(self.prefetcher.describe())
+        logger.info(master.mixer.events.describe())
+
     def reloadLayout(self,Event):
         logger.debug("Reloading layout!")
         master.reload()
 
 
+    # Rebuild the lists of every button on the board, after a reload has patched it (renamed buttons lose their old names)
+    def refreshButtons(self):
+        self.buttons = []
+        self.master_buttons = {}
+        for page in self.contentPanel.pages:
+            for group in page.groups:
+                for button in group.buttons:
+                    self.buttons.append(button)
+                    self.master_buttons[button.name] = button
+
     # This sets some startup conditions
     def initialize(self):
         # Set our default mode by forcing the changemode with an argument
@@ -366,8 +479,25 @@ class MyFrame(wx.Frame):
             master.fadetime = [ int(time * 1000), int(time * 1000) ]
         else:
             master.fadetime[method] = int(time * 1000)
+        # Fades that are under way take on the new time too
+        master.mixer.retarget_fades(master.fadetime[0], master.fadetime[1])
         self.updateFadeDisplay()
 
+    # Ramp a group's mix bus to a gain in dB over a time in seconds (the general effects are on SFX, and everything on MASTER)
+    def setBusGain(self, group, decibels, time=0):
+        master.mixer.set_bus_gain(group, decibels, int(time * 1000))
+        logger.info("Bus %s going to %+.1f dB" % (group, decibels))
+
+    # Ramp a group's mix bus up or down by a number of dB from wherever it's headed
+    def nudgeBusGain(self, group, decibels, time=0):
+        self.setBusGain(group, master.mixer.bus_gain_db(group) + decibels, time)
+
+    def toggleBusMute(self, group):
+        master.mixer.set_bus_mute(group, not master.mixer.bus(group).mute)
+
+    def toggleBusSolo(self, group):
+        master.mixer.set_bus_solo(group, not master.mixer.bus(group).solo)
+
     # This updates the status bar display of our fade settings
     def updateFadeDisplay(self):
         if master.fadetime[0] == master.fadetime[1]:
@@ -378,24 +508,50 @@ class MyFrame(wx.Frame):
         fade = "Fade" if master.crossfade[1] else "Full"
         self.statusBar.SetStatusText("%s-%s " % (cross,fade), 4)
 
-	# This sets a time-remaining counter
-    def timeRemaining(self,event=False):
+    # This updates the status bar display of how long a sound takes to get through the output
+    def updateLatencyDisplay(self):
+        latency = master.mixer.latency()
+        self.statusBar.SetStatusText("Latency: %.1f ms" % latency if latency is not None else "", self.latencyField)
 
-        self.timeremaining = self.timeremaining - 1
+    # This updates the status bar display of the sound cache's memory use
+    def updateCacheDisplay(self):
+        self.statusBar.SetStatusText(master.mixer.cache.describe(), self.cacheField)
 
-         # Make sure we're really done?
-        if self.timeremaining <= 0 and not pygame.mixer.get_busy():
-        	# Stop the timer
+	# This updates the time-remaining counter; the end of the track is heard from the playback events
+    def timeRemaining(self,event=False):
+        if not self.nowPlaying:
             self.timecounter.Stop()
+            return
+        self.timeremaining = max(0, self.nowPlaying.get_time_remaining())
+        self.statusBar.SetStatusText("Remaining: %d:%.2d" % (self.timeremaining/60,self.timeremaining%60), 2)
+
+    # A voice has started or ended: clear the "Now Playing" when its track ends, and keep the DJ on time
+    def playbackEvent(self,kind,channel):
+        if kind == synth_events.ENDED and self.nowPlaying and channel is self.nowPlaying.channel:
+            self.nowPlaying = None
+            if self.timecounter.IsRunning():
+                self.timecounter.Stop()
             self.statusBar.SetStatusText("",1)
-            # Clear the "Now Playing"
             self.statusBar.SetStatusText("",2)
-        else:
-        	# Update the timer
-            self.statusBar.SetStatusText("Remaining: %d:%.2d" % (self.timeremaining/60,self.timeremaining%60), 2)
+        if master.config["dj"] and self.djplay and channel is self.djChannel:
+            # Count down from when the track really started, which may be after a fade
+            if kind == synth_events.STARTED:
+                self.djtimer.Start(self.djCountdown, True)
+            # A track that ends early goes straight on to the next
+            elif kind == synth_events.ENDED and self.djtimer.IsRunning():
+                self.djtimer.Stop()
+                self.playDj()
+
 
 
 
+    # The visible page has changed, so prefetch the cues around it (unless prefetching is off)
+    def pageChanged(self):
+        if master.config["prefetch"] is False:
+            return
+        pages = [[button for group in page.groups for button in group.buttons] for page in self.contentPanel.pages]
+        self.prefetcher.pageChanged(pages, self.contentPanel.GetSelection())
+        logger.debug(self.prefetcher.describe())
 
     # A method to control the "mode" of the sound by changing source directories
     def changeMode(self, firstrun=False):
@@ -408,19 +564,25 @@ class MyFrame(wx.Frame):
                 self.mode += 1
             else:
                 self.mode = 0
+            # The previous mode's pinned sounds don't need to stay hot any more, nor loaded
+            master.mixer.cache.unpin()
+            self.loader.clear()
+            with master.loadLock:
+                master.totalLoaded = 0
+            self.loadReported = False
             # Link through all the nested pages, panels, and buttons
             for page in self.contentPanel.pages:
                 for group in page.groups:
                     for button in group.buttons:
-                        # Show where we are so far
-                        if displayLoadingProgress or master.testmode:
-                            logger.debug("%d%%: %s" % (int(float(master.totalLoaded * 100) / master.totalSounds), ", ".join(button.src) ))
-                        # Instruct each button to load a new sound file
+                        # Instruct each button to load a new sound file, which happens in the background
                         button.loadmode()
                         # Store that we have this button
                         self.buttons.append(button)
 
+            # Get the pages around the visible one loaded first
+            self.pageChanged()
             # Update the status bar with the current mode
+            self.updateCacheDisplay()
             if len(self.modes) > 1:
                 self.statusBar.SetStatusText("Mode: %s" % self.modes[self.mode].upper(),5) # no longer showing board type master.config["type"].upper()
             elif master.config["dj"]:
@@ -429,6 +591,27 @@ class MyFrame(wx.Frame):
             if firstrun and displayLoadingProgress:
                 displayLoadingProgress
 
+    # Called whenever a button finishes loading, to report once the whole mode is loaded
+    def loadingDone(self):
+        if self.loadReported or not self.loader.idle():
+            return
+        self.loadReported = True
+        # Everything in this mode has been indexed, so the metadata index can be written out
+        master.metadata.prune()
+        master.metadata.save()
+        used, budget, sounds, pinned = master.mixer.cache.usage()
+        logger.info("Loaded %d buttons: %d sounds in %.1f MB, sharing identical files saved %.1f MB" % (len(self.buttons), sounds, float(used) / 1048576, float(master.mixer.cache.savedBytes()) / 1048576))
+
+    # The order in which a button should be loaded: the current page first, then the others in tab order
+    def loadPriority(self,button):
+        page = button.GetParent().GetParent()
+        if not page in self.contentPanel.pages:
+            return len(self.contentPanel.pages)
+        position = self.contentPanel.pages.index(page)
+        if position == self.contentPanel.GetSelection():
+            return 0
+        return position + 1
+
     # A method to shuffle playback indefinitely, like a DJ
     def playDj(self,event=False):
 
@@ -459,17 +642,16 @@ class MyFrame(wx.Frame):
         # If we loop, loop randomly for 2-4 minutes
         if nexttrack.loop:
             countdown = random.randint(90,150)
-        # If not a loop, get the length of the track
+        # If not a loop, get the length of the track from the metadata index
         else:
-            try:
-                countdown = soundfile.get_length()
-            except(AttributeError):
-                countdown = 0
+            countdown = nexttrack.duration()
 
         # Wait for just before the fadetime, then loop
         if master.testmode:
             logger.debug("Countdown: %d, Fadetime: %g/%g" % (countdown, float(master.fadetime[0])/1000, float(master.fadetime[1])/1000 ))
-        self.djtimer.Start( (countdown*1000)-master.fadetime[0], True )
+        self.djChannel = nexttrack.channel
+        self.djCountdown = max(1, int(countdown*1000)-master.fadetime[0])
+        self.djtimer.Start( self.djCountdown, True )
 
 
     # A method to advance notebook pages: true for right, false for left
@@ -479,7 +661,9 @@ class MyFrame(wx.Frame):
     # A method to jump to a specific notebook page
     def pagejump(self,pagenum):
         if pagenum <= len(self.contentPanel):
+            # ChangeSelection doesn't send a page-changed event, so prefetch here
             self.contentPanel.ChangeSelection(pagenum-1)
+            self.pageChanged()
 
     # A way to cutoff any play and (optionally) play a "crash" noise
     def cancel(self,canceleffects,cancelmusic,fadeOut=True,interrupt=False,):
@@ -520,13 +704,12 @@ class MyFrame(wx.Frame):
             self.djplay = []
             if self.djtimer.IsRunning():
                 self.djtimer.Stop()
-        # Garbage collect? Clear out any NOCACHE buttons
+        # Garbage collect: drop any NOCACHE sounds that aren't playing, and trim the cache to its budget
         for button in self.buttons:
-            if button.buffer == 2 and type(button.sounds[0]) != str:
-                # Re-initializing the button's load method will clear it... I think?
-                if master.testmode:
-                    logger.debug("Clearing cache of %s" % button.name)
-                button.loadmode()
+            if button.nocache:
+                button.uncache()
+        master.mixer.cache.evict()
+        self.updateCacheDisplay()
         # Time-counter?
         if self.timecounter.IsRunning():
             self.timecounter.Stop()
@@ -549,12 +732,12 @@ class MyFrame(wx.Frame):
         # Shall we address the cached effects channels?
         if effects:
             # The pause button will only perform if the mixer is working, to avoid accidental pausing
-            if pygame.mixer.get_busy():
+            if master.mixer.get_busy():
                 if self.paused:
-                    pygame.mixer.unpause()
+                    master.mixer.unpause()
                     self.paused = False
                 else:
-                    pygame.mixer.pause()
+                    master.mixer.pause()
                     self.paused = True
             else:
                 self.paused = False
@@ -600,11 +783,17 @@ class MasterQueue():
         self.wxFrame = wxFrame
         self.silence = pygame.sndarray.make_sound(numpy.array([[0, 0]], dtype=numpy.int16))
         self.lastActiveChannel = None
-        self.deferSound = None
-        self.deferChannel = None
-        self.deferLoop = None
-        self.deferTimer = wx.Timer(wxFrame)
-        wxFrame.Bind(wx.EVT_TIMER, self.DeferTimerCallback, self.deferTimer)
+        # Deferred actions wait on the mixer's audio clock, as many at once as we like
+        self.scheduler = synth_schedule.Scheduler(master.mixer.clock, master.mixer.lead(), threaded=not master.mixer.offline)
+        # Forget the last active channel once it's finished
+        master.mixer.events.subscribe(self.playbackEvent, (synth_events.ENDED,))
+        # The actions that can be deferred, each called with the moment it's for and then its channel
+        self.deferActions = {
+            "play": self.DeferredPlay,
+            "queue": self.DeferredQueue,
+            "fade": self.DeferredFade,
+            "stop": self.DeferredStop,
+            }
 
     # This method adds/removes items from the queue
     def Queue(self, item):
@@ -612,6 +801,8 @@ class MasterQueue():
         if item in self.queue:
             logger.debug("Removing QUEUE item %s." % item.name)
             self.queue.remove(item)
+            # An unqueued cue doesn't need its pre-armed voice any more
+            item.disarm()
         else:
             logger.debug("Adding QUEUE item %s." % item.name)
             self.queue.append(item)
@@ -621,6 +812,17 @@ class MasterQueue():
             # Call this Queue's on play method
             self.Play()
 
+    def playbackEvent(self, kind, channel):
+        if channel is self.lastActiveChannel:
+            self.lastActiveChannel = None
+
+    # Whether a channel is spoken for, by a queued cue or by a deferred action
+    def holds(self, channel):
+        for item in self.queue:
+            if item.channel is channel:
+                return True
+        return bool(self.scheduler.pending(channel))
+
     # Update the status bar
     def ShowStatus(self):
         if self.queue:
@@ -631,37 +833,47 @@ class MasterQueue():
         else:
             master.frame.statusBar.SetStatusText(" -- no queue  --", 0)
 
-    # This routine allows loop intros by queuing the file after playback starts
-    def DeferTimerCallback(self, event):
-        # Is a channel specified? If so, queue it there
-        if self.deferChannel and self.deferChannel.get_queue() == None:
-            # If the channel is open and we've been waiting, manually play() so we can include loop/fade parameters
-            if not self.deferChannel.is_playing() and master.crossfade[1]:
-                logger.debug("Defer call, now playing %s" % self.deferSound)
-                self.deferChannel.play(self.deferSound, loops=self.deferLoop, fade_ms=master.fadetime[1])
-            # If the channel is busy, queue it
-            else:
-                logger.debug("Defer call, now queuing %s" % self.deferSound)
-                self.deferChannel.queue(self.deferSound)
-
-
-    # This routine will defer playback of a Sound for a specified time to play a loop intro a queue a looping segment
-    def DeferSound(self, channel, sound, oneshot, loop=None, delay=DEFAULT_DEFER):
-        logger.debug("Starting a %s deferral delayed %d and looping " % ("one-shot" if oneshot else "continuous", delay),)
-        logger.debug(loop)
-        self.deferChannel = channel
-        self.deferSound = sound
-        self.deferLoop = loop
-        # If this is a loop, we will defer continuously
-        # If this is not, we will one_shot
-        self.deferTimer.Start(delay, oneshot)
-
-    def CancelDefer(self):
-        if self.deferChannel:
-            self.deferChannel.queue(self.silence)
-        self.deferTimer.Stop()
-        self.deferSound = None
-        self.deferChannel = None
+    # Defer an action on a channel by a delay in ms, returning a handle that it can be cancelled by
+    def Defer(self, action, channel, delay, *args):
+        logger.debug("Deferring %s on %s by %d" % (action, channel, delay))
+        return self.scheduler.schedule(delay, self.deferActions[action], (channel,)+args, tag=channel)
+
+    # This routine will defer playback of a Sound for a specified time, e.g. to wait for a fadeout
+    #   A one-shot deferral plays the sound, with an optional (sound, loops) to follow it like the
+    #   loop after a loop intro; otherwise, the sound follows on from whatever the channel is playing
+    def DeferSound(self, channel, sound, oneshot, loop=None, delay=DEFAULT_DEFER, then=None):
+        logger.debug("Starting a %s deferral delayed %d and looping %s" % ("one-shot" if oneshot else "follow-on", delay, loop))
+        if oneshot:
+            return self.Defer("play", channel, delay, sound, loop, then)
+        return self.Defer("queue", channel, delay, sound, loop)
+
+    # The deferred actions themselves, which run on the scheduler's thread
+    def DeferredPlay(self, at, channel, sound, loop=None, then=None):
+        logger.debug("Defer call, now playing %s" % sound)
+        channel.queue(sound)
+        channel.play(loops=loop, fade_ms=master.fadetime[1] if master.crossfade[1] else 0, at=at)
+        # A loop intro brings its loop along, to follow it at its last sample
+        if then:
+            channel.queueLoop(*then)
+
+    def DeferredQueue(self, at, channel, sound, loop=None):
+        logger.debug("Defer call, now queuing %s" % sound)
+        channel.queueLoop(sound, loop)
+
+    def DeferredFade(self, at, channel, fadetime):
+        channel.fadeout(fadetime, at=at)
+
+    def DeferredStop(self, at, channel):
+        channel.stop(at=at)
+
+    # Cancel the deferred actions for a channel, or for an exclusive group of channels, or all of them
+    def CancelDefer(self, channel=None, group=None):
+        if channel:
+            self.scheduler.cancelWhere(lambda tag: tag is channel)
+        elif group:
+            self.scheduler.cancelWhere(lambda tag: getattr(tag, "group", None) == group)
+        else:
+            self.scheduler.cancelWhere()
 
     # A method to clear the queue, whether playing all the files queued or not
     def Play(self):
@@ -669,26 +881,27 @@ class MasterQueue():
         logger.debug(master.crossfade,)
         logger.debug(" Fade: ",)
         logger.debug(master.fadetime)
-        ''' This method doesn't loop itself; instead, it plays and then 'queues' the first item in the queue '''
-        self.CancelDefer()
-
-        # We can set a fadein according to configuration
-        fadein = master.fadetime[1] if master.crossfade[1] else 0
-         # Play (only) the first item in the queue by calling its play method
-        self.queue[0].play()
-        # Track what channel the button is playing on
-        self.lastActiveChannel = self.queue[0].channel
-        # Use this class' remove method: re-queuing an existing file will remove it
-        self.Queue(self.queue[0])
-        ''' The Queue method removes the existing item and continues play, thus creating our loop! '''
+        ''' This method plays every item in the queue, in order, and empties it '''
+        queue, self.queue = self.queue, []
+        # Voices armed while the board was locked start together, on the same sample if the mixer can manage it
+        with master.mixer.hold():
+            for item in queue:
+                # Anything still waiting to play in the same exclusive group is superseded by this
+                if item.exclusive != "__any__":
+                    self.CancelDefer(group=item.exclusive)
+                item.play()
+                # Track what channel the button is playing on
+                self.lastActiveChannel = item.channel
+        self.ShowStatus()
 
 
     # A method to clear the queue without playing any files
     def Cancel(self):
         self.CancelDefer()
-        # Run each queued file's clear method to reset appearance
+        # Run each queued file's clear method to reset appearance, and let go of any pre-armed voices
         for queuedfile in self.queue:
             queuedfile.clear()
+            queuedfile.disarm()
         self.lastActiveChannel = None
         # Set a null queue list
         self.queue = []
@@ -746,22 +959,58 @@ class ContentNotebook(wx.Notebook):
         wx.Notebook.__init__(self,parent,id,style=wx.BK_DEFAULT)
         # Create a list to contain the Panel objects for each page
         self.pages = []
-        # Use the layout_order list, which is the order-preserved list from synth_layout_2
-        for group in master.layout_raw:
-            # Generate a wx.Panel object using the dictionary value paired to the page name
-            page = ContentPage(self, -1, group[1])
-            # If the page number is 12 or less, give it a hotkey (maybe)
-            hotstring = ""
-            if len(self.pages) <= 11:
-                # Maximum of 11 pages get hotkeys unless there's no quickreference file, in which case 12
-                if len(self.pages) <= 10 or not master.config["quickreference"]:
-                    hotstring = "F"+str(len(self.pages)+1)+" - "
+        # Use the layout index, which preserves the order of pages from the layout file
+        for pageName in master.layout_index.pages:
+            # Generate a wx.Panel object using the frames on that page
+            page = ContentPage(self, -1, pageName, master.layout_index.framesForPage(pageName))
             # Add the panel object as a new "page" in the notebook
-            self.AddPage(page, hotstring+group[0])
+            self.AddPage(page, self.pageLabel(len(self.pages), pageName))
             self.pages.append(page)
-
-
-
+        # Tab clicks and arrow keys change pages with an event
+        self.Bind(wx.EVT_NOTEBOOK_PAGE_CHANGED, self.OnPageChanged)
+
+    def OnPageChanged(self, event):
+        master.frame.pageChanged()
+        event.Skip()
+
+    # The tab label of a page, with its hotkey if the page number is 12 or less (maybe)
+    def pageLabel(self, position, pageName):
+        hotstring = ""
+        if position <= 11:
+            # Maximum of 11 pages get hotkeys unless there's no quickreference file, in which case 12
+            if position <= 10 or not master.config["quickreference"]:
+                hotstring = "F"+str(position+1)+" - "
+        return hotstring+pageName
+
+    # Bring the notebook in line with a new layout index, only touching pages that changed
+    def patch(self, index):
+        # Remove the pages that no longer exist
+        for page in [page for page in self.pages if not page.name in index.frames]:
+            page.remove()
+            self.DeletePage(self.pages.index(page))
+            self.pages.remove(page)
+        existing = dict((page.name, page) for page in self.pages)
+
+        for position, pageName in enumerate(index.pages):
+            page = existing.get(pageName)
+            # A new page is created in place
+            if page is None:
+                page = ContentPage(self, -1, pageName, index.framesForPage(pageName))
+                self.InsertPage(position, page, self.pageLabel(position, pageName))
+                self.pages.insert(position, page)
+                continue
+            # An existing page is patched, and moved if the layout has re-ordered it
+            page.patch(index.framesForPage(pageName))
+            current = self.pages.index(page)
+            if current != position:
+                self.RemovePage(current)
+                self.pages.remove(page)
+                self.InsertPage(position, page, self.pageLabel(position, pageName))
+                self.pages.insert(position, page)
+
+        # Page numbers may have shifted, so refresh all of the hotkey labels
+        for position, page in enumerate(self.pages):
+            self.SetPageText(position, self.pageLabel(position, page.name))
 
     def __len__(self):
         return len(self.pages)
@@ -772,28 +1021,27 @@ class ContentNotebook(wx.Notebook):
 # --------------------------------------------------------
 class ContentPage(wx.Panel):
 
-    def __init__(self,parent,ID,page):
+    def __init__(self,parent,ID,name,frames):
         # Initialize a default panel object
         wx.Panel.__init__(self,parent,ID)
+        self.name = name
 
 
 
         # Create a list of each child column, which will contain a group of buttons
         self.groups = []
-        for column in page:
+        for frameName in frames:
             # Generate the child object that is a group of buttons
-            self.groups.append(ContentGroup(self,-1,column[0],column[1]))
+            self.groups.append(ContentGroup(self,-1,frameName,master.layout_index.buttonsForFrame(frameName)))
 
         # Create an external sizer that places vertically, for horizontal centering
         outerbox = wx.BoxSizer(wx.VERTICAL)
         # Create an internal sizer that places horizontally, for vertical centering
-        innerbox = wx.BoxSizer(wx.HORIZONTAL)
+        self.innerbox = wx.BoxSizer(wx.HORIZONTAL)
         # Mount each group of buttons in the internal sizer
-        for group in self.groups:
-            # No relative scaling, align top, this number controls the space between columns #SIZECONTROL
-            innerbox.Add(group, 0, wx.ALIGN_TOP|wx.ALL, 5)
+        self.mountGroups()
         # Mount the internal sizer in the external sizer
-        outerbox.Add(innerbox, 0, wx.ALIGN_CENTER)
+        outerbox.Add(self.innerbox, 0, wx.ALIGN_CENTER)
 
 
 
@@ -803,6 +1051,38 @@ class ContentPage(wx.Panel):
         self.SetSizer(outerbox)
         self.Layout()
 
+    # (Re-)mount each group of buttons in the internal sizer, in order
+    def mountGroups(self):
+        self.innerbox.Clear()
+        for group in self.groups:
+            # No relative scaling, align top, this number controls the space between columns #SIZECONTROL
+            self.innerbox.Add(group, 0, wx.ALIGN_TOP|wx.ALL, 5)
+
+    # Bring this page in line with a new list of frames, only touching the groups that changed
+    def patch(self, frames):
+        existing = dict((group.frameName, group) for group in self.groups)
+        groups = []
+        for frameName in frames:
+            column = master.layout_index.buttonsForFrame(frameName)
+            group = existing.pop(frameName, None)
+            if group is None:
+                group = ContentGroup(self,-1,frameName,column)
+            else:
+                group.patch(column)
+            groups.append(group)
+        # Anything left over has been removed from the layout
+        for group in existing.values():
+            group.remove()
+            group.Destroy()
+        self.groups = groups
+        self.mountGroups()
+        self.Layout()
+
+    # Remove this page's buttons before it is deleted
+    def remove(self):
+        for group in self.groups:
+            group.remove()
+
 
 # --------------------------------------------------------
 # This panel is a subsection of the main section, a column containing a group of buttons
@@ -811,11 +1091,13 @@ class ContentGroup(wx.Panel):
 
     def __init__(self, parent, ID,name,column):
         wx.Panel.__init__(self,parent,ID,size=(-1,-1))
+        # Remember the full frame name from the layout, for patching
+        self.frameName = name
 
         # Create a static box to contain the list of buttons
         static = wx.StaticBox(self)
         # Create a sizer for the static box, stacking buttons vertically
-        staticbox = wx.StaticBoxSizer(static, wx.VERTICAL)
+        self.staticbox = staticbox = wx.StaticBoxSizer(static, wx.VERTICAL)
         # Create a title text, because we have more control than using the static box built-in title
         # ...strip the page name from the name
         if "/$/$" in name:
@@ -827,17 +1109,9 @@ class ContentGroup(wx.Panel):
         self.buttons = []
         # Progagate the box contents
         for buttoncode in column:
-            # Create a button object for each designation in the layout
-            button = FX_Button(self, -1, **buttoncode)
-            # Create an event handler for the pushing of this button
-            self.Bind(wx.EVT_TOGGLEBUTTON, button.queue, button)
-            # Mount the button in the box sizer, this last number is the margin around buttons #SIZECONTROL
-            if sys.platform == "win32":
-                staticbox.Add(button, 0, wx.EXPAND|wx.ALL, 12)
-            else:
-                staticbox.Add(button, 0, wx.EXPAND|wx.ALL, 6)
-            # Track the button
-            self.buttons.append(button)
+            # Create a button object for each designation in the layout, and track it
+            self.buttons.append(self.createButton(buttoncode))
+        self.mountButtons()
 
         # Create an external box sizer to contain the static box
         enclosure = wx.BoxSizer(wx.VERTICAL)
@@ -845,18 +1119,105 @@ class ContentGroup(wx.Panel):
         enclosure.Add(staticbox, 0)
         self.SetSizer(enclosure)
 
+    # Create a button object for a designation in the layout
+    def createButton(self, buttoncode):
+        button = FX_Button(self, -1, **buttoncode)
+        # Remember the layout entry this button was built from
+        button.buttoncode = buttoncode
+        # Create an event handler for the pushing of this button
+        self.Bind(wx.EVT_TOGGLEBUTTON, button.queue, button)
+        # A button added by a reload loads its sounds now; the first build is loaded by changeMode
+        frame = getattr(master, "frame", None)
+        if frame is not None and frame.mode >= 0:
+            button.loadmode()
+        return button
+
+    # (Re-)mount the buttons in the box sizer, in order, underneath the title
+    def mountButtons(self):
+        for button in self.buttons:
+            self.staticbox.Detach(button)
+        for button in self.buttons:
+            # This last number is the margin around buttons #SIZECONTROL
+            if sys.platform == "win32":
+                self.staticbox.Add(button, 0, wx.EXPAND|wx.ALL, 12)
+            else:
+                self.staticbox.Add(button, 0, wx.EXPAND|wx.ALL, 6)
+
+    # Bring this group in line with a new list of buttoncodes, keeping every button that is unchanged
+    def patch(self, column):
+        # Buttons whose layout entries are identical are kept exactly as they are
+        unchanged = {}
+        for button in self.buttons:
+            unchanged.setdefault(synth_layout.buttonKey(button.buttoncode), []).append(button)
+        matched = [unchanged[synth_layout.buttonKey(code)].pop(0) if unchanged.get(synth_layout.buttonKey(code)) else None for code in column]
+        # Buttons that have only changed their settings are updated, keyed by name
+        leftover = {}
+        for buttons in unchanged.values():
+            for button in buttons:
+                leftover.setdefault(button.name, []).append(button)
+
+        self.buttons = []
+        for buttoncode, button in zip(column, matched):
+            if button is None:
+                if leftover.get(buttoncode['name']):
+                    button = leftover[buttoncode['name']].pop(0)
+                    button.configure(**buttoncode)
+                    button.buttoncode = buttoncode
+                    # Changed buttons need their sounds reloaded (new ones load themselves)
+                    if master.frame.mode >= 0:
+                        button.loadmode()
+                else:
+                    button = self.createButton(buttoncode)
+            self.buttons.append(button)
+
+        # Anything left over has been removed from the layout
+        for buttons in leftover.values():
+            for button in buttons:
+                button.remove()
+        self.mountButtons()
+        self.Layout()
+
+    # Remove all of this group's buttons
+    def remove(self):
+        for button in self.buttons:
+            button.remove()
+        self.buttons = []
+
 
 # --------------------------------------------------------
 # A custom class for the effects buttons themselves
 # --------------------------------------------------------
 class FX_Button(wx.ToggleButton):
 
-    def __init__(self, parent, ID, name,src,loop=False,loopFile=None,exclusive=False,tooltip=None):
+    def __init__(self, parent, ID, name,src,loop=False,loopFile=None,exclusive=False,tooltip=None,nocache=False,pin=False):
         wx.ToggleButton.__init__(self,parent,ID,name, size=(-1,30))
-        self.name = name
 
         # Store a value whether the sound is playing
         self.channel = False
+        # A reference to the vlc Media object
+        self.buffer = None
+        # Track whether this has been loaded into cache
+        self.loaded = False
+        # Track what our last source file was, for random
+        self._lastplaynum = None
+        # The sounds for the current mode, which loadmode() fills in
+        self.sounds = []
+        self.loopSound = None
+        # The path of the sound that was last queued
+        self.playfile = None
+        # Whether this button is still loading, and was pressed meanwhile
+        self.loadState = None
+        self._queueWhenLoaded = False
+        # Everything else comes from the layout
+        self.configure(name,src,loop,loopFile,exclusive,tooltip,nocache,pin)
+
+    # This method applies the button's settings from the layout, so they can change on reload
+    def configure(self, name,src,loop=False,loopFile=None,exclusive=False,tooltip=None,nocache=False,pin=False):
+        self.name = name
+        # NOCACHE sounds are dropped from the cache after use, PIN sounds are always kept in it
+        self.nocache = nocache
+        self.pin = pin
+        self.SetLabel(name)
         # A list of source files
         self.src = src
         if loop:
@@ -865,10 +1226,6 @@ class FX_Button(wx.ToggleButton):
         else:
             self.loop = 0
             self.loopFile = None
-        # A reference to the vlc Media object
-        self.buffer = None
-        # Track whether this has been loaded into cache
-        self.loaded = False
         # Track whether this button has exclusivity conditions
         if exclusive:
             self.exclusive = exclusive
@@ -879,12 +1236,28 @@ class FX_Button(wx.ToggleButton):
                 self.exclusive = "MUSIC"
             else:
                 self.exclusive = "__any__"
-        # Track what our last source file was, for random
-        self._lastplaynum = None
+        # A random source may no longer exist
+        if self._lastplaynum is not None and self._lastplaynum >= len(self.src):
+            self._lastplaynum = None
 
         # A friendly tooltip!
         if tooltip:
             self.SetToolTip(wx.ToolTip(tooltip))
+        else:
+            self.SetToolTip(None)
+
+    # This method takes the button off the board, without interrupting anything it is playing
+    def remove(self):
+        master.frame.loader.cancel(self)
+        queue = master.frame.master_queue
+        if self in queue.queue:
+            queue.queue.remove(self)
+            queue.ShowStatus()
+        if master.frame.master_buttons.get(self.name) is self:
+            del master.frame.master_buttons[self.name]
+        # Let go of a voice that was armed for it while the board was locked
+        self.disarm()
+        self.Destroy()
 
     # This method loads a sound file from the mode subdirectory
     def loadmode(self):
@@ -892,46 +1265,104 @@ class FX_Button(wx.ToggleButton):
         self.sounds = []
         # Loop through any sourcefiles provided from the layout file
         pathRoot = master.projectroot+master.frame.modes[master.frame.mode]
-        master.totalLoaded += 1
         for source in self.src:
             # Store the pathname of the sourcefile based on the current "mode"
             soundfile = pathRoot+"/"+source
             # Test mode doesn't load anything, for speediness
             if not master.testmode:
-                # Don't cache in the mixer if it's going to be buffered or on-demand
-                if self.buffer:
-                    sound = soundfile
-                else:
-                    sound = soundfile
-                    #sound = self.cache(soundfile)
+                # The sound cache decodes it, unless it is pinned to stay hot
+                sound = soundfile
+                if self.pin:
+                    master.mixer.cache.pin(soundfile)
             else:
                 sound = None
 
-            # Store the sound object in this parent object's list of sounds
+            # Store the pathname in this parent object's list of sounds
             self.sounds.append(sound)
         # Store a pointer back to this button, by way of dictionary, so it can be called by hotkeys
         master.frame.master_buttons[self.name] = self
         # Store the loop file if it exists
         if self.loopFile:
             loopFilePath = pathRoot+"/"+self.loopFile
-            if not os.path.isfile(loopFilePath):
+            if not master.media.playable(loopFilePath):
                 logger.warn("  ! Warning: sound loop file not found: " + self.loopFile)
                 self.loopFile = None
             else:
                 if not master.testmode:
-                    # If we are buffering, just note the full path
-                    if self.buffer:
-                        self.loopSound = pathRoot+"/"+self.loopFile
-                    # If we are not buffering, load the sound file into an object
-                    else:
-                        self.loopSound = self.cache(pathRoot+"/"+self.loopFile)
-
-
+                    # Note the full path, the sound itself lives in the cache
+                    self.loopSound = loopFilePath
+                    if self.pin:
+                        master.mixer.cache.pin(loopFilePath)
                 else:
                     self.loopSound = None
         else:
             self.loopSound = None
 
+        # Hand the decoding over to the background loader
+        self.loaded = False
+        self.setLoadState("loading")
+        master.frame.loader.submit(self, master.frame.loadPriority(self))
+
+    # This method decodes the button's sounds into the cache, and is called on a loader thread
+    def preload(self):
+        # Several loader threads count at once
+        with master.loadLock:
+            master.totalLoaded += 1
+            loaded = master.totalLoaded
+        # Show where we are so far
+        if displayLoadingProgress or master.testmode:
+            logger.debug("%d%%: %s" % (int(float(loaded * 100) / max(1,master.totalSounds)), ", ".join(self.src) ))
+        # Index the durations and formats of this mode's sounds from their headers, unless they already are
+        mode = master.frame.modes[master.frame.mode]
+        master.metadata.update([master.media.path(mode, source) for source in synth_layout.buttonFiles(self.buttoncode)])
+        if master.testmode:
+            return
+        cache = master.mixer.cache
+        for soundfile in self.sounds + ([self.loopSound] if self.loopSound else []):
+            # Pinned sounds are always loaded, on-demand sounds never are
+            if self.pin:
+                self.cache(soundfile)
+            elif self.nocache:
+                continue
+            # Don't load past the budget, or we'd only evict what we just loaded
+            elif cache.budget is None or cache.bytes < cache.budget:
+                self.cache(soundfile)
+
+    # This method decodes the button's sounds ahead of time for the page prefetcher, on its own thread
+    #   Returns how many bytes were added to the cache
+    def prefetch(self):
+        if master.testmode or self.nocache:
+            return 0
+        cache = master.mixer.cache
+        added = 0
+        for soundfile in self.sounds + ([self.loopSound] if self.loopSound else []):
+            if not soundfile in cache:
+                self.cache(soundfile)
+                added += cache.size(soundfile)
+        return added
+
+    # This method is called back on the GUI thread once the loader is done with this button
+    def loadFinished(self):
+        # The button may have been removed while it was loading
+        if not self:
+            return
+        self.loaded = True
+        self.setLoadState("ready")
+        master.frame.updateCacheDisplay()
+        master.frame.loadingDone()
+        # If it was pressed while loading, it can be queued now
+        if self._queueWhenLoaded:
+            self.queue()
+
+    # This method shows whether the button is still loading or ready to play
+    def setLoadState(self, state):
+        self.loadState = state
+        if state == "loading":
+            self.SetForegroundColour(loadingColour)
+        else:
+            self.SetForegroundColour(wx.NullColour)
+        self.Refresh()
+
     # This method caches a sound file into memory, for non-buffered tracks
     def cache(self,soundfile):
         if master.testmode:
@@ -942,7 +1373,7 @@ class FX_Button(wx.ToggleButton):
             logger.debug(soundfile.get_mrl())
             sound = master.mixer.cachefile(soundfile.get_mrl())
         # Create a pygame sound object to cache the sound in memory
-        elif not os.path.isfile(soundfile):
+        elif not master.media.playable(soundfile):
             logger.warn("  ! Warning: sound file not found: " + soundfile)
             sound = master.frame.master_queue.silence
         else:
@@ -950,21 +1381,49 @@ class FX_Button(wx.ToggleButton):
         return sound
 
 
+    # This method drops this button's sounds from the cache, unless they're playing
+    def uncache(self):
+        for soundfile in self.sounds + [self.loopSound]:
+            if soundfile and not master.mixer.cache.pinned(soundfile):
+                master.mixer.cache.discard(soundfile)
+
     # This method queues up a sound for playing (regardless of whether the queue is "locked")
     def queue(self,event=False):
 
-        if self.buffer:
-            # AVW: this was for VLC, but might not be needed?
-            #self.buffer.release()
-            self.buffer = None
+        # A cue that is still loading jumps to the front of the line, and queues itself once it's ready
+        if master.frame.loader.promote(self):
+            logger.debug("Button %s is still loading, promoting it" % self.name)
+            if not self._queueWhenLoaded and not self.nocache:
+                master.frame.prefetcher.record(False)
+            self._queueWhenLoaded = True
+            return
+        # A cue that had to wait for loading has already been counted as a miss
+        waited = self._queueWhenLoaded
+        self._queueWhenLoaded = False
 
-        # If this has exclusivity, check it
-        if self.exclusive != "__any__" and self.channel and self.channel.is_playing():
+        # If this has exclusivity, check it (a pooled channel may have gone on to play another button's sound)
+        if self.exclusive != "__any__" and self.channel and self.channel.owner is self and self.channel.media is self.buffer and self.channel.is_playing():
             logger.debug("  Exclusive media already playing, time to fade out")
             # Fade out this channel according to the rules
             self.channel.fadeout(master.fadetime[0] if master.crossfade[0] else 0)
             return
 
+        # A cue that's queued again is only taken off the queue, and has no need of a voice
+        if self in master.frame.master_queue.queue:
+            master.frame.master_queue.Queue(self)
+            master.frame.updateCacheDisplay()
+            return
+
+        # A button that has never been loaded has nothing to play
+        if not self.sounds:
+            logger.warn("  ! Warning: button %s has no sounds loaded" % self.name)
+            return
+
+        if self.buffer:
+            # AVW: this was for VLC, but might not be needed?
+            #self.buffer.release()
+            self.buffer = None
+
         # Look for multiple versions to randomize
         if len(self.sounds) > 1:
             playnum = random.randint(0,len(self.sounds)-1)
@@ -977,10 +1436,15 @@ class FX_Button(wx.ToggleButton):
         # Remember what we played
         self._lastplaynum = playnum
 
+        # Keep score of whether the prefetcher had the sound ready (on-demand sounds never are)
+        if not waited and not self.nocache:
+            master.frame.prefetcher.record(self.sounds[playnum] in master.mixer.cache)
+
         logger.debug("Queueing button %s." % self.name) # Store a buffer with the Media object
         # Instead of passing the media object, why not pass the mri?
         # self.buffer = self.sounds[playnum]
         self.buffer = self.cache(self.sounds[playnum])
+        self.playfile = self.sounds[playnum]
 
         # try:
         #     if getattr(self,"loopSound"):
@@ -993,16 +1457,26 @@ class FX_Button(wx.ToggleButton):
         # Store what file we have
         if master.mixer.mode=="vlc":
             self.path = self.name + ": "+master.projectroot+master.frame.modes[master.frame.mode]+"/"+self.buffer.get_mrl()
-        elif master.mixer.mode=="pygame":
+        elif master.mixer.mode in ("pygame","numpy"):
             self.path =  self.name + ": "+master.projectroot+master.frame.modes[master.frame.mode]+"/"+self.src[playnum]
 
-        # Get a channel
-        self.channel = master.mixer.find_channel(group=self.exclusive)
+        # Get a channel, if one is free; a full pool has a voice stolen when the cue plays, not while it waits
+        self.channel = master.mixer.find_channel(group=self.exclusive,owner=self,steal=False)
         # Queue this track into the channel
-        self.channel.queue(self.buffer)
+        if self.channel:
+            self.channel.queue(self.buffer)
 
         # The MasterQueue object handles redundancy and playback for streaming
         master.frame.master_queue.Queue(self)
+        # While the board is locked, pre-roll the cue so unlocking only has to set its voice running
+        if self.channel and master.frame.locked and self in master.frame.master_queue.queue and not master.testmode:
+            self.channel.arm(loops=self.loop if not self.loopSound else 0, fade_ms=master.fadetime[1] if master.crossfade[1] else 0)
+        master.frame.updateCacheDisplay()
+
+    # Let go of a voice that was armed for this cue, if it still has it
+    def disarm(self):
+        if self.channel and self.channel.owner is self and self.channel.armed is not None:
+            self.channel.disarm()
 
 
     # This method actually plays the track! It's called by Queue.Play() when a button is first in the queue
@@ -1063,6 +1537,11 @@ class FX_Button(wx.ToggleButton):
                 # We can fade in, or not
                 fadein = master.fadetime[1] if master.crossfade[1] else 0
 
+                # If we didn't get a voice when we were queued, or it was stolen since, find another
+                if not self.channel or self.channel.owner is not self:
+                    self.channel = master.mixer.find_channel(group=self.exclusive,owner=self)
+                    self.channel.queue(self.buffer)
+
                 # # Are we specifying a channel to playback to?
                 # if queueChannel:
                 #     logger.debug("Sending playback to existing channel ",)
@@ -1082,32 +1561,23 @@ class FX_Button(wx.ToggleButton):
 
                 # Are we looping? Do we have an intro?
                 looper = self.loop if not self.loopSound else 0
-                # If we are waiting for another track to fade out, defer playback
+                # A separate loop follows its intro on the same channel, starting at the intro's last sample
+                loopThen = (self.cache(self.loopSound), self.loop) if self.loopSound else None
+                # If we are waiting for another track to fade out, defer playback (and the loop with it)
                 if not master.crossfade[0]:
                     # Defer playback by the duration of the fadeout
-                    master.frame.master_queue.DeferSound(self.channel, self.sounds[self._lastplaynum], True,  looper, master.fadetime[0])
+                    master.frame.master_queue.DeferSound(self.channel, self.buffer, True,  looper, master.fadetime[0], then=loopThen)
                 # Otherwise, play it immediately
                 else:
                     logger.info("Playing immediately, looping %s " % looper)
                     # The master mixer will control fading out other channels
                     master.mixer.play(self,loops=looper, fade_ms=fadein)
-
-                # If we have a separate loop intro
-                if self.loopSound:
-                    # Are we already deferring?
-                    deferral = DEFAULT_DEFER + (master.fadetime[0] if not master.crossfade[0] else 0)
-                    # then queue up the loop as a deferral
-                    logger.debug("Deferring loop track after intro by %d" % deferral)
-                    master.frame.master_queue.DeferSound(self.channel, self.loopSound,  False, self.loop, deferral)
-                    '''
-                        KNOWN ISSUE:
-                            Since there is only one Defer Channel, it does not work to defer a looped intro track.
-                            The loop deferral will overwrite the intro deferral, and can "pop" in unexpectedly.
-                            This could be solved by allowing multiple deferral channels, or including a loop intro
-                            checker in the deferral playback method. Another time, maybe.
-                    '''
+                    if loopThen:
+                        logger.debug("Queueing loop track after intro")
+                        self.channel.queueLoop(*loopThen)
 
 		# Start the timer!
+        master.frame.nowPlaying = self
         if not self.loop:
             try:
                 master.frame.timeremaining = self.get_time_remaining()
@@ -1145,12 +1615,26 @@ class FX_Button(wx.ToggleButton):
         if not self.buffer:
             return 0
 
+        # The duration is in seconds, and the channel's position is in ms
+        duration = self.duration()
+        logger.debug("duration: %g, time: %d" % (duration, self.channel.get_time()))
+        return duration - self.channel.get_time() / 1000.0
+
+    # How long the last queued sound (or else the first one) lasts, in seconds
+    def duration(self):
+        soundfile = self.playfile or (self.sounds[0] if self.sounds else None)
+        # The metadata index reads it from the file's headers, so nothing has to be decoded
+        duration = master.metadata.duration(soundfile) if soundfile else None
+        if duration is not None:
+            return duration
+        # The headers didn't tell us, so ask the sound itself
+        if not self.buffer:
+            return 0
         if master.mixer.mode == "vlc":
-            logger.debug("duration:", self.buffer.get_duration())
-            logger.debug("time:", self.channel.get_time())
-            # Duration is in ms
-            return (self.buffer.get_duration() / 1000) - self.channel.get_time()
-        elif master.mixer.mode == "pygame":
+            # The duration is only known once the media has been parsed, and it's in ms
+            master.mixer.parser.wait(self.buffer, 0.5)
+            return max(0, self.buffer.get_duration()) / 1000.0
+        elif master.mixer.mode in ("pygame","numpy"):
             return self.buffer.get_length()
 
 
@@ -1236,35 +1720,247 @@ def VolumeWarning(parent, volumes):
 # -------------------------------------------------------
 class Mixer(object):
 
-    def __init__(self,mode='pygame'):
+    def __init__(self,mode='pygame',cacheBudget=None,pcmRoot=None,voices=None,voiceSteal=None,fadeCurve=synth_fade.defaultCurve,
+                 sampleRate=None,blockSize=None,channels=None,offline=False,busGains=None,limiter=synth_mixer.LIMITER_THRESHOLD,
+                 hasher=synth_cache.fileDigest):
 
         logger.debug("Creating %s mixer!" % mode)
 
         self.mode = mode
+        # An offline mixer is never played: whoever renders it calls engine.render() for each block
+        self.offline = offline
+        # Every voice reports when it starts, ends, loops and finishes fading
+        self.events = synth_events.EventBus()
+        # The software mixer ramps its own fades, sample by sample; one fade engine ramps everybody else's
+        self.fadeCurve = fadeCurve
+        self.fades = synth_fade.FadeEngine(fadeCurve) if mode != 'numpy' else None
+        # How many voices each exclusive group may have, and which to steal when they're all busy
+        self.voices = voices or {"__default__": synth_layout.defaultVoices}
+        self.voiceSteal = voiceSteal or {"__default__": synth_layout.defaultVoiceSteal}
+        # The next pygame channel to give to a voice; the pool's channels are reserved, so
+        #   sounds played directly (like the crash noise) only ever get the spare ones
+        self._nextChannel = 0
+        # Every decoded sound goes through the cache, which keeps memory use within the budget
+        self.cache = synth_cache.SoundCache(self.decode, self.sizeof, cacheBudget, self.is_playing_sound, hasher)
+        # The output format the project asked for, with this machine's tuned buffer if it asked for "auto"
+        self.output = synth_audio.outputSettings(sampleRate, blockSize, channels)
 
         # VLC
         if self.mode == 'vlc':
             # Until we extract ALL pygame references, we still need this
-            pygame.mixer.init()
+            pygame.mixer.init(**self.output)
+            # Media is parsed asynchronously when it's loaded, so queueing never waits on it
+            self.parser = synth_vlc.MediaParser()
+            # One VLC instance for the whole board, with players made ahead of time for the channels
+            self.players = synth_vlc.PlayerPool(vlc.Instance(), self.pool_size("__any__"))
 
         # Default (pygame)
         elif self.mode == 'pygame':
-            pygame.mixer.init()
+            pygame.mixer.init(**self.output)
+            # pygame's event queue, which our channels send their end events to, needs the video system (but no window);
+            #   SDL's dummy video driver gives it one without touching the display, which wx owns (and a headless
+            #   machine doesn't have)
+            if not pygame.display.get_init():
+                os.environ["SDL_VIDEODRIVER"] = "dummy"
+                pygame.display.init()
+
+        # NumPy mixes every voice itself, into a single pygame channel
+        elif self.mode == 'numpy':
+            pygame.mixer.init(**self.output)
+            # The engine mixes a block for every buffer the output plays
+            self.engine = synth_mixer.NumpyEngine(*pygame.mixer.get_init(), blocksize=self.output.get("buffer", synth_mixer.DEFAULT_BLOCKSIZE))
+            # The master bus is limited rather than clipped, unless the project says otherwise
+            self.engine.limiter = synth_mixer.Limiter(self.engine.rate, self.engine.channels, limiter) if limiter is not None else None
+            self.engine.listener = self._voiceEvent
+            if not offline:
+                self.engine.start()
 
         else:
             logging.error("Unknown mixer mode {}".format(mode))
 
-        # Create an array of general SFX channels
-        self.channels = {"__any__": [ Channel(group="__any__")]}
+        # Decoded PCM on disk, in the mixer's own format (VLC decodes as it plays, so it has none)
+        if pcmRoot is not None and self.mode in ('pygame','numpy'):
+            self.pcm = synth_pcm.PCMCache(pcmRoot, pygame.mixer.get_init())
+        else:
+            self.pcm = None
+
+        # The voice pool for each exclusive group, starting with the general SFX channels
+        self.channels = {"__any__": []}
+        # The VLC channels pause() paused, to carry on with
+        self._paused = []
+        # Each group's mix bus and the master bus; the software mixer sums its own, and the others
+        #   multiply their gains into each channel's volume
+        self.buses = {}
+        self.masterBus = synth_mixer.Bus(synth_mixer.MASTER_BUS)
+        for group, decibels in (busGains or {}).items():
+            self.set_bus_gain(group, decibels)
 
     def cachefile(self,path):
+        return self.cache.get(path)
+
+    # Decode a file into a sound object, which is only called by the cache
+    def decode(self,path):
         if self.mode == 'vlc':
-            # We want to parse the media so we have metadata, like duration
-            media = vlc.Media(path)
-            media.parse()
-            return media
+            # We want to parse the media so we have metadata, like duration, but without waiting for it
+            return self.parser.parse(self.players.media(path))
         elif self.mode == 'pygame':
-            return pygame.mixer.Sound(path)
+            return self.decodePygame(path)
+        elif self.mode == 'numpy':
+            # pygame does the decoding, and the samples are kept as float32 for mixing
+            return synth_mixer.NumpySound.fromPygame(self.decodePygame(path))
+
+    # Decode a file with pygame, in the mixer's own format
+    def decodePygame(self,path):
+        # Map the PCM we decoded on a previous launch, if the file hasn't changed since
+        if self.pcm:
+            raw = self.pcm.load(path)
+            if raw is not None:
+                return pygame.mixer.Sound(buffer=raw)
+        sound = pygame.mixer.Sound(path)
+        # Save the decoded PCM for next time (get_raw needs pygame 1.9.2)
+        if self.pcm and hasattr(sound, "get_raw"):
+            self.pcm.store(path, sound.get_raw())
+        return sound
+
+    # How much memory a decoded sound takes up, in bytes
+    def sizeof(self,path,sound):
+        if self.mode == 'pygame':
+            frequency, size, channels = pygame.mixer.get_init()
+            return int(sound.get_length() * frequency * channels * abs(size) / 8)
+        elif self.mode == 'numpy':
+            return sound.nbytes
+        # VLC decodes as it goes, so only the file itself is held
+        try:
+            return os.path.getsize(path)
+        except(OSError):
+            return 0
+
+    # Whether a sound is playing in any channel, so the cache won't evict it
+    def is_playing_sound(self,sound):
+        for group in self.channels.values():
+            for channel in group:
+                if channel.media is sound and channel.is_playing():
+                    return True
+        return False
+
+    # The audio clock, in seconds: the software mixer counts the frames it has mixed, the others go by the wall clock
+    def clock(self):
+        if self.mode == 'numpy':
+            return float(self.engine.frame) / self.engine.rate
+        return time.time()
+
+    # How far ahead deferred actions should be fired, in seconds
+    #   The software mixer is told the exact moment, and lands the action on its exact frame
+    def lead(self):
+        if self.mode == 'numpy':
+            return 2.0 * self.engine.blocksize / self.engine.rate
+        return 0.0
+
+    # The software mixer's frame for a moment on the audio clock (or None for "now")
+    def frameAt(self, when):
+        if when is None or self.mode != 'numpy':
+            return None
+        return int(round(when * self.engine.rate))
+
+    # Hold the software mixer between blocks, so everything started meanwhile starts on the same sample
+    @contextlib.contextmanager
+    def hold(self):
+        if self.mode == 'numpy':
+            with self.engine.lock:
+                yield
+        else:
+            yield
+
+    # How long a sound takes to get through the output, in ms (or None, for VLC's own output)
+    def latency(self):
+        if self.mode == 'vlc':
+            return None
+        buffer = self.output.get("buffer", synth_audio.DEFAULT_BUFFER)
+        rate = pygame.mixer.get_init()[0]
+        if self.mode == 'numpy':
+            # The limiter holds the output back by its look-ahead
+            lookahead = 1000.0 * self.engine.limiter.lookahead / rate if self.engine.limiter else 0.0
+            return synth_audio.outputLatency(rate, buffer, self.engine.blocksize) + lookahead
+        return synth_audio.outputLatency(rate, buffer)
+
+    # The name of a group's bus: the general effects' bus can be called SFX, and the master bus MASTER
+    def bus_name(self,group):
+        if group == "SFX":
+            return "__any__"
+        elif group == "MASTER":
+            return synth_mixer.MASTER_BUS
+        return group
+
+    def bus(self,group):
+        name = self.bus_name(group)
+        if self.mode == 'numpy':
+            return self.engine.bus(name)
+        elif name == synth_mixer.MASTER_BUS:
+            return self.masterBus
+        return self.buses.setdefault(name, synth_mixer.Bus(name))
+
+    # Ramp a bus to a gain in dB over a time in ms
+    def set_bus_gain(self,group,decibels,time=0):
+        bus = self.bus(group)
+        gain = 10 ** (decibels / 20.0)
+        if self.mode == 'numpy':
+            with self.engine.lock:
+                bus.rampTo(gain, self.engine.frames(time))
+        else:
+            # Without a bus to sum on there's no headroom, so a bus can only turn its channels down
+            bus.target = min(1.0, gain)
+            self.fades.fade(("bus", bus.name), lambda value: self._setBusGain(bus, value), bus.gain, bus.target, time, curve="linear")
+
+    # The gain in dB a bus is at, or on its way to
+    def bus_gain_db(self,group):
+        return 20 * math.log10(max(self.bus(group).target, 1e-5))
+
+    def set_bus_mute(self,group,mute):
+        with self.hold():
+            self.bus(group).mute = mute
+        self._applyBuses()
+
+    def set_bus_solo(self,group,solo):
+        with self.hold():
+            self.bus(group).solo = solo
+        self._applyBuses()
+
+    # What a channel's gain is multiplied by for its bus and the master bus, where the buses aren't summed
+    def bus_gain(self,group):
+        bus = self.bus(group)
+        soloed = any(other.solo for other in self.buses.values())
+        if bus.mute or (soloed and not bus.solo) or self.masterBus.mute:
+            return 0.0
+        return bus.gain * self.masterBus.gain
+
+    def _setBusGain(self,bus,gain):
+        bus.gain = gain
+        self._applyBuses()
+
+    # Set every channel's volume again, for the buses' new gains
+    def _applyBuses(self):
+        if self.mode == 'numpy':
+            return
+        for group in self.channels.values():
+            for channel in group:
+                channel._setGain(channel.gain)
+
+    # Whether anything is playing
+    def get_busy(self):
+        if self.mode == 'numpy':
+            return self.engine.busy()
+        return pygame.mixer.get_busy()
+
+    # Shut down the output stream, if we have our own
+    def close(self):
+        if self.fades:
+            self.fades.stop()
+        if self.mode == 'numpy':
+            self.engine.close()
+        elif self.mode == 'vlc':
+            for group in self.channels.values():
+                for channel in group:
+                    self.players.release(channel._channel)
 
     # Play a sound
     def play(self,sound,loops=None,fade_ms=0):
@@ -1272,7 +1968,7 @@ class Mixer(object):
         if sound.exclusive != "__any__" and sound.exclusive in self.channels:
             # Fade out any existing channels in this group
             for channel in self.channels[sound.exclusive]:
-                if channel != sound.channel and channel.media and not channel.is_fading_out:
+                if channel != sound.channel and channel.media and not channel.is_fading_out and not channel.is_idle():
                     channel.fadeout(master.fadetime[0] if master.crossfade[0] else 0)
                     logger.debug("  Fading out %s in %s" % (channel.media,fade_ms))
         # Look for a channel that's available in this group
@@ -1281,43 +1977,116 @@ class Mixer(object):
         # Load the sound into the channel
         sound.channel.play(loops=loops,fade_ms=fade_ms)
 
-    def find_channel(self,group=None):
+    # How many voices a group may have, and which voice it steals when they're all busy
+    def pool_size(self,group):
+        return self.voices.get(group, self.voices["__default__"])
+
+    def steal_policy(self,group):
+        return self.voiceSteal.get(group, self.voiceSteal["__default__"])
+
+    # Whether a channel can be given to a new cue: it's silent, and no queued cue or deferred action is waiting on it
+    def is_free(self,channel):
+        if not channel.is_idle():
+            return False
+        queue = getattr(getattr(master, "frame", None), "master_queue", None)
+        return queue is None or not queue.holds(channel)
+
+    # Find a channel in a group's voice pool for a cue: a free one, a new one if the pool isn't full, or a stolen one
+    #   (or None, when the pool is full and nothing is to be stolen)
+    def find_channel(self,group=None,owner=None,steal=True):
         logger.debug("  Looking for a channel for %s" % group)
 
         # Have we never encountered this group before?
         if not group in self.channels.keys():
-            logger.debug("    New channel required for group {}".format(group))
+            logger.debug("    New voice pool for group {}".format(group))
             self.channels[group] = []
-        # If we have, look for an empty channel in it
-        # AVW: Reusing channels doesn't seem to work. Always a new one?
-        else:
-        #    self.channels[group] = []
-        #     for idx,channel in enumerate(self.channels[group]):
-        #         if not channel.is_playing():
-        #             logger.debug("   - Found empty channel %d for group '%s'" % (idx,group))
-        #             return channel
-            logger.info("    No channel exists, make a new one")
-        channel = Channel(group=group)
-        # Add this channel to the group
-        self.channels[group].append(channel)
+        pool = self.channels[group]
+        channel = None
+        for candidate in pool:
+            if self.is_free(candidate):
+                logger.debug("   - Found free channel %d for group '%s'" % (pool.index(candidate),group))
+                channel = candidate
+                break
+        if channel is None:
+            if len(pool) < self.pool_size(group):
+                channel = self.new_channel(group)
+                pool.append(channel)
+            elif steal:
+                channel = self.steal_channel(group)
+            else:
+                logger.debug("    Voice pool for %s is full, waiting to steal a voice" % group)
+                return None
+        channel.owner = owner
         return channel
 
+    # A new voice, with a pygame channel of its own
+    def new_channel(self,group):
+        index = None
+        if self.mode == 'pygame':
+            index = self._nextChannel
+            self._nextChannel += 1
+            if pygame.mixer.get_num_channels() < self._nextChannel + SPARE_CHANNELS:
+                pygame.mixer.set_num_channels(self._nextChannel + SPARE_CHANNELS)
+            pygame.mixer.set_reserved(self._nextChannel)
+        logger.debug("    New channel %s for group %s" % (len(self.channels[group]), group))
+        return Channel(group=group,index=index)
+
+    # Take a voice from a full pool: the one that started first, or the quietest
+    #   Voices held by a queued cue or a deferred action are only taken if every voice is held
+    def steal_channel(self,group):
+        pool = self.channels[group]
+        queue = getattr(getattr(master, "frame", None), "master_queue", None)
+        candidates = [channel for channel in pool if queue is None or not queue.holds(channel)]
+        if not candidates:
+            logger.warn("  ! Every voice in group %s is waiting to play, stealing one anyway" % group)
+            candidates = pool
+        if self.steal_policy(group) == "quietest":
+            victim = min(candidates, key=lambda channel: (channel.level(), channel.started))
+        else:
+            victim = min(candidates, key=lambda channel: channel.started)
+        logger.info("    Voice pool for %s is full, stealing a voice playing %s" % (group, victim.media))
+        if queue is not None:
+            queue.CancelDefer(channel=victim)
+        victim.stop()
+        return victim
+
     def fadeout(self,time,group=None):
         logger.debug("  Fading out in {}".format(master.fadetime[1]))
-        if self.mode == 'vlc':
-            # Are we just fading a specific group?
-            if group:
-                groups  = [ self.channels[group] ]
-            # Or all of them
-            else:
-                groups = self.channels.values()
-            for group in groups:
-                for channel in group:
-                    if channel.is_playing():
-                        channel.fadeout(time)
-        elif self.mode == 'pygame':
-            # Make this easy :)
-            pygame.mixer.fadeout(time)
+        # Are we just fading a specific group?
+        if group:
+            groups  = [ self.channels[group] ]
+        # Or all of them
+        else:
+            groups = self.channels.values()
+        for group in groups:
+            for channel in group:
+                if channel.is_playing():
+                    channel.fadeout(time)
+
+    # Collect the end events from pygame's channels, and see which have finished (or gone on to a queued sound)
+    def pump(self):
+        if not pygame.event.get(CHANNEL_END):
+            return
+        for group in self.channels.values():
+            for channel in group:
+                channel.checkEnded()
+
+    # An event from a software mixer voice, passed on from its channel
+    def _voiceEvent(self,kind,voice):
+        # A voice that's been started again since it ended is busy with a new sound
+        if kind == synth_events.ENDED and voice.get_busy():
+            return
+        for group in self.channels.values():
+            for channel in group:
+                if channel._channel is voice:
+                    channel.notify(kind)
+                    return
+
+    # Give the fades under way new times in ms, carrying on from wherever they've got to
+    def retarget_fades(self,fadeout,fadein):
+        fades = self.engine if self.mode == 'numpy' else self.fades
+        fades.retarget(fadeout, rising=False)
+        fades.retarget(fadein, rising=True)
 
     def stop(self):
         if self.mode == 'vlc':
@@ -1329,32 +2098,74 @@ class Mixer(object):
                         channel._channel.set_media(None)
         elif self.mode == 'pygame':
             pygame.mixer.stop()
+        elif self.mode == 'numpy':
+            self.engine.stopAll()
+
+    # Pause everything that's playing, and carry on with it again (armed voices are left waiting as they were)
+    def pause(self):
+        if self.mode == 'vlc':
+            self._paused = [channel for group in self.channels.values() for channel in group if channel.is_playing()]
+            for channel in self._paused:
+                channel._channel.set_pause(True)
+        elif self.mode == 'pygame':
+            pygame.mixer.pause()
+        elif self.mode == 'numpy':
+            self.engine.pauseAll()
 
+    def unpause(self):
+        if self.mode == 'vlc':
+            for channel in self._paused:
+                channel._channel.set_pause(False)
+            self._paused = []
+        elif self.mode == 'pygame':
+            pygame.mixer.unpause()
+        elif self.mode == 'numpy':
+            self.engine.resumeAll()
+
+    # Give a stopped channel back to its pool, so the next cue in its group can have it
     def delete_channel(self,channel):
-        deleted = False
-        for channels in self.channels.values():
-            if channel in channels:
-                logger.debug("  Deleting channel {}".format(channel))
-                deleted = True
-                #channel._channel.release()
-                #del( channels[channels.index(channel)])
-                #return
-        if not deleted:
+        if not channel in self.channels.get(channel.group, ()):
             logger.warn("  ! Unable to delete channel!")
+            return
+        logger.debug("  Returning channel {} to the {} pool".format(channel, channel.group))
+        channel.owner = None
 
 
 class Channel(object):
 
-    def __init__(self,mode=None,group=None):
+    def __init__(self,mode=None,group=None,index=None):
         self.mode = mode or master.config['playback']
+        # Which exclusive group this channel belongs to
+        self.group = group
         # What media is in this channel
         self.media = None
+        # What follows a loop intro, for channels that can't loop a queued sound themselves, and
+        #   how many more passes of it pygame has to queue (or -1, forever)
+        self.loopNext = None
+        self.loopsLeft = 0
+        self.is_fading_out = False
+        # The button this channel was last given to, and when it last started playing (for voice stealing)
+        self.owner = None
+        self.started = 0
+        # Whether we've told the event bus that this channel has started, and not yet that it's ended
+        self._busy = False
+        # The (loops, fade_ms) a pre-armed voice is ready to play with, or None
+        self.armed = None
+        # The gain the fade engine last set, before the buses' gains are multiplied in
+        self.gain = 1.0
 
         if self.mode == 'vlc':
-            self._channel = vlc.MediaPlayer( vlc.Instance() )
-            logger.debug("Created channel {}".format(self._channel.get_instance()))
+            # Every channel shares the mixer's VLC instance, and keeps a player from its pool
+            self._channel = master.mixer.players.acquire(self._ended, self._vlcEvent)
+            logger.debug("Created channel {}".format(self._channel))
+        # Each voice in the pool has a pygame channel of its own, which tells us when it finishes
         elif self.mode == 'pygame':
-            self._channel = pygame.mixer.find_channel()
+            self._channel = pygame.mixer.Channel(index) if index is not None else pygame.mixer.find_channel()
+            self._channel.set_endevent(CHANNEL_END)
+        # A NumPy voice has the same methods as a pygame channel
+        elif self.mode == 'numpy':
+            self._channel = master.mixer.engine.voice()
+            self._channel.bus = master.mixer.bus_name(group or "__any__")
         else:
             logger.warn("Unable to assign mode {} to channel".format(mode))
 
@@ -1362,54 +2173,136 @@ class Channel(object):
     def is_playing(self):
         if self.mode == 'vlc':
             return self._channel.is_playing()
-        elif self.mode == 'pygame':
+        elif self.mode in ('pygame','numpy'):
             return self._channel.get_busy()
 
+    # Tell the event bus what this channel is doing, once for each start and end
+    def notify(self,kind):
+        if kind == synth_events.STARTED:
+            if self._busy:
+                return
+            self._busy = True
+        elif kind == synth_events.ENDED:
+            if not self._busy:
+                return
+            self._busy = False
+        master.mixer.events.emit(kind, self)
+
+    # Called by the player pool when VLC starts or stops; a stop that arrives after the player was started again is stale
+    def _vlcEvent(self,kind):
+        if kind == synth_events.ENDED and not self.is_idle():
+            return
+        # An armed player has opened and buffered its media, so hold it at the start until it's fired
+        if kind == synth_events.STARTED and self.armed is not None:
+            self._channel.set_pause(True)
+            self._channel.set_time(0)
+            return
+        self.notify(kind)
+
+    # Called when pygame says this channel has finished a sound: it has either ended, or gone on to the one queued behind it
+    def checkEnded(self):
+        if not self._busy:
+            return
+        if self.is_idle():
+            self.loopNext = None
+            self.notify(synth_events.ENDED)
+        else:
+            self._keepLooping()
+            self.notify(synth_events.LOOPED)
+
+    # Whether the channel has nothing to do (VLC isn't "playing" while it opens or buffers, but isn't idle either)
+    def is_idle(self):
+        if self.mode == 'vlc':
+            return self._channel.get_state() in (vlc.State.NothingSpecial, vlc.State.Stopped, vlc.State.Ended, vlc.State.Error)
+        elif self.mode in ('pygame','numpy'):
+            return not self._channel.get_busy()
+
+    # How loud the channel is right now, from 0 to 1; a channel that's fading out counts as silent
+    def level(self):
+        if self.is_fading_out:
+            return 0.0
+        if self.mode in ('vlc','pygame'):
+            return self.gain
+        elif self.mode == 'numpy':
+            return self._channel.gain * self._channel.get_volume()
+
     def set_volume(self,vol=100):
         if self.mode == 'vlc':
             self._channel.audio_set_volume(vol)
 
-    # A callable function with no args, for Timer
-    def _fadeout(self):
-        vol = self._channel.audio_get_volume()
-        if vol > 0:
-            self._channel.audio_set_volume(vol - 1)
-            t = threading.Timer(self.fadetime/1000.0/100.0, self._fadeout)
-            t.start()
-        else:
+    # Set the channel's gain, from 0 to 1, for the fade engine (its bus turns it down from there)
+    def _setGain(self,gain):
+        self.gain = gain
+        gain *= master.mixer.bus_gain(self.group)
+        if self.mode == 'vlc':
+            self._channel.audio_set_volume(int(round(gain * 100)))
+        elif self.mode == 'pygame':
+            self._channel.set_volume(gain)
+
+    # Called by the fade engine once a fade-out reaches silence, or a fade-in reaches full volume
+    def _fadedOut(self):
+        self.notify(synth_events.FADED)
+        if self.mode == 'vlc':
             self._channel.set_pause(True)
-            self._channel.audio_set_volume(100)
-            self.stop()
+        self.stop()
+        self._setGain(1.0)
+
+    def _fadedIn(self):
+        self.notify(synth_events.FADED)
 
 
-    def fadeout(self,time):
+    # A fade (or stop, or play) with a time given is for that moment on the audio clock, which
+    #   only the software mixer can schedule ahead; the others are only called when it's time
+    def fadeout(self,time,at=None):
         # AVW: Is it fading out that breaks channels?
         # self._channel.stop()
         self.fadetime = time
+        # Fade from wherever the channel is now (which may be part way through fading in)
+        start = self.level()
         self.is_fading_out = True
-        if self.mode == 'vlc':
-            # Get the volume
-            vol = self._channel.audio_get_volume()
-            # How many steps
-            steps = 100.0
-            shift = vol / steps
-            # Call the timer, which lives in seconds instead of ms
-            t = threading.Timer(self.fadetime/1000.0/100.0, self._fadeout)
-            t.start()
-
-        elif self.mode == 'pygame':
-            self._channel.fadeout(time)
-
-    def stop(self):
+        if self.mode in ('vlc','pygame'):
+            master.mixer.fades.fadeOut(self, self._setGain, start, time, done=self._fadedOut)
+        elif self.mode == 'numpy':
+            self._channel.fadeout(time, at=master.mixer.frameAt(at), curve=master.mixer.fadeCurve)
+
+    def stop(self,at=None):
+        if at is not None and self.mode == 'numpy':
+            self._channel.stop(at=master.mixer.frameAt(at))
+            return
+        self.loopNext = None
+        if master.mixer.fades:
+            master.mixer.fades.cancel(self)
         self._channel.stop()
         self.is_fading_out = False
+        self.notify(synth_events.ENDED)
         logger.debug("Channel that used to have %s STOPPED" % self.media)
         master.mixer.delete_channel(self)
 
     def pause(self):
         self._channel.pause()
 
+    # Get a queued sound ready to start the instant it's played: the software mixer attaches it to a paused
+    #   voice, VLC opens and buffers it (silently) and then pauses, and pygame (which starts a sound by
+    #   pointing at its samples) sets the volume the fade starts from
+    def arm(self,loops=None,fade_ms=0):
+        self.armed = (loops, fade_ms)
+        if self.mode == 'numpy':
+            self._channel.play(self.media, loops=loops, fade_ms=fade_ms, curve=master.mixer.fadeCurve, paused=True)
+        elif self.mode == 'vlc':
+            self._setGain(0.0)
+            self._channel.play()
+        elif self.mode == 'pygame':
+            self._setGain(0.0 if fade_ms else 1.0)
+
+    def disarm(self):
+        self.armed = None
+        self.stop()
+        self._setGain(1.0)
+
     def queue(self,soundobj):
+        # A voice that's armed with this sound already has it
+        if self.armed is not None and soundobj is self.media:
+            return
         self.media = soundobj
         # For VLC, we need to set the media now to cache it
         if self.mode == "vlc":
@@ -1417,26 +2310,86 @@ class Channel(object):
         # For pygame, we'll set it later (since we're already cached)
         self.is_fading_out = False
 
-    def play(self,loops=None,fade_ms=0):
+    # Follow what's playing with another sound (like the loop after a loop intro), at its last sample
+    def queueLoop(self,soundobj,loops=0):
+        # The software mixer switches over on the exact sample, and loops it itself
+        if self.mode == 'numpy':
+            self._channel.queue(soundobj, loops=loops)
+        # SDL_mixer starts a queued sound as soon as the current one ends, but only plays it once
+        elif self.mode == 'pygame':
+            self._channel.queue(soundobj)
+            if loops:
+                self.loopNext = soundobj
+                self.loopsLeft = loops
+        # VLC can't queue, so switch over when the intro ends, and let VLC repeat the loop itself
+        elif self.mode == 'vlc':
+            loopMedia = master.mixer.players.media(soundobj.get_mrl())
+            if loops:
+                loopMedia.add_option("input-repeat=%d" % (65535 if loops < 0 else loops))
+            self.loopNext = loopMedia
+
+    # Queue the next pass of a pygame loop behind the one that's just started, which SDL_mixer
+    #   switches to on the last sample of this one (so long as the event pump gets here before then)
+    def _keepLooping(self):
+        if not self.loopNext or self._channel.get_queue() is not None:
+            return
+        self._channel.queue(self.loopNext)
+        if self.loopsLeft > 0:
+            self.loopsLeft -= 1
+            if not self.loopsLeft:
+                self.loopNext = None
+
+    # Called by the player pool when VLC reaches the end: play the loop after an intro, or ready the player for the next cue
+    def _ended(self):
+        if self.loopNext:
+            self._playLoop()
+        else:
+            master.mixer.players.reset(self._channel)
+
+    def _playLoop(self):
+        if self.loopNext:
+            self.notify(synth_events.LOOPED)
+            # The channel's media stays the cue's own sound, so the cue still knows the channel is playing it
+            loopMedia, self.loopNext = self.loopNext, None
+            self._channel.set_media(loopMedia)
+            self._channel.play()
+
+    def play(self,loops=None,fade_ms=0,at=None):
         logger.debug("Plaing channel {}".format(self._channel))
-        if self.mode == 'vlc':
-            # ALways start with default volume, until we have fadein
+        self.started = time.time()
+        armed, self.armed = self.armed, None
+        # An armed voice only has to be set running (the software mixer's only if it was armed the same way)
+        if armed is not None and self.mode == 'vlc':
+            self._channel.set_pause(False)
+        elif armed == (loops, fade_ms) and self.mode == 'numpy':
+            self._channel.unpause(at=master.mixer.frameAt(at))
+        elif self.mode == 'vlc':
             self._channel.play()
         elif self.mode == 'pygame':
-            self._channel.play(self.media, loops=loops, fade_ms=fade_ms)
-        self.set_volume(100)
-
+            self._channel.play(self.media, loops=loops)
+            self.notify(synth_events.STARTED)
+        elif self.mode == 'numpy':
+            self._channel.play(self.media, loops=loops, fade_ms=fade_ms, at=master.mixer.frameAt(at), curve=master.mixer.fadeCurve)
+        # Fade in from silence, or start at full volume
+        if master.mixer.fades:
+            master.mixer.fades.fadeIn(self, self._setGain, fade_ms, done=self._fadedIn if fade_ms else None)
+
+    # How far into its sound the channel is, in ms
     def get_time(self):
         if self.mode == 'vlc':
             return self._channel.get_time()
+        # pygame can't tell us, so go by when we started it
         elif self.mode == 'pygame':
-            return self._channel.get_sound().get_length()
+            return int((time.time() - self.started) * 1000)
+        # Only the software mixer knows where it is in the sound
+        elif self.mode == 'numpy':
+            return self._channel.get_pos()
 
     def get_queue(self):
         if self.mode == 'vlc':
             # TODO: determine whether a sound is queued
             return
-        elif self.mode == 'pygame':
+        elif self.mode in ('pygame','numpy'):
             return self._channel.get_queue()
 
 
@@ -1450,9 +2403,11 @@ class Channel(object):
 
 class Master:
 
-    def __init__(self,projectroot,testmode=False):
+    def __init__(self,projectroot,testmode=False,offline=False):
 
         self.projectroot = projectroot
+        # An offline board is rendered rather than played, so it mixes everything itself
+        self.offline = offline
         # ---- Global Variables Here ---- #
         # A default folder for testing, no slashes
         self.testmode = testmode
@@ -1462,25 +2417,40 @@ class Master:
         else:
             testflag = ""
         self.prog_version = "Synthea "+version+testflag
+        # How many buttons the loader has got to, which its threads count under a lock
         self.totalLoaded = 0
+        self.loadLock = threading.Lock()
 
     def layout(self):
-        # Load the project's configuration file
-        self.config = synth_layout.loadConfig(self.projectroot)
-        # Import the project's layout data, which is now all order-preserved lists
-        layoutResult = synth_layout.loadLayout(self.projectroot)
-        self.layout_raw = layoutResult[0]
-        self.totalSounds = layoutResult[1]
-        self.layout_hotkeys = synth_layout.loadHotkeys(self.projectroot,functions=hotkeyFunctions)
+        # Load the project's configuration, layout and hotkeys, straight from the compiled cache if nothing changed
+        self.config, self.layout_index, self.layout_hotkeys = synth_layout.loadProject(self.projectroot,functions=hotkeyFunctions)
+        # The layout index keeps pages, frames and buttons in order, with lookups by name and file
+        self.totalSounds = len(self.layout_index)
+        # Only the software mixer can be rendered offline
+        if self.offline:
+            self.config = dict(self.config, playback="numpy")
+        # Check every sound file in every mode up front, so problems show up before the show does
+        self.validateMedia()
         # A default crossfade position: [0,0] for wait/cross, full/fade
         self.crossfade = self.config["crossfade"]
         # Fadein and fadeout values
         self.fadetime = self.config["fadetime"]
 
         logger.debug("Layouts and config loaded, mixing mixer...")
-        # Initialize the mixer
-        self.mixer = Mixer(self.config["playback"])
+        # Initialize the mixer, whose cache hashes files through the metadata index so they're only read again once they change
+        self.mixer = Mixer(self.config["playback"],self.config["cache_budget"],self.projectroot if self.config["pcm_cache"] else None,
+                           self.config["voices"],self.config["voice_steal"],self.config["fade_curve"],
+                           self.config["sample_rate"],self.config["block_size"],self.config["channels"],self.offline,
+                           self.config["bus_gain"],self.config["limiter"],self.metadata.digest)
+
 
+    # Scan the mode directories once and check the layout against them
+    def validateMedia(self):
+        self.media = synth_media.MediaTable(self.projectroot, self.config["modes"])
+        self.media_problems = self.media.validate(self.layout_index, self.config["playback"])
+        synth_media.reportProblems(self.media_problems)
+        # The durations and formats of the sounds, read from their headers as the loader gets to each button
+        self.metadata = synth_media.MetadataIndex(self.projectroot, self.media)
 
     def render(self):
         # Create the master window
@@ -1489,13 +2459,95 @@ class Master:
         self.frame.initialize()
         # Render the master window
         self.frame.Show()
+        # Pick up edits to the project while we're running, if asked to
+        if self.config["watch"]:
+            self.watch()
+
+    # Start watching the project root and every mode directory for changes
+    def watch(self):
+        self.unwatch()
+        folders = [self.projectroot] + [self.projectroot+mode for mode in self.config["modes"]]
+        # The watcher calls back on its own thread, so hop back onto the GUI thread
+        self.watcher = synth_watch.ProjectWatcher(folders, lambda changes: wx.CallAfter(self.filesChanged, changes))
+        self.watcher.start()
+        logger.info("Watching project files using %s" % self.watcher.method)
+
+    def unwatch(self):
+        if getattr(self, "watcher", None):
+            self.watcher.stop()
+            self.watcher = None
+
+    # React to a burst of changed files: re-parse the layout files or reload the affected sounds
+    def filesChanged(self, changes):
+        root = os.path.abspath(self.projectroot)
+        projectFiles = ("Config.txt","QuickReference.txt","Layout.txt","Layout.csv","Hotkeys.txt","Hotkeys.csv")
+        modeDir = os.path.abspath(self.projectroot+self.frame.modes[self.frame.mode])
+        layoutChanged = False
+        sounds = set()
+        for path in changes:
+            folder, name = os.path.split(path)
+            # Keep the media table up to date with whatever happened to the file
+            self.media.refresh(path)
+            # Whatever was decoded from the old file is out of date
+            self.mixer.cache.discard(self.projectroot+os.path.relpath(path, root).replace(os.sep, "/"))
+            if folder == root and name in projectFiles:
+                layoutChanged = True
+            elif folder == modeDir:
+                sounds.add(name)
+        if layoutChanged:
+            # The layout cache will only re-parse the files that actually changed
+            logger.info("Project files changed, reloading")
+            frame = self.frame
+            self.reload()
+            # A full rebuild has already reloaded every sound
+            if self.frame is not frame:
+                return
+        # Only sounds in the current mode matter, the others are loaded on changeMode
+        if sounds:
+            for button in self.frame.buttons:
+                if sounds.intersection(synth_layout.buttonFiles(button.buttoncode)):
+                    logger.info("Sound for %s changed, reloading it" % button.name)
+                    button.loadmode()
 
     def reload(self):
         logger.debug("Reloading self, Master!")
-        master.mixer.stop()
-        self.frame.Destroy()
-        self.layout()
-        self.render()
+        oldConfig = self.config
+        self.config, self.layout_index, self.layout_hotkeys = synth_layout.loadProject(self.projectroot,functions=hotkeyFunctions)
+        self.totalSounds = len(self.layout_index)
+
+        # Some settings change the whole board, so it has to be rebuilt from scratch
+        for key in ("playback","modes","type","dj","default_window","crashnoise"):
+            if oldConfig.get(key) != self.config.get(key):
+                logger.debug("Configuration %s changed, rebuilding the board" % key)
+                master.mixer.stop()
+                master.mixer.close()
+                self.frame.shutdown()
+                self.frame.Destroy()
+                self.layout()
+                self.render()
+                return
+        # Keep the live fade settings
+        self.config["crossfade"] = self.crossfade
+        self.config["fadetime"] = self.fadetime
+        # Start or stop watching, if that has been changed
+        if self.config["watch"] and not oldConfig.get("watch"):
+            self.watch()
+        elif not self.config["watch"]:
+            self.unwatch()
+
+        # Check the new layout against the media we know about
+        self.media_problems = self.media.validate(self.layout_index, self.config["playback"])
+        synth_media.reportProblems(self.media_problems)
+
+        # Otherwise, only patch the pages, frames and buttons that have changed
+        self.frame.Freeze()
+        try:
+            self.frame.contentPanel.patch(self.layout_index)
+            self.frame.bindHotkeys()
+            self.frame.refreshButtons()
+        finally:
+            self.frame.Thaw()
+        self.frame.Layout()
 
 # This is it! This routine creates a soundboard and runs it!
 def createMaster(projectsource,testmode=False):
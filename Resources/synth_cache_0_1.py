@@ -0,0 +1,167 @@
+############
+## This is the sound cache, which holds every decoded sound on the board
+##   Sounds are kept in least-recently-used order and evicted once the cache
+##   grows past its memory budget. Pinned sounds are never evicted, and
+##   neither is anything that is playing right now.
+##   Decoded sounds are keyed by a hash of the file's contents, so a file that
+##   is used by several buttons, or is identical in several modes, is only
+##   decoded and held once.
+##   -- (0.1) Initial version, LRU with a byte budget and pinning; content-hash dedupe
+############
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import logging
+logger = logging.getLogger(__name__)
+logger.addHandler( logging.StreamHandler() )
+logger.setLevel(logging.INFO)
+
+# How much of a file to hash at a time
+HASH_CHUNK = 1048576
+
+# A hash of a file's contents, or of its path if it can't be read (so it's never shared)
+def fileDigest(path):
+    digest = hashlib.md5()
+    try:
+        with open(path, "rb") as f:
+            chunk = f.read(HASH_CHUNK)
+            while chunk:
+                digest.update(chunk)
+                chunk = f.read(HASH_CHUNK)
+    except(IOError, OSError):
+        return "path:" + path
+    return digest.hexdigest()
+
+
+# --------------------------------------------------------
+# A memory-budgeted cache of decoded sounds, looked up by path
+# --------------------------------------------------------
+class SoundCache(object):
+
+    def __init__(self, loader, sizer, budget=None, inUse=None, hasher=fileDigest):
+        # How to decode a path into a sound, and how big (path, sound) is in bytes
+        self.loader = loader
+        self.sizer = sizer
+        # How to tell whether two files have the same contents
+        self.hasher = hasher
+        # The most we'll hold, in bytes (None for no limit)
+        self.budget = budget
+        # Whether a sound is playing, so it is not evicted from under the mixer
+        self.inUse = inUse or (lambda sound: False)
+        # Content hash -> (sound, size), oldest first
+        self._entries = OrderedDict()
+        # Path -> content hash, remembered after eviction too so each file is only hashed once
+        self._digests = {}
+        self._pinned = set()
+        self.bytes = 0
+        # Sounds may be loaded from more than one thread
+        self._lock = threading.RLock()
+
+    # Fetch a sound, decoding it if neither it nor an identical file is cached yet
+    def get(self, path):
+        with self._lock:
+            digest = self._digests.get(path)
+            entry = self._touch(digest)
+            if entry is not None:
+                return entry[0]
+        # Hash and decode outside the lock, so other threads can use the cache meanwhile
+        if digest is None:
+            digest = self.hasher(path)
+            with self._lock:
+                self._digests[path] = digest
+                entry = self._touch(digest)
+                if entry is not None:
+                    logger.debug("%s is identical to a cached sound, sharing it" % path)
+                    return entry[0]
+        sound = self.loader(path)
+        with self._lock:
+            # Somebody else may have loaded it while we were decoding
+            entry = self._entries.pop(digest, None)
+            if entry is None:
+                entry = (sound, self.sizer(path, sound))
+                self.bytes += entry[1]
+            self._entries[digest] = entry
+            # The sound that was just asked for is about to be used, so it stays
+            self.evict(keep=digest)
+            return entry[0]
+
+    # Move an entry to the most-recently-used end, returning it (or None if it isn't cached)
+    def _touch(self, digest):
+        entry = self._entries.pop(digest, None)
+        if entry is not None:
+            self._entries[digest] = entry
+        return entry
+
+    def __contains__(self, path):
+        return self._digests.get(path) in self._entries
+
+    # Keep a sound hot: it will never be evicted until it is unpinned
+    def pin(self, path):
+        with self._lock:
+            self._pinned.add(path)
+
+    # Release a pinned sound, or every pinned sound if no path is given
+    def unpin(self, path=None):
+        with self._lock:
+            if path is None:
+                self._pinned.clear()
+            else:
+                self._pinned.discard(path)
+        self.evict()
+
+    # How many bytes a cached sound takes up, or 0 if it isn't cached
+    def size(self, path):
+        entry = self._entries.get(self._digests.get(path))
+        return entry[1] if entry else 0
+
+    def pinned(self, path):
+        return path in self._pinned
+
+    # Forget a path (e.g. because its file has changed), and drop its sound unless it is
+    #   playing or an identical file elsewhere still uses it
+    def discard(self, path):
+        with self._lock:
+            digest = self._digests.pop(path, None)
+            entry = self._entries.get(digest)
+            if entry is None or digest in self._digests.values() or self.inUse(entry[0]):
+                return False
+            del self._entries[digest]
+            self.bytes -= entry[1]
+            return True
+
+    # Evict the least recently used sounds until we fit within the budget
+    def evict(self, keep=None):
+        if self.budget is None:
+            return
+        with self._lock:
+            if self.bytes <= self.budget:
+                return
+            pinned = set(self._digests.get(path) for path in self._pinned)
+            for digest in list(self._entries.keys()):
+                if self.bytes <= self.budget:
+                    break
+                if digest == keep or digest in pinned or self.inUse(self._entries[digest][0]):
+                    continue
+                logger.debug("Evicting %s from the sound cache" % digest)
+                self.bytes -= self._entries.pop(digest)[1]
+
+    # How many bytes are being saved right now by sharing identical sounds
+    def savedBytes(self):
+        with self._lock:
+            counts = {}
+            for digest in self._digests.values():
+                counts[digest] = counts.get(digest, 0) + 1
+            return sum(self._entries[digest][1] * (count - 1) for digest, count in counts.items() if count > 1 and digest in self._entries)
+
+    # The current memory use: (bytes, budget, number of sounds, number pinned)
+    def usage(self):
+        return (self.bytes, self.budget, len(self._entries), len(self._pinned))
+
+    # A friendly description of the memory use
+    def describe(self):
+        used = float(self.bytes) / 1048576
+        if self.budget is None:
+            return "Cache: %.0f MB" % used
+        return "Cache: %.0f/%.0f MB" % (used, float(self.budget) / 1048576)
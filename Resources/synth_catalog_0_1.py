@@ -0,0 +1,106 @@
+############
+## This keeps a catalog of the projects in the Projects folder
+##   The catalog remembers each project's title, keyed on the modification
+##   times of its folder and Config file, so the loader can list every
+##   project from a single file. Projects that are new or have changed are
+##   re-scanned concurrently in a pool of threads.
+##   -- (0.1) Initial version
+############
+
+import os
+import stat
+from multiprocessing.pool import ThreadPool
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import logging
+logger = logging.getLogger(__name__)
+logger.addHandler( logging.StreamHandler() )
+logger.setLevel(logging.INFO)
+
+# The catalog lives in the Projects folder, hidden so it's not mistaken for a project
+catalogFile = ".synthea_catalog"
+# Bump this whenever the catalog entries change shape
+catalogVersion = 1
+# How many projects to scan at once
+DEFAULT_WORKERS = 8
+
+# Read the whole catalog in one go, or return an empty one
+def loadCatalog(root="Projects"):
+    try:
+        with open(os.path.join(root, catalogFile), "rb") as f:
+            catalog = pickle.load(f)
+        if catalog.get("version") == catalogVersion:
+            return catalog["projects"]
+    except(IOError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+        pass
+    return {}
+
+# Write the catalog, being careful not to leave a half-written file behind
+def saveCatalog(projects, root="Projects"):
+    path = os.path.join(root, catalogFile)
+    try:
+        with open(path+".tmp", "wb") as f:
+            pickle.dump({"version": catalogVersion, "projects": projects}, f, pickle.HIGHEST_PROTOCOL)
+        # Windows won't rename over an existing file
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(path+".tmp", path)
+    except(IOError, OSError):
+        logger.warn("  ! Warning: unable to write the project catalog")
+
+# The modification times that a catalog entry is keyed on, or None if this isn't a project folder
+def projectStamp(root, folder):
+    try:
+        folderStat = os.stat(os.path.join(root, folder))
+    except(OSError):
+        return None
+    if not stat.S_ISDIR(folderStat.st_mode):
+        return None
+    folderTime = folderStat.st_mtime
+    try:
+        configTime = os.stat(os.path.join(root, folder, "Config.txt")).st_mtime
+    except(OSError):
+        configTime = None
+    return (folderTime, configTime)
+
+# Scan a project folder and build its catalog entry
+def scanProject(root, folder, stamp=None):
+    title = None
+    try:
+        with open(os.path.join(root, folder, "Config.txt")) as f:
+            for line in f:
+                if line.split(":")[0] == "name":
+                    # Parse the long title of the project
+                    title = line.split(":",1)[1].strip()
+    except(IOError):
+        pass
+    return {"stamp": stamp or projectStamp(root, folder), "title": title}
+
+# Sort the project folders into those with a current catalog entry and those that need scanning
+def checkCatalog(projects, root="Projects"):
+    fresh = []
+    stale = []
+    for folder in os.listdir(root):
+        if folder.startswith("."):
+            continue
+        stamp = projectStamp(root, folder)
+        if stamp is None:
+            continue
+        entry = projects.get(folder)
+        if entry and entry["stamp"] == stamp:
+            fresh.append(folder)
+        else:
+            stale.append((folder, stamp))
+    return fresh, stale
+
+# Scan some projects in a pool of threads, calling back (on a worker thread) as each one finishes
+def scanProjects(stale, callback, root="Projects", workers=DEFAULT_WORKERS):
+    pool = ThreadPool(max(1, min(workers, len(stale))))
+    for folder, stamp in stale:
+        # Bind the folder now, so each callback knows which project it's for
+        pool.apply_async(scanProject, (root, folder, stamp), callback=lambda entry, folder=folder: callback(folder, entry))
+    pool.close()
+    return pool
@@ -0,0 +1,68 @@
+############
+## This is the playback event bus, which tells whoever is listening what the voices are doing
+##   Every voice reports when it starts, ends, loops and finishes a fade, from
+##   whichever thread notices it: VLC's event manager, pygame's end events, or
+##   the NumPy mixer itself. Subscribers are called through a dispatcher, so
+##   the board can have them called on the GUI thread.
+##   -- (0.1) Initial version
+############
+
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+logger.addHandler( logging.StreamHandler() )
+logger.setLevel(logging.INFO)
+
+# The kinds of event a voice reports
+STARTED = "started"
+ENDED = "ended"
+LOOPED = "looped"
+FADED = "faded"
+kinds = (STARTED, ENDED, LOOPED, FADED)
+
+
+# --------------------------------------------------------
+# A bus that passes playback events on to its subscribers, as callback(kind, channel)
+# --------------------------------------------------------
+class EventBus(object):
+
+    def __init__(self, dispatch=None):
+        # How to call a subscriber, as dispatch(function, *args) (e.g. wx.CallAfter), or None to call it straight away
+        self.dispatch = dispatch
+        # Kind (or None, for every kind) -> subscribers
+        self._subscribers = {}
+        self.counts = dict((kind, 0) for kind in kinds)
+        self._lock = threading.Lock()
+
+    # Listen for some kinds of event, or every kind
+    def subscribe(self, callback, kinds=None):
+        with self._lock:
+            for kind in kinds or (None,):
+                self._subscribers.setdefault(kind, []).append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            for subscribers in self._subscribers.values():
+                while callback in subscribers:
+                    subscribers.remove(callback)
+
+    def emit(self, kind, channel):
+        with self._lock:
+            self.counts[kind] += 1
+            callbacks = self._subscribers.get(kind, []) + self._subscribers.get(None, [])
+        for callback in callbacks:
+            if self.dispatch:
+                self.dispatch(self._call, callback, kind, channel)
+            else:
+                self._call(callback, kind, channel)
+
+    def _call(self, callback, kind, channel):
+        try:
+            callback(kind, channel)
+        except Exception:
+            logger.exception("  ! %s event handler %s failed" % (kind, getattr(callback, "__name__", callback)))
+
+    # A friendly count of the events so far
+    def describe(self):
+        return "Events: " + ", ".join("%d %s" % (self.counts[kind], kind) for kind in kinds)
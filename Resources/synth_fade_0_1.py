@@ -0,0 +1,200 @@
+############
+## This is the fade engine, which ramps the volume of every fading channel
+##   A single thread updates every ramp at a fixed control rate, instead of
+##   each fade running timers of its own. Ramps follow a curve: linear in
+##   gain, equal power (so a crossfade holds a steady loudness), or
+##   logarithmic (linear in decibels, which is how the ear hears a fade).
+##   A ramp that is still going can be given a new length, and carries on
+##   from wherever it has got to. The NumPy mixer ramps its own voices sample
+##   by sample, with the same curves.
+##   -- (0.1) Initial version
+############
+
+import threading
+import time
+
+import numpy
+
+import logging
+logger = logging.getLogger(__name__)
+logger.addHandler( logging.StreamHandler() )
+logger.setLevel(logging.INFO)
+
+# How many times a second the ramps are updated
+CONTROL_RATE = 100
+# The quietest a logarithmic fade gets before it drops to silence, in dB
+LOG_FLOOR = -60.0
+
+
+# Each curve turns a position along a fade, from 0 (silent) to 1 (full volume), into a gain; and a gain back
+#   into a position, so a fade can start from whatever volume a channel is at. Both work on arrays too
+def linearGain(position):
+    return numpy.clip(position, 0.0, 1.0)
+
+def linearPosition(gain):
+    return numpy.clip(gain, 0.0, 1.0)
+
+def equalPowerGain(position):
+    return numpy.sin(numpy.clip(position, 0.0, 1.0) * numpy.pi / 2)
+
+def equalPowerPosition(gain):
+    return numpy.arcsin(numpy.clip(gain, 0.0, 1.0)) * 2 / numpy.pi
+
+def logGain(position):
+    position = numpy.clip(position, 0.0, 1.0)
+    return numpy.where(position > 0, 10 ** ((1.0 - position) * LOG_FLOOR / 20), 0.0)
+
+def logPosition(gain):
+    decibels = 20 * numpy.log10(numpy.maximum(gain, 1e-9))
+    return numpy.clip(1.0 - decibels / LOG_FLOOR, 0.0, 1.0)
+
+curves = {
+    "linear": (linearGain, linearPosition),
+    "equal": (equalPowerGain, equalPowerPosition),
+    "log": (logGain, logPosition),
+    }
+defaultCurve = "linear"
+
+
+# --------------------------------------------------------
+# A single ramp from one gain to another, which sets the gain with apply(gain)
+#   Times are in seconds
+# --------------------------------------------------------
+class Ramp(object):
+
+    def __init__(self, apply, start, end, length, now, curve=defaultCurve, done=None):
+        self.apply = apply
+        self.curve = curve
+        self.done = done
+        position = curves[curve][1]
+        self.start = float(position(start))
+        self.end = float(position(end))
+        self.length = max(0.0, length)
+        self.started = now
+
+    def progress(self, now):
+        if self.length <= 0:
+            return 1.0
+        return min(1.0, max(0.0, (now - self.started) / self.length))
+
+    def gain(self, now):
+        return float(curves[self.curve][0](self.start + (self.end - self.start) * self.progress(now)))
+
+    def rising(self):
+        return self.end > self.start
+
+    # Give the ramp a new overall length, carrying on from where it has got to
+    def retarget(self, length, now):
+        progress = self.progress(now)
+        self.start += (self.end - self.start) * progress
+        self.length = max(0.0, length) * (1.0 - progress)
+        self.started = now
+
+
+# --------------------------------------------------------
+# Every fading channel's ramp, updated together on one thread
+#   Each channel (or anything else) has at most one ramp, looked up by a key
+# --------------------------------------------------------
+class FadeEngine(object):
+
+    def __init__(self, curve=defaultCurve, rate=CONTROL_RATE, clock=time.time):
+        self.curve = curve
+        self.rate = rate
+        self.clock = clock
+        self._ramps = {}
+        # Ramps finish (and call back) under the lock, so a callback may start or cancel other fades
+        self._cond = threading.Condition(threading.RLock())
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="FadeEngine")
+        self._thread.daemon = True
+        self._thread.start()
+
+    # Ramp from one gain to another over a time in ms, replacing any ramp the key already has,
+    #   and calling done() once it gets there
+    def fade(self, key, apply, start, end, time, done=None, curve=None):
+        with self._cond:
+            self._ramps.pop(key, None)
+            apply(start)
+            if time <= 0:
+                apply(end)
+                if done:
+                    done()
+                return
+            self._ramps[key] = Ramp(apply, start, end, time / 1000.0, self.clock(), curve or self.curve, done)
+            self._cond.notify()
+
+    def fadeIn(self, key, apply, time, start=0.0, done=None, curve=None):
+        self.fade(key, apply, start, 1.0, time, done, curve)
+
+    def fadeOut(self, key, apply, start, time, done=None, curve=None):
+        self.fade(key, apply, start, 0.0, time, done, curve)
+
+    # Stop a ramp where it is, without calling it done
+    def cancel(self, key):
+        with self._cond:
+            return self._ramps.pop(key, None) is not None
+
+    def fading(self, key):
+        return key in self._ramps
+
+    # Give every ramp (or only the rising or falling ones) a new length in ms, carrying on from where it has got to
+    def retarget(self, time, rising=None):
+        with self._cond:
+            now = self.clock()
+            for ramp in self._ramps.values():
+                if rising is None or ramp.rising() == rising:
+                    ramp.retarget(time / 1000.0, now)
+
+    def __len__(self):
+        return len(self._ramps)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._ramps.clear()
+            self._cond.notify_all()
+
+    def _run(self):
+        interval = 1.0 / self.rate
+        while True:
+            with self._cond:
+                while not self._ramps and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                now = self.clock()
+                for key, ramp in list(self._ramps.items()):
+                    try:
+                        ramp.apply(ramp.gain(now))
+                        if ramp.progress(now) >= 1.0:
+                            del self._ramps[key]
+                            if ramp.done:
+                                ramp.done()
+                    except Exception:
+                        logger.exception("  ! Fade on %s failed" % (key,))
+                        self._ramps.pop(key, None)
+            time.sleep(interval)
+
+
+# Check that every curve goes from silence to full volume, turns back into the same positions,
+#   and that retargeting a ramp mid-fade carries on from the same gain
+def testCurves():
+    positions = numpy.linspace(0.0, 1.0, 101)
+    for name, (gain, position) in curves.items():
+        gains = gain(positions)
+        assert gains[0] == 0.0 and abs(gains[-1] - 1.0) < 1e-9, "%s doesn't run from silence to full volume" % name
+        assert numpy.all(numpy.diff(gains) >= 0), "%s isn't monotonic" % name
+        assert numpy.abs(position(gains[1:]) - positions[1:]).max() < 1e-6, "%s doesn't invert" % name
+        ramp = Ramp(None, 1.0, 0.0, 2.0, 0.0, name)
+        before = ramp.gain(0.5)
+        ramp.retarget(4.0, 0.5)
+        assert abs(ramp.gain(0.5) - before) < 1e-9, "%s jumps when it is retargeted" % name
+        assert abs(ramp.gain(0.5 + 3.0) - 0.0) < 1e-9, "%s doesn't finish on time once retargeted" % name
+        logger.info("%s: gain at a quarter, half and three quarters of the way is %.3f, %.3f, %.3f" % ((name,) + tuple(gains[[25, 50, 75]])))
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "test":
+        testCurves()
+        logger.info("Fade curves are sound")
@@ -0,0 +1,209 @@
+############
+## This runs a board without a window, for benchmarks and offline renders
+##   A headless frame stands in for MyFrame: it owns the master queue, keeps
+##   the lock, and has a status bar that only remembers its text. Each button
+##   on the layout becomes a headless cue, which is queued and played through
+##   the same MasterQueue and Mixer as an FX_Button is.
+##   -- (0.1) Initial version
+############
+
+import random
+
+import synth_board_0_4_5 as synth_board
+
+import logging
+logger = logging.getLogger(__name__)
+logger.addHandler( logging.StreamHandler() )
+logger.setLevel(logging.INFO)
+
+
+# Open a project without a window, returning its Master (which the board's classes know as master)
+#   An offline board mixes with NumPy and has no output stream, so it can be rendered instead of played
+def openBoard(projectroot, testmode=False, offline=False):
+    if not projectroot.endswith("/"):
+        projectroot += "/"
+    master = synth_board.Master(projectroot, testmode, offline)
+    synth_board.master = master
+    master.layout()
+    master.frame = HeadlessFrame(master)
+    return master
+
+
+# --------------------------------------------------------
+# A status bar that keeps its text, for anybody who wants to read it back
+# --------------------------------------------------------
+class HeadlessStatusBar(object):
+
+    def __init__(self):
+        self.fields = {}
+
+    def SetStatusText(self, text, field=0):
+        self.fields[field] = text
+
+    def GetStatusText(self, field=0):
+        return self.fields.get(field, "")
+
+
+# --------------------------------------------------------
+# The board's frame, without a window
+# --------------------------------------------------------
+class HeadlessFrame(object):
+
+    def __init__(self, master):
+        self.master = master
+        self.locked = False
+        self.paused = False
+        self.nowPlaying = None
+        self.modes = master.config["modes"]
+        self.mode = 0
+        self.statusBar = HeadlessStatusBar()
+        self.master_queue = synth_board.MasterQueue(self)
+        # Every button on the layout, in order, and by name
+        self.buttons = [HeadlessCue(buttoncode) for buttoncode in master.layout_index]
+        self.master_buttons = dict((cue.name, cue) for cue in self.buttons)
+
+    # Decode every cue's sounds, as the background loader would (NOCACHE cues are left until they're played)
+    def preload(self):
+        for cue in self.buttons:
+            cue.preload()
+
+    # Lock or unlock the queue, playing everything on it when it's unlocked
+    def toggle(self):
+        if self.locked:
+            self.locked = False
+            if self.master_queue:
+                self.master_queue.Play()
+        else:
+            self.locked = True
+
+    # Cut everything off, as MyFrame.cancel does for effects
+    def cancel(self, fadeOut=True):
+        if fadeOut and self.master.config["type"] != "dialog":
+            self.master.mixer.fadeout(self.master.fadetime[0])
+        else:
+            self.master.mixer.stop()
+        self.master_queue.Cancel()
+        if self.locked:
+            self.toggle()
+        for cue in self.buttons:
+            if cue.nocache:
+                cue.uncache()
+        self.master.mixer.cache.evict()
+
+    def updateCacheDisplay(self):
+        pass
+
+    # pygame's end events are only picked up when somebody asks for them, as MyFrame's event pump does
+    def pump(self):
+        if self.master.mixer.mode == "pygame":
+            self.master.mixer.pump()
+
+    # Stop the threads that belong to the frame
+    def shutdown(self):
+        self.master_queue.scheduler.stop()
+        self.master.mixer.events.unsubscribe(self.master_queue.playbackEvent)
+
+
+# --------------------------------------------------------
+# A button's cue, without the button: queued and played the way FX_Button does it
+# --------------------------------------------------------
+class HeadlessCue(object):
+
+    def __init__(self, buttoncode):
+        master = synth_board.master
+        self.buttoncode = buttoncode
+        self.name = buttoncode["name"]
+        self.src = buttoncode["src"]
+        self.nocache = buttoncode["nocache"]
+        self.pin = buttoncode["pin"]
+        self.loop = -1 if buttoncode["loop"] else 0
+        # The same exclusive groups as a button, including the board's default
+        if buttoncode["exclusive"]:
+            self.exclusive = buttoncode["exclusive"]
+        elif master.config["type"] == "music":
+            self.exclusive = "MUSIC"
+        else:
+            self.exclusive = "__any__"
+        pathRoot = master.projectroot + master.config["modes"][0] + "/"
+        self.sounds = [pathRoot + source for source in self.src]
+        self.loopSound = pathRoot + buttoncode["loopFile"] if buttoncode["loop"] and buttoncode["loopFile"] else None
+        if self.pin:
+            for soundfile in self.sounds + ([self.loopSound] if self.loopSound else []):
+                master.mixer.cache.pin(soundfile)
+        self.channel = None
+        self.buffer = None
+        self.playfile = None
+        self._lastplaynum = None
+
+    def GetLabel(self):
+        return self.name
+
+    def clear(self):
+        pass
+
+    def preload(self):
+        if not self.nocache:
+            for soundfile in self.sounds + ([self.loopSound] if self.loopSound else []):
+                synth_board.master.mixer.cachefile(soundfile)
+
+    # The cached sound for a file, or silence if it can't be played
+    def cache(self, soundfile):
+        if not synth_board.master.media.playable(soundfile):
+            logger.warn("  ! Warning: sound file not found: " + soundfile)
+            return synth_board.master.frame.master_queue.silence
+        return synth_board.master.mixer.cachefile(soundfile)
+
+    def uncache(self):
+        cache = synth_board.master.mixer.cache
+        for soundfile in self.sounds + [self.loopSound]:
+            if soundfile and not cache.pinned(soundfile):
+                cache.discard(soundfile)
+
+    def disarm(self):
+        if self.channel and self.channel.owner is self and self.channel.armed is not None:
+            self.channel.disarm()
+
+    def queue(self):
+        master = synth_board.master
+        # An exclusive cue that's playing is faded out instead (if its channel hasn't gone on to another cue)
+        if self.exclusive != "__any__" and self.channel and self.channel.owner is self and self.channel.media is self.buffer and self.channel.is_playing():
+            self.channel.fadeout(master.fadetime[0] if master.crossfade[0] else 0)
+            return
+        # A cue that's queued again is only taken off the queue
+        if self in master.frame.master_queue.queue:
+            master.frame.master_queue.Queue(self)
+            return
+        # Pick a random variant, never the same one twice in a row
+        playnum = 0
+        if len(self.sounds) > 1:
+            playnum = random.randint(0, len(self.sounds) - 1)
+            while self._lastplaynum == playnum:
+                playnum = random.randint(0, len(self.sounds) - 1)
+        self._lastplaynum = playnum
+        self.playfile = self.sounds[playnum]
+        self.buffer = self.cache(self.playfile)
+        # A full pool has a voice stolen when the cue plays, not while it waits
+        self.channel = master.mixer.find_channel(group=self.exclusive, owner=self, steal=False)
+        if self.channel:
+            self.channel.queue(self.buffer)
+        master.frame.master_queue.Queue(self)
+        if self.channel and master.frame.locked and self in master.frame.master_queue.queue:
+            self.channel.arm(loops=self.loop if not self.loopSound else 0, fade_ms=master.fadetime[1] if master.crossfade[1] else 0)
+
+    def play(self):
+        master = synth_board.master
+        fadein = master.fadetime[1] if master.crossfade[1] else 0
+        if not self.channel or self.channel.owner is not self:
+            self.channel = master.mixer.find_channel(group=self.exclusive, owner=self)
+            self.channel.queue(self.buffer)
+        looper = self.loop if not self.loopSound else 0
+        loopThen = (self.cache(self.loopSound), self.loop) if self.loopSound else None
+        if not master.crossfade[0]:
+            master.frame.master_queue.DeferSound(self.channel, self.buffer, True, looper, master.fadetime[0], then=loopThen)
+        else:
+            master.mixer.play(self, loops=looper, fade_ms=fadein)
+            if loopThen:
+                self.channel.queueLoop(*loopThen)
+        master.frame.nowPlaying = self
+        master.frame.statusBar.SetStatusText(("Now Looping: %s" if self.loop else "Now Playing: %s") % self.name, 1)
+        return self.buffer
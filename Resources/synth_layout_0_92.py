@@ -1,8 +1,10 @@
 ############
-## This loads a layout file and returns a nested list of buttons
-##   It is a list of pagename/column tuples, the latter containing
-##   columnname/button tuples, the latter containing
-##   buttonname and filename tuples
+## This loads a layout file and returns an indexed model of buttons
+##   It is an ordered list of pages, each with an ordered list of
+##   columns, each with an ordered list of button dictionaries,
+##   plus lookups of buttons by name and by source file
+##   -- (0.9.3) Compiled layout cache, re-parsed only when a source file changes; linear-time LayoutIndex;
+##              NOCACHE and PIN options for the sound cache
 ##   -- (0.9.2) Support for VLC, single and group playback, tooltips
 ##   -- (0.9.1) Support for CSV Layout files
 ##   -- (0.9) Support for buffering music tracks, expandability for other args, crossfade
@@ -14,6 +16,11 @@
 import os
 import re
 import csv
+import hashlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 import logging
 logger = logging.getLogger(__name__)
@@ -22,29 +29,116 @@ logger.setLevel(logging.INFO)
 
 defaultCrossfade = [1,1]
 defaultFadetime = [1000,1000]
+# How many voices each exclusive group may play at once, and which to steal when they're all busy
+defaultVoices = 8
+defaultVoiceSteal = "oldest"
+voiceStealPolicies = ("oldest", "quietest")
+# The shape of every fade: linear in gain, equal power, or logarithmic (linear in dB)
+defaultFadeCurve = "linear"
+fadeCurves = ("linear", "equal", "log")
+# The most the output may peak at before the limiter turns it down, in dBFS
+defaultLimiter = -1.0
 
 reHotkey = re.compile(r"((?:<ctrl>|<alt>|<cmd>|<shift>)*)([A-Za-z0-9\-\_\=\[\]\\\;\'\,\.\/\`])")
 reHotkeyModifier = re.compile(r"(<ctrl>|<alt>|<cmd>|<shift>)")
 
-# This function loads layout specs from a file
+# Every project keeps its generated files in this subdirectory
+cacheDir = ".synthea"
+# The compiled layout cache, stored inside the cache directory
+cacheFile = "layout.cache"
+# Bump this whenever the parsed structures change shape, to invalidate old caches
+cacheVersion = 9
+
+# --------------------------------------------------------
+# An ordered, indexed model of a project's layout
+#   Pages, frames and buttons keep the order they were first seen in,
+#   and every membership check is a dictionary lookup, so parsing is linear
+# --------------------------------------------------------
+class LayoutIndex(object):
+
+    def __init__(self):
+        # A list of pages, in order
+        self.pages = []
+        # A dictionary of pages, with frames in order
+        self.frames = {}
+        # A dictionary of frames, with buttons in order
+        self.buttons = {}
+        # Lookups for buttons by their name and by their source files
+        self.byName = {}
+        self.byFile = {}
+        # Keys for everything we've already stored, for constant-time duplicate checks
+        self._frameKeys = set()
+        self._buttonKeys = set()
+        self.count = 0
+
+    # Add a button to a frame on a page, creating either of them as needed
+    def add(self, pageName, frameName, buttoncode):
+        if not pageName in self.frames:
+            self.pages.append(pageName)
+            self.frames[pageName] = []
+        if not frameName in self._frameKeys:
+            self._frameKeys.add(frameName)
+            self.frames[pageName].append(frameName)
+            self.buttons[frameName] = []
+        # Identical buttons in the same frame are only stored once
+        key = (frameName,) + buttonKey(buttoncode)
+        if key in self._buttonKeys:
+            return False
+        self._buttonKeys.add(key)
+        self.buttons[frameName].append(buttoncode)
+        # The last button with a given name wins, just like the hotkeys always have
+        self.byName[buttoncode['name']] = buttoncode
+        for filename in buttonFiles(buttoncode):
+            self.byFile.setdefault(filename, []).append(buttoncode)
+        self.count += 1
+        return True
+
+    # The frames on a page, in order
+    def framesForPage(self, pageName):
+        return self.frames.get(pageName, [])
+
+    # The buttons in a frame, in order
+    def buttonsForFrame(self, frameName):
+        return self.buttons.get(frameName, [])
+
+    # The button with a given name, or None
+    def buttonNamed(self, name):
+        return self.byName.get(name)
+
+    # Every button that plays a given source file (relative to the mode directory)
+    def buttonsForFile(self, filename):
+        return self.byFile.get(filename, [])
+
+    # Iterate over every buttoncode, in page/frame/button order
+    def __iter__(self):
+        for pageName in self.pages:
+            for frameName in self.frames[pageName]:
+                for buttoncode in self.buttons[frameName]:
+                    yield buttoncode
+
+    def __len__(self):
+        return self.count
+
+# A hashable key that identifies a buttoncode by all of its attributes
+def buttonKey(buttoncode):
+    exclusive = buttoncode['exclusive']
+    if isinstance(exclusive, list):
+        exclusive = tuple(exclusive)
+    return (buttoncode['name'], tuple(buttoncode['src']), buttoncode['loop'],
+        buttoncode['loopFile'], exclusive, buttoncode['tooltip'],
+        buttoncode['nocache'], buttoncode['pin'])
+
+# Every file a button may play, including its loop file
+def buttonFiles(buttoncode):
+    files = list(buttoncode['src'])
+    if buttoncode['loopFile'] and not buttoncode['loopFile'] in files:
+        files.append(buttoncode['loopFile'])
+    return files
+
+# This function loads layout specs from a file into a LayoutIndex
 def loadLayout(docroot="",file="Layout"):
-    # Each line from the loaded file!
-    lines = []
-    # A dictionary, for faster sorting
-    #pages = {}
-    # Lists, for order preservation
-    # A list of pages, in order
-    pageorder = []
-    # A dictionary of pages, with frames in order
-    frameorder = {}
-    # A dictionary of frames, with buttons in order
-    buttonorder = {}
-    #frames = []
-    #buttons = []
-
-
-    # Build a list of all the pages
-    validCount = 0
+    index = LayoutIndex()
+
     # We have this convenient iterator method that finds the right file
     for line in openDatafile(docroot+file):
         # Ignore comments!
@@ -55,20 +149,6 @@ def loadLayout(docroot="",file="Layout"):
         # Get the name of the frame, made unique to the page name
         frameName = pageName + '/$/$' + line[1] if line[1] else frameName
 
-        # See if this page has been created yet
-        if not pageName in pageorder:
-           # # If not, make a dictionary in the pages list with it
-           # pages[pageName] = {}
-           # # Set the page number so we can access the list
-           # pagenum = len(pageorder)
-            # Add the page to the pageorder list
-            pageorder.append(pageName)
-        # Create a key with the frame name and a value that is a list (of buttons)
-        if not pageName in frameorder.keys():
-            frameorder[pageName] = [frameName,]
-        elif not frameName in frameorder[pageName]:
-            frameorder[pageName].append(frameName)
-           
         # Clear out whitespace before/after, just in case the file has extra spaces
         buttonName = line[2].strip()
         buttonSrc = [filename.strip() for filename in line[3].strip().split(",")]
@@ -79,6 +159,8 @@ def loadLayout(docroot="",file="Layout"):
         buttonBuff = False
         buttonExclusive = False
         buttonTip = None
+        buttonNocache = False
+        buttonPin = False
 
         # Have additional arguments been passed?
         if len(line) > 4:
@@ -100,6 +182,11 @@ def loadLayout(docroot="",file="Layout"):
                 #     buttonBuff = 2
                 # elif l4val == "OVERRIDE":
                 #     buttonBuff = 3		
+                # A NOCACHE sound is dropped from the cache once it's done, a PIN sound is always kept
+                if l4val == "NOCACHE":
+                    buttonNocache = True
+                elif l4val == "PIN":
+                    buttonPin = True
                 if l4val == "SINGLE":
                     buttonExclusive = buttonSrc
                 elif l4val in ['DIALOG','MUSIC']:
@@ -122,38 +209,33 @@ def loadLayout(docroot="",file="Layout"):
             'loop': buttonLoop,
             'loopFile': loopFile,
             'exclusive': buttonExclusive,
-            'tooltip': buttonTip
+            'tooltip': buttonTip,
+            'nocache': buttonNocache,
+            'pin': buttonPin
             }
-        # If the button name is not already in the frame, add it!
-        if not frameName in buttonorder.keys():
-            buttonorder[frameName] = [buttoncode,]
-            validCount += 1
-        # Or, if this button doesn't already exist in the frame, add it!
-        elif not buttoncode in buttonorder[frameName]:
-            buttonorder[frameName].append(buttoncode)
-            validCount += 1
-   
-    # Now we'll build a sorted list of everything
-    # ... this is an obnoxious routine, but _finally_ allows us to
-    # ... have layout files that are not in perfect order!
-    pagelist = []
-    # pageorder is a sorted list of pages
-    for pageName in pageorder:
-        # Create a list of frames in this page
-        framelist = []
-        # frameorder[pageName] is a sorted list of frames
-        for frameName in frameorder[pageName]:
-            # Create a list of buttons in this frame
-            buttonlist = []
-            # buttonorder[frameName] is a sorted list of buttons
-            for button in buttonorder[frameName]:
-                # Work back up the tree, appending to preserve sort order
-                buttonlist.append(button)
-            framelist.append( (frameName,buttonlist) )
-        pagelist.append( (pageName,framelist) )
- 
-    # Return this clusterfuck of nested lists and tuples
-    return (pagelist, validCount)
+        # The index takes care of order preservation, so layout files don't need to be in perfect order
+        index.add(pageName, frameName, buttoncode)
+
+    return index
+
+# Time how long it takes to parse a generated layout, to keep an eye on the parser's complexity
+def benchmark(rows=100000, pages=10, frames=5):
+    import tempfile, time, shutil
+    docroot = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(docroot, "Layout.txt"), "w") as f:
+            for row in range(rows):
+                page = row % pages
+                frame = (row // pages) % frames
+                f.write("Page %d|Frame %d|Button %d|cue_%d.ogg,cue_%d_b.ogg|LOOPEXT=_loop\n" % (page, frame, row, row, row))
+        start = time.time()
+        index = loadLayout(docroot+os.sep)
+        elapsed = time.time() - start
+    finally:
+        shutil.rmtree(docroot)
+    logger.info("Parsed %d rows into %d pages, %d buttons in %.3f sec (%.1f usec/row)" %
+        (rows, len(index.pages), len(index), elapsed, elapsed * 1000000 / rows))
+    return elapsed
     
 # This function loads a hotkeys file and builds an array of event/button combinations
 def loadHotkeys(docroot="",file="Hotkeys",functions=None):
@@ -213,11 +295,100 @@ def loadConfig(docroot="",file="Config.txt"):
         config["dj"] = True
     else:
         config["dj"] = False
+    # Shall the project folders be watched for changes?
+    if config.has_key("watch") and config["watch"] == "enabled":
+        config["watch"] = True
+    else:
+        config["watch"] = False
+    # How much memory the sound cache may use, given in MB
+    if config.has_key("cache_budget"):
+        try:
+            config["cache_budget"] = int(float(config["cache_budget"]) * 1048576)
+        except(ValueError):
+            config["cache_budget"] = None
+    else:
+        config["cache_budget"] = None
+    # Shall decoded sounds be kept on disk between launches?
+    if config.has_key("pcm_cache") and config["pcm_cache"] == "enabled":
+        config["pcm_cache"] = True
+    else:
+        config["pcm_cache"] = False
+    # How much the page prefetcher may decode on each page change, given in MB (or "off")
+    if config.has_key("prefetch"):
+        if config["prefetch"] == "off":
+            config["prefetch"] = False
+        else:
+            try:
+                config["prefetch"] = int(float(config["prefetch"]) * 1048576)
+            except(ValueError):
+                config["prefetch"] = None
+    else:
+        config["prefetch"] = None
+    # The voice pool for each exclusive group, e.g. "voices: 8" for every group and "voices_MUSIC: 2"
+    #   for one, and the voice to steal when a pool is full, e.g. "voice_steal_MUSIC: quietest"
+    voices = {"__default__": defaultVoices}
+    voiceSteal = {"__default__": defaultVoiceSteal}
+    for key in config.keys():
+        if key == "voices" or key.startswith("voices_"):
+            try:
+                voices[key[7:] or "__default__"] = max(1, int(config[key]))
+            except(ValueError):
+                logger.warn("  ! Warning: %s should be a number of voices, not %s" % (key, config[key]))
+        elif key == "voice_steal" or key.startswith("voice_steal_"):
+            if config[key] in voiceStealPolicies:
+                voiceSteal[key[12:] or "__default__"] = config[key]
+            else:
+                logger.warn("  ! Warning: %s should be one of %s, not %s" % (key, ", ".join(voiceStealPolicies), config[key]))
+    config["voices"] = voices
+    config["voice_steal"] = voiceSteal
+    # The shape of fades, e.g. "fade_curve: equal" for crossfades that hold their loudness
+    if config.has_key("fade_curve") and not config["fade_curve"] in fadeCurves:
+        logger.warn("  ! Warning: fade_curve should be one of %s, not %s" % (", ".join(fadeCurves), config["fade_curve"]))
+        config["fade_curve"] = defaultFadeCurve
+    elif not config.has_key("fade_curve"):
+        config["fade_curve"] = defaultFadeCurve
+    # The gain of each group's mix bus in dB, e.g. "bus_gain_MUSIC: -6" (with "bus_gain_SFX" for the general
+    #   effects and "bus_gain" for the master bus), and the limiter's threshold, e.g. "limiter: -1" (or "off")
+    busGains = {}
+    for key in config.keys():
+        if key == "bus_gain" or key.startswith("bus_gain_"):
+            try:
+                busGains[key[9:] or "__master__"] = float(config[key])
+            except(ValueError):
+                logger.warn("  ! Warning: %s should be a gain in dB, not %s" % (key, config[key]))
+    config["bus_gain"] = busGains
+    if config.has_key("limiter") and config["limiter"] == "off":
+        config["limiter"] = None
+    elif config.has_key("limiter"):
+        try:
+            config["limiter"] = float(config["limiter"])
+        except(ValueError):
+            logger.warn("  ! Warning: limiter should be a threshold in dB or off, not %s" % config["limiter"])
+            config["limiter"] = defaultLimiter
+    else:
+        config["limiter"] = defaultLimiter
+    # The output format, e.g. "sample_rate: 48000" and "channels: 2", and its buffer, e.g. "block_size: 256"
+    #   (or "auto", for the smallest this machine can keep up with); anything left out is up to pygame
+    for key in ("sample_rate", "channels", "block_size"):
+        if not config.has_key(key):
+            config[key] = None
+        elif key == "block_size" and config[key] == "auto":
+            pass
+        else:
+            try:
+                config[key] = int(config[key])
+                if key == "block_size" and config[key] & (config[key] - 1):
+                    logger.warn("  ! Warning: block_size should be a power of two, not %d" % config[key])
+            except(ValueError):
+                logger.warn("  ! Warning: %s should be a number, not %s" % (key, config[key]))
+                config[key] = None
     if config.has_key('playback'):
         if config['playback'] == "vlc":
             config['playback'] = "vlc"
         elif config['playback'] == "pygame":
             config['playback'] = "pygame"
+        elif config['playback'] == "numpy":
+            config['playback'] = "numpy"
     else:
         # Set default
         config['playback'] = "pygame"
@@ -287,6 +458,105 @@ def loadConfig(docroot="",file="Config.txt"):
             raise(AttributeError,"Missing configuration %s" % key)
     return config
 
+#--------------------------------------------------------------------------------#
+### These methods load a whole project through a compiled cache, so that big   ###
+### boards don't have to re-parse their text files every time they launch     ###
+#--------------------------------------------------------------------------------#
+def loadProject(docroot="",functions=None):
+    # Start from whatever cache we have, or from nothing at all
+    cache = readCache(docroot)
+    entries = cache["entries"]
+    changed = False
+
+    # Each part of the project is cached separately, so only stale parts get re-parsed
+    parts = (
+        ("config", [docroot+"Config.txt", docroot+"QuickReference.txt"], None,
+            lambda: loadConfig(docroot)),
+        ("layout", [findDatafile(docroot+"Layout")], None,
+            lambda: loadLayout(docroot)),
+        ("hotkeys", [findDatafile(docroot+"Hotkeys")], sorted(functions or []),
+            lambda: loadHotkeys(docroot,functions=functions)),
+        )
+    for name, sources, extra, parser in parts:
+        entry = entries.get(name)
+        previous = entry["sources"] if entry and entry["extra"] == extra else None
+        signatures = sourceSignatures(sources, previous)
+        # Only re-parse this part if the contents of one of its files have changed
+        if previous is None or not sameContents(previous, signatures):
+            logger.debug("Parsing %s for %s" % (name, docroot))
+            entries[name] = {"sources": signatures, "extra": extra, "value": parser()}
+            changed = True
+        elif signatures != previous:
+            # The files were touched but their contents are identical, so just remember the new times
+            entry["sources"] = signatures
+            changed = True
+
+    if changed:
+        writeCache(docroot, cache)
+
+    return (entries["config"]["value"], entries["layout"]["value"], entries["hotkeys"]["value"])
+
+# Build (path, mtime, size, hash) signatures, only hashing files whose time or size has changed
+def sourceSignatures(sources, previous=None):
+    signatures = []
+    for idx, path in enumerate(sources):
+        old = previous[idx] if previous and idx < len(previous) else None
+        try:
+            stat = os.stat(path)
+        except(OSError):
+            # A missing optional file (like QuickReference) is a valid state too
+            signatures.append( (path, None, None, None) )
+            continue
+        if old and old[:3] == (path, stat.st_mtime, stat.st_size):
+            signatures.append(old)
+        else:
+            with open(path, "rb") as f:
+                signatures.append( (path, stat.st_mtime, stat.st_size, hashlib.md5(f.read()).hexdigest()) )
+    return signatures
+
+# Two lists of signatures describe the same contents if their paths and hashes all match
+def sameContents(old, new):
+    if len(old) != len(new):
+        return False
+    for a, b in zip(old, new):
+        if a[0] != b[0] or a[3] != b[3]:
+            return False
+    return True
+
+# Read the compiled cache for a project in a single pass, or return an empty one
+def readCache(docroot=""):
+    try:
+        with open(os.path.join(docroot, cacheDir, cacheFile), "rb") as f:
+            cache = pickle.load(f)
+        if cache.get("version") == cacheVersion:
+            return cache
+    except(IOError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+        pass
+    return {"version": cacheVersion, "entries": {}}
+
+# Write the compiled cache, being careful not to leave a half-written file behind
+def writeCache(docroot, cache):
+    path = os.path.join(docroot, cacheDir, cacheFile)
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path+".tmp", "wb") as f:
+            pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+        # Windows won't rename over an existing file
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(path+".tmp", path)
+    except(IOError, OSError):
+        logger.warn("  ! Warning: unable to write layout cache for %s" % docroot)
+
+# Find the actual file that openDatafile would read for a path with no extension
+def findDatafile(path):
+    if path[-4:] in [".csv",".txt"]:
+        return path
+    if os.path.isfile(path+'.csv'):
+        return path+'.csv'
+    return path+'.txt'
+
 # This is a common function for opening a file, either csv or txt
 def openDatafile(path):
 
@@ -331,6 +601,10 @@ def openDatafile(path):
     f.close()
 
 
-# This module should not be run independently 
+# This module should not be run independently, except to benchmark the parser
 if __name__ == "__main__":
-    logger.debug("Whatchoo want?!")
\ No newline at end of file
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        benchmark(*[int(arg) for arg in sys.argv[2:]])
+    else:
+        logger.debug("Whatchoo want?!")
\ No newline at end of file
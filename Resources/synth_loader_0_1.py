@@ -0,0 +1,222 @@
+############
+## This loads cues in the background, so the board is usable right away
+##   Cues are loaded by a few worker threads in priority order (lowest first),
+##   and a cue can be promoted to the front of the line at any time, e.g.
+##   because the operator has just pressed it.
+##   The page prefetcher sits on top of that, decoding the cues on the visible
+##   notebook page and its neighbours whenever the operator changes page.
+##   -- (0.1) Initial version, prioritised background loading and page prefetch
+############
+
+import heapq
+import itertools
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+logger.addHandler( logging.StreamHandler() )
+logger.setLevel(logging.INFO)
+
+# How many cues to load at once
+DEFAULT_WORKERS = 2
+# Promoted cues jump ahead of every normal priority
+PROMOTED = float("-inf")
+
+
+# --------------------------------------------------------
+# A prioritised queue of cues, loaded by a pool of worker threads
+# --------------------------------------------------------
+class CueLoader(object):
+
+    def __init__(self, load, done=None, workers=DEFAULT_WORKERS):
+        # What to do with each cue on a worker thread, and what to do once it's done
+        self.load = load
+        self.done = done or (lambda item: None)
+        # A heap of [priority, order, item] entries; cancelled entries have their item set to None
+        self._heap = []
+        self._entries = {}
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        # Which items are being loaded right now
+        self.loading = set()
+        self._workers = []
+        for idx in range(workers):
+            worker = threading.Thread(target=self._work, name="CueLoader-%d" % idx)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    # Add an item to be loaded, or move it if it's already waiting
+    def submit(self, item, priority=0):
+        with self._cond:
+            self._submit(item, priority)
+
+    # The same, for a caller that already holds the lock
+    def _submit(self, item, priority):
+        entry = self._entries.get(item)
+        if entry is not None:
+            # Never lower an item's priority, it may have been promoted
+            if entry[0] <= priority:
+                return
+            entry[2] = None
+        entry = [priority, next(self._order), item]
+        self._entries[item] = entry
+        heapq.heappush(self._heap, entry)
+        self._cond.notify()
+
+    # Move an item to the front of the queue, returning False if it isn't waiting to load
+    #   (checked under the same lock, so an item that has just finished isn't loaded again)
+    def promote(self, item):
+        with self._cond:
+            if item in self.loading:
+                return True
+            if not item in self._entries:
+                return False
+            self._submit(item, PROMOTED)
+            return True
+
+    # Move an item up if it's still waiting, returning whether it's waiting or loading (checked under the
+    #   same lock, so an item that has just finished isn't queued again)
+    def resubmit(self, item, priority):
+        with self._cond:
+            if item in self.loading:
+                return True
+            if not item in self._entries:
+                return False
+            self._submit(item, priority)
+            return True
+
+    # Whether an item is still waiting or loading
+    def pending(self, item):
+        return item in self._entries or item in self.loading
+
+    # Whether there's nothing left waiting or loading
+    def idle(self):
+        return not self._entries and not self.loading
+
+    # Take an item out of the queue, if it hasn't started loading yet
+    def cancel(self, item):
+        with self._cond:
+            entry = self._entries.pop(item, None)
+            if entry is not None:
+                entry[2] = None
+
+    # Take everything out of the queue
+    def clear(self):
+        with self._cond:
+            for entry in self._entries.values():
+                entry[2] = None
+            self._entries = {}
+            self._heap = []
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                # Skip over cancelled entries, sleeping whenever there's nothing to do
+                while not self._stopped and (not self._heap or self._heap[0][2] is None):
+                    if self._heap:
+                        heapq.heappop(self._heap)
+                    else:
+                        self._cond.wait()
+                if self._stopped:
+                    return
+                item = heapq.heappop(self._heap)[2]
+                del self._entries[item]
+                self.loading.add(item)
+            try:
+                self.load(item)
+            except Exception:
+                logger.exception("  ! Unable to load %s" % item)
+            finally:
+                with self._cond:
+                    self.loading.discard(item)
+            self.done(item)
+
+
+# --------------------------------------------------------
+# Decodes the cues on and around the visible page ahead of time, whenever the page changes
+# --------------------------------------------------------
+class PagePrefetcher(object):
+
+    def __init__(self, loader, fetch, budget=None, neighbours=1):
+        # The background loader: cues still waiting there are moved up rather than fetched twice
+        self.loader = loader
+        # fetch(item) decodes an item's sounds, returning how many bytes that added to the cache
+        self.fetch = fetch
+        # The most to decode after each page change, in bytes (None for no limit)
+        self.budget = budget
+        # How many pages either side of the visible one to fetch
+        self.neighbours = neighbours
+        # Whether the sounds were ready when their cue was triggered, for tuning
+        self.hits = 0
+        self.misses = 0
+        # What's been decoded since the page last changed, which the fetching thread adds to while the GUI
+        #   thread starts it again; each page change is a new generation, so late fetches aren't counted
+        self._spent = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._queue = CueLoader(self._fetch, workers=1)
+
+    # The visible page has changed: pages is a list of the items on each page, in tab order
+    def pageChanged(self, pages, current):
+        # Anything we were fetching for the previous page is no longer relevant
+        self._queue.clear()
+        with self._lock:
+            self._spent = 0
+            self._generation += 1
+        if current < 0 or current >= len(pages):
+            return
+        # The visible page first, then its neighbours working outwards
+        order = [current]
+        for distance in range(1, self.neighbours+1):
+            order += [position for position in (current+distance, current-distance) if 0 <= position < len(pages)]
+        for rank, position in enumerate(order):
+            for item in pages[position]:
+                # Cues the loader hasn't finished are moved up there, rather than fetched twice
+                if not self.loader.resubmit(item, rank - len(order)):
+                    self._queue.submit(item, rank)
+        logger.debug("Prefetching pages %s" % ", ".join(str(position+1) for position in order))
+
+    def _fetch(self, item):
+        # Stop once this page change has used up its budget
+        with self._lock:
+            if self.budget is not None and self._spent >= self.budget:
+                return
+            generation = self._generation
+        added = self.fetch(item)
+        with self._lock:
+            if generation == self._generation:
+                self._spent += added
+
+    # Keep score of a triggered cue
+    def record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    # The share of triggered cues whose sounds were ready, or None if nothing has been triggered
+    def hitRate(self):
+        total = self.hits + self.misses
+        if not total:
+            return None
+        return float(self.hits) / total
+
+    # A friendly description of the hit/miss counters
+    def describe(self):
+        rate = self.hitRate()
+        if rate is None:
+            return "Prefetch: no cues triggered"
+        return "Prefetch: %d hits, %d misses (%.0f%%)" % (self.hits, self.misses, rate * 100)
+
+    def stop(self):
+        self._queue.stop()
@@ -0,0 +1,456 @@
+############
+## This keeps track of the media files in a project's mode directories
+##   Every mode directory is scanned once, building a table of the size
+##   and modification time of every file, so the board never has to stat
+##   files one at a time. The layout is then checked against that table,
+##   reporting missing, empty and unsupported files for every mode at once.
+##   The duration, sample rate, channels and codec of each file are read from
+##   its headers without decoding it (MP3s from their first frame, and any
+##   Xing or VBRI header in it), and kept in a persistent index, along with
+##   the content hash the sound cache shares identical files by, so a file is
+##   only read in full again once it has changed.
+##   -- (0.1) Initial version, single-pass scan and layout validation; header metadata index
+############
+
+import os
+import sys
+import stat
+import struct
+import threading
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import synth_layout_0_92 as synth_layout
+import synth_cache_0_1 as synth_cache
+
+# os.scandir is much faster than listdir+stat, but older Pythons need the backport (or neither)
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+import logging
+logger = logging.getLogger(__name__)
+logger.addHandler( logging.StreamHandler() )
+logger.setLevel(logging.INFO)
+
+# Which file types each playback handler can cope with
+supportedFormats = {
+    "pygame": (".ogg", ".wav"),
+    "numpy": (".ogg", ".wav"),
+    "vlc": (".ogg", ".wav", ".mp3", ".aif", ".aiff", ".flac", ".m4a"),
+}
+
+# The list of every file in a directory (and its sub-directories) as (path, size, mtime)
+def scanDirectory(folder):
+    files = []
+    folders = [folder]
+    while folders:
+        current = folders.pop()
+        try:
+            if scandir:
+                for entry in scandir(current):
+                    if entry.is_dir():
+                        folders.append(entry.path)
+                    elif entry.is_file():
+                        entryStat = entry.stat()
+                        files.append( (entry.path, entryStat.st_size, entryStat.st_mtime) )
+            else:
+                for name in os.listdir(current):
+                    path = os.path.join(current, name)
+                    entryStat = os.stat(path)
+                    if stat.S_ISDIR(entryStat.st_mode):
+                        folders.append(path)
+                    elif stat.S_ISREG(entryStat.st_mode):
+                        files.append( (path, entryStat.st_size, entryStat.st_mtime) )
+        except(OSError):
+            continue
+    return files
+
+
+# --------------------------------------------------------
+# A table of every file in a project's mode directories
+# --------------------------------------------------------
+class MediaTable(object):
+
+    def __init__(self, projectroot, modes):
+        self.projectroot = projectroot
+        self.modes = modes
+        # Normalised path -> (size, mtime)
+        self.stats = {}
+        for mode in modes:
+            for path, size, mtime in scanDirectory(projectroot+mode):
+                self.stats[self.key(path)] = (size, mtime)
+
+    # All lookups go through the same normalised form of a path
+    def key(self, path):
+        return os.path.normcase(os.path.normpath(path))
+
+    # The full path of a layout file in a given mode, built the same way the buttons build it
+    def path(self, mode, source):
+        return self.projectroot+mode+"/"+source
+
+    # The (size, mtime) of a file, or None if it doesn't exist
+    def stat(self, path):
+        return self.stats.get(self.key(path))
+
+    def exists(self, path):
+        return self.key(path) in self.stats
+
+    # Whether a file exists and has something in it
+    def playable(self, path):
+        fileStat = self.stats.get(self.key(path))
+        return bool(fileStat and fileStat[0] > 0)
+
+    # Update the table for a file that has changed on disk
+    def refresh(self, path):
+        try:
+            fileStat = os.stat(path)
+        except(OSError):
+            self.stats.pop(self.key(path), None)
+            return
+        if stat.S_ISREG(fileStat.st_mode):
+            self.stats[self.key(path)] = (fileStat.st_size, fileStat.st_mtime)
+
+    # Check every file in a layout against the table, for every mode
+    #   Returns a list of (mode, button name, file, problem) tuples
+    def validate(self, index, playback="pygame"):
+        formats = supportedFormats.get(playback, ())
+        problems = []
+        for mode in self.modes:
+            for buttoncode in index:
+                files = list(buttoncode['src'])
+                if buttoncode['loopFile']:
+                    files.append(buttoncode['loopFile'])
+                for source in files:
+                    fileStat = self.stat(self.path(mode, source))
+                    if fileStat is None:
+                        problems.append( (mode, buttoncode['name'], source, "missing") )
+                    elif fileStat[0] == 0:
+                        problems.append( (mode, buttoncode['name'], source, "empty") )
+                    elif formats and not os.path.splitext(source)[1].lower() in formats:
+                        problems.append( (mode, buttoncode['name'], source, "unsupported") )
+        return problems
+
+
+# Write a validation report to the log, grouped by mode
+def reportProblems(problems):
+    if not problems:
+        logger.info("All media files found and valid")
+        return
+    for mode in sorted(set(problem[0] for problem in problems)):
+        modeProblems = [problem for problem in problems if problem[0] == mode]
+        logger.warn("  ! Warning: %d media problems in mode '%s'" % (len(modeProblems), mode))
+        for problem in modeProblems:
+            logger.warn("      %s file %s (%s)" % (problem[3], problem[2], problem[1]))
+
+
+#--------------------------------------------------------------------------------#
+### These methods read a file's duration and format from its headers alone,    ###
+### so the board never has to decode a sound just to find out how long it is   ###
+#--------------------------------------------------------------------------------#
+
+# The metadata index lives in the project's cache folder
+metadataFile = "metadata.cache"
+# Bump this whenever the probes change what they find
+metadataVersion = 2
+# How much of the end of an OGG file to search for its last page
+OGG_TAIL = 65536
+# How much of an MP3 to read after its ID3 tag, to find the first frame and any Xing or VBRI header in it
+MP3_HEAD = 16384
+
+# MP3 bitrates in kbps, by (MPEG-1?, layer)
+mp3Bitrates = {
+    (True, 1): (0,32,64,96,128,160,192,224,256,288,320,352,384,416,448),
+    (True, 2): (0,32,48,56,64,80,96,112,128,160,192,224,256,320,384),
+    (True, 3): (0,32,40,48,56,64,80,96,112,128,160,192,224,256,320),
+    (False, 1): (0,32,48,56,64,80,96,112,128,144,160,176,192,224,256),
+    (False, 2): (0,8,16,24,32,40,48,56,64,80,96,112,128,144,160),
+    (False, 3): (0,8,16,24,32,40,48,56,64,80,96,112,128,144,160),
+}
+# MP3 sample rates, by MPEG version bits (1 is reserved)
+mp3Rates = {3: (44100,48000,32000), 2: (22050,24000,16000), 0: (11025,12000,8000)}
+
+# A metadata record, as stored in the index
+def mediaInfo(duration, rate, channels, codec):
+    return {"duration": duration, "rate": rate, "channels": channels, "codec": codec}
+
+# RIFF WAVE: the fmt chunk has the format, and the size of the data chunk gives the duration
+def probeWav(f, size):
+    f.seek(12)
+    fmt = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        chunkId, chunkSize = struct.unpack("<4sI", header)
+        if chunkId == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", f.read(16))
+            f.seek(chunkSize - 16 + (chunkSize & 1), 1)
+        elif chunkId == b"data":
+            if fmt is None:
+                return None
+            audioFormat, channels, rate, byteRate, blockAlign, bits = fmt
+            # Streamed files may not know their own length, so trust the file size over the header
+            dataSize = min(chunkSize, size - f.tell())
+            codec = {1: "pcm", 3: "float", 0xFFFE: "pcm"}.get(audioFormat, "wav-%d" % audioFormat)
+            return mediaInfo(float(dataSize) / byteRate if byteRate else None, rate, channels, codec)
+        else:
+            f.seek(chunkSize + (chunkSize & 1), 1)
+
+# An 80-bit IEEE extended float, as AIFF stores its sample rate
+def extendedFloat(data):
+    exponent, mantissa = struct.unpack(">HQ", data)
+    sign = exponent & 0x8000
+    exponent &= 0x7FFF
+    if exponent == 0 and mantissa == 0:
+        return 0.0
+    value = mantissa * 2.0 ** (exponent - 16383 - 63)
+    return -value if sign else value
+
+# AIFF/AIFC: the COMM chunk has everything, including the number of frames
+def probeAiff(f, size):
+    f.seek(12)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        chunkId, chunkSize = struct.unpack(">4sI", header)
+        if chunkId == b"COMM":
+            comm = f.read(chunkSize)
+            channels, frames, bits = struct.unpack(">hIh", comm[:8])
+            rate = extendedFloat(comm[8:18])
+            codec = "pcm"
+            # AIFC names its compression type after the rate
+            if len(comm) >= 22 and comm[18:22] not in (b"NONE", b"sowt"):
+                codec = comm[18:22].decode("latin-1").strip().lower()
+            return mediaInfo(float(frames) / rate if rate else None, int(rate), channels, codec)
+        f.seek(chunkSize + (chunkSize & 1), 1)
+
+# OGG: the first page says what codec and rate, and the granule position of the last page is the length
+def probeOgg(f, size):
+    f.seek(0)
+    page = f.read(282)
+    segments = struct.unpack("<B", page[26:27])[0]
+    packet = page[27+segments:]
+    if packet[:7] == b"\x01vorbis":
+        channels, rate = struct.unpack("<BI", packet[11:16])
+        codec, skip, granuleRate = "vorbis", 0, rate
+    elif packet[:8] == b"OpusHead":
+        channels, skip, rate = struct.unpack("<BHI", packet[9:16])
+        # Opus always counts in 48kHz samples, whatever the input rate was
+        codec, granuleRate = "opus", 48000
+    else:
+        return mediaInfo(None, None, None, "ogg")
+    f.seek(max(0, size - OGG_TAIL))
+    tail = f.read(OGG_TAIL)
+    position = tail.rfind(b"OggS")
+    while position >= 0:
+        granule = struct.unpack("<q", tail[position+6:position+14])[0]
+        # A page with no packet ending on it has a granule of -1, so look further back
+        if granule >= 0:
+            return mediaInfo(float(max(0, granule - skip)) / granuleRate, rate, channels, codec)
+        position = tail.rfind(b"OggS", 0, position)
+    return mediaInfo(None, rate, channels, codec)
+
+# FLAC: the STREAMINFO block has the rate, channels and total number of samples
+def probeFlac(f, size):
+    f.seek(4)
+    header = f.read(4)
+    if struct.unpack("<B", header[:1])[0] & 0x7F != 0:
+        return None
+    info = f.read(34)
+    packed = struct.unpack(">Q", info[10:18])[0]
+    rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    samples = packed & 0xFFFFFFFFF
+    return mediaInfo(float(samples) / rate if rate and samples else None, rate, channels, "flac")
+
+# An MP3 frame header's (rate, channels, samples, length in bytes, bitrate, MPEG-1?), or None if it isn't one
+def mp3Frame(data):
+    header = struct.unpack(">I", data)[0]
+    version = (header >> 19) & 0x3
+    layer = 4 - ((header >> 17) & 0x3)
+    bitrateIndex = (header >> 12) & 0xF
+    rateIndex = (header >> 10) & 0x3
+    if (header >> 21) != 0x7FF or version == 1 or layer == 4 or bitrateIndex in (0, 15) or rateIndex == 3:
+        return None
+    mpeg1 = version == 3
+    rate = mp3Rates[version][rateIndex]
+    bitrate = mp3Bitrates[(mpeg1, layer)][bitrateIndex] * 1000
+    padding = (header >> 9) & 0x1
+    channels = 1 if ((header >> 6) & 0x3) == 3 else 2
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // rate + padding) * 4
+    else:
+        samples = 1152 if (mpeg1 or layer == 2) else 576
+        length = samples // 8 * bitrate // rate + padding
+    return rate, channels, samples, length, bitrate, mpeg1
+
+# MP3: skip any ID3 tag and find the first frame; a VBR file says how many frames it has in a Xing (or Info)
+#   or VBRI header inside that frame, and the length of any other follows from its size and bitrate
+def probeMp3(f, size):
+    f.seek(0)
+    tag = f.read(10)
+    start = 0
+    if tag[:3] == b"ID3":
+        for byte in struct.unpack("4B", tag[6:10]):
+            start = (start << 7) | (byte & 0x7F)
+        # The tag's header, and its footer if it has one
+        start += 20 if struct.unpack("B", tag[5:6])[0] & 0x10 else 10
+    f.seek(start)
+    data = f.read(MP3_HEAD)
+    # An ID3v1 tag on the end isn't audio either
+    end = size
+    if size - start >= 128:
+        f.seek(size - 128)
+        if f.read(3) == b"TAG":
+            end -= 128
+    position = data.find(b"\xff")
+    while 0 <= position and position + 4 <= len(data):
+        frame = mp3Frame(data[position:position+4])
+        # A real frame is followed by another one (if we can see that far), which a stray sync word rarely is
+        if frame:
+            following = position + frame[3]
+            if following + 4 > len(data) or mp3Frame(data[following:following+4]):
+                break
+        position = data.find(b"\xff", position + 1)
+    else:
+        return None
+    rate, channels, samples, length, bitrate, mpeg1 = frame
+    frames = None
+    # The Xing header follows the side information, which is a different size for each version and channel count
+    xing = position + 4 + ((32 if channels == 2 else 17) if mpeg1 else (17 if channels == 2 else 9))
+    if data[xing:xing+4] in (b"Xing", b"Info"):
+        if struct.unpack(">I", data[xing+4:xing+8])[0] & 0x1:
+            frames = struct.unpack(">I", data[xing+8:xing+12])[0]
+    elif data[position+36:position+40] == b"VBRI":
+        frames = struct.unpack(">I", data[position+50:position+54])[0]
+    if frames is not None:
+        return mediaInfo(float(frames) * samples / rate, rate, channels, "mp3")
+    return mediaInfo(float(end - start - position) * 8 / bitrate, rate, channels, "mp3")
+
+# Read a file's metadata from its headers, or None if it can't be worked out
+def probeFile(path):
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            magic = f.read(12)
+            if magic[:4] == b"RIFF" and magic[8:12] == b"WAVE":
+                return probeWav(f, size)
+            elif magic[:4] == b"FORM" and magic[8:12] in (b"AIFF", b"AIFC"):
+                return probeAiff(f, size)
+            elif magic[:4] == b"OggS":
+                return probeOgg(f, size)
+            elif magic[:4] == b"fLaC":
+                return probeFlac(f, size)
+            elif magic[:3] == b"ID3" or os.path.splitext(path)[1].lower() == ".mp3":
+                return probeMp3(f, size)
+    except(IOError, OSError, struct.error, KeyError, ZeroDivisionError):
+        logger.debug("Unable to read the headers of %s" % path)
+    return None
+
+
+# --------------------------------------------------------
+# A persistent index of the metadata of every file in a MediaTable
+# --------------------------------------------------------
+class MetadataIndex(object):
+
+    def __init__(self, projectroot, table):
+        self.path = os.path.join(projectroot, synth_layout.cacheDir, metadataFile)
+        self.table = table
+        # Normalised path -> ((size, mtime), metadata), and normalised path -> ((size, mtime), content hash)
+        self.entries = {}
+        self.digests = {}
+        self.changed = False
+        # The loader's threads index files while the board looks up durations
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "rb") as f:
+                index = pickle.load(f)
+            if index.get("version") == metadataVersion:
+                self.entries = index["entries"]
+                self.digests = index.get("digests", {})
+        except(IOError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+            pass
+
+    # The metadata of a file, probing it only if it's new or has changed since it was indexed
+    def info(self, path):
+        fileStat = self.table.stat(path)
+        if fileStat is None:
+            return None
+        key = self.table.key(path)
+        entry = self.entries.get(key)
+        if entry and entry[0] == fileStat:
+            return entry[1]
+        info = probeFile(path)
+        with self._lock:
+            self.entries[key] = (fileStat, info)
+            self.changed = True
+        return info
+
+    # The duration of a file in seconds, or None if it isn't known
+    def duration(self, path):
+        info = self.info(path)
+        return info["duration"] if info else None
+
+    # The content hash of a file for the sound cache, hashing it only if it's new or has changed since it was hashed
+    def digest(self, path):
+        fileStat = self.table.stat(path)
+        if fileStat is None:
+            return synth_cache.fileDigest(path)
+        key = self.table.key(path)
+        entry = self.digests.get(key)
+        if entry and entry[0] == fileStat:
+            return entry[1]
+        digest = synth_cache.fileDigest(path)
+        with self._lock:
+            self.digests[key] = (fileStat, digest)
+            self.changed = True
+        return digest
+
+    # Make sure every one of a list of files is indexed
+    def update(self, paths):
+        for path in paths:
+            self.info(path)
+
+    # Forget the files that are gone
+    def prune(self):
+        with self._lock:
+            for entries in (self.entries, self.digests):
+                for key in [key for key in entries if not key in self.table.stats]:
+                    del entries[key]
+                    self.changed = True
+
+    # Write the index if anything has changed, being careful not to leave a half-written file behind
+    def save(self):
+        if not self.changed:
+            return
+        with self._lock:
+            entries = dict(self.entries)
+            digests = dict(self.digests)
+            self.changed = False
+        try:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            with open(self.path+".tmp", "wb") as f:
+                pickle.dump({"version": metadataVersion, "entries": entries, "digests": digests}, f, pickle.HIGHEST_PROTOCOL)
+            # Windows won't rename over an existing file
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(self.path+".tmp", self.path)
+        except(IOError, OSError):
+            logger.warn("  ! Warning: unable to write the media metadata index")
+            self.changed = True
+
+
+# Show the metadata of some files, for checking the probes by hand
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        logger.info("%s: %s" % (path, probeFile(path)))
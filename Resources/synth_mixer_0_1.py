@@ -0,0 +1,669 @@
+############
+## This is a software mixer, which mixes every voice on the board with NumPy
+##   A single pygame output channel is fed a stream of blocks, each of which
+##   is the sum of all the active voices in float32. Because everything is
+##   mixed here, starts, stops, fades and loop points land on exact samples
+##   of the engine's clock rather than whenever a timer happens to fire.
+##   Voices behave like pygame.mixer.Channel objects, so the board's Channel
+##   class can drive them the same way it drives pygame.
+##   Each voice is summed on its exclusive group's bus, which has a gain
+##   (that can be ramped), mute and solo; the buses are summed on the master
+##   bus, which goes through a look-ahead limiter instead of clipping.
+##   -- (0.1) Initial version
+############
+
+import threading
+import time
+
+import numpy
+import pygame
+
+import synth_fade_0_1 as synth_fade
+import synth_events_0_1 as synth_events
+
+import logging
+logger = logging.getLogger(__name__)
+logger.addHandler( logging.StreamHandler() )
+logger.setLevel(logging.INFO)
+
+# How many frames are mixed at a time
+DEFAULT_BLOCKSIZE = 1024
+# The pygame channel that the output stream is played through, reserved so nothing else takes it
+OUTPUT_CHANNEL = 0
+# The bus a voice is summed on if it isn't given one, and the name of the master bus
+DEFAULT_BUS = "__any__"
+MASTER_BUS = "__master__"
+# The limiter's defaults: the most the output may peak at in dBFS, how far it looks ahead, and how long
+#   it takes to recover from full gain reduction, in ms
+LIMITER_THRESHOLD = -1.0
+LIMITER_LOOKAHEAD = 5.0
+LIMITER_RELEASE = 250.0
+# How long a bus takes to switch on or off when it's muted or soloed, in frames, so it doesn't click
+BUS_SWITCH = 256
+
+
+# --------------------------------------------------------
+# A decoded sound, as float32 samples of shape (frames, channels)
+# --------------------------------------------------------
+class NumpySound(object):
+
+    def __init__(self, data, rate):
+        self.data = data
+        self.rate = rate
+
+    # Convert a pygame Sound, which is in the mixer's own format
+    @classmethod
+    def fromPygame(cls, sound):
+        frequency, size, channels = pygame.mixer.get_init()
+        return cls(toFloat(pygame.sndarray.array(sound), size, channels), frequency)
+
+    def get_length(self):
+        return float(len(self.data)) / self.rate
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+# Scale integer samples to float32 in -1..1, always as (frames, channels)
+def toFloat(samples, size, channels):
+    data = samples.astype(numpy.float32)
+    if size < 0:
+        data /= float(1 << (abs(size) - 1))
+    elif size in (8, 16):
+        # Unsigned samples are centred on half their range
+        data = data / float(1 << (size - 1)) - 1.0
+    return data.reshape((-1, channels))
+
+# Scale float32 samples back to the mixer's own integer format
+def fromFloat(data, size):
+    if size < 0:
+        return (data * ((1 << (abs(size) - 1)) - 1)).astype("int%d" % abs(size))
+    return ((data + 1.0) * ((1 << (size - 1)) - 1)).astype("uint%d" % size)
+
+
+# --------------------------------------------------------
+# A single voice, with the same methods as a pygame.mixer.Channel
+#   Every time is in frames of the engine's clock; None means "as soon as possible"
+# --------------------------------------------------------
+class Voice(object):
+
+    def __init__(self, engine):
+        self.engine = engine
+        # The sound as it was given to us, and its samples
+        self.media = None
+        self.sound = None
+        self.queued = None
+        self.queuedLoops = 0
+        self.pos = 0
+        self.loops = 0
+        self.volume = 1.0
+        self.paused = False
+        # When to start and stop, on the engine's clock
+        self.startAt = 0
+        self.stopAt = None
+        # A fade is [start position, end position, length in frames, frames done, stop when done?],
+        #   with positions along the fade curve (see synth_fade)
+        self.fade = None
+        self.fadeAt = None
+        self.curve = synth_fade.defaultCurve
+        self.gain = 1.0
+        # Whether the first sample of the sound has been mixed yet
+        self.started = False
+        # The bus the voice is summed on
+        self.bus = DEFAULT_BUS
+
+    # A voice can be started paused, ready to be set running with unpause()
+    def play(self, sound, loops=0, maxtime=0, fade_ms=0, at=None, curve=None, paused=False):
+        with self.engine.lock:
+            self.media = sound
+            self.sound = self.engine.samples(sound)
+            self.queued = None
+            self.pos = 0
+            self.loops = loops or 0
+            self.paused = paused
+            self.startAt = self.engine.frame if at is None else at
+            self.stopAt = self.startAt + self.engine.frames(maxtime) if maxtime else None
+            self.fade = [0.0, 1.0, self.engine.frames(fade_ms), 0, False] if fade_ms else None
+            self.fadeAt = None
+            self.curve = curve or self.curve
+            self.gain = 0.0 if fade_ms else 1.0
+            self.started = False
+            self.engine.activate(self)
+
+    # Play a sound straight after the last sample of the current one; or now, if nothing is playing
+    def queue(self, sound, loops=0):
+        with self.engine.lock:
+            if self.sound is None:
+                self.play(sound, loops)
+            else:
+                self.queued = sound
+                self.queuedLoops = loops or 0
+
+    def stop(self, at=None):
+        with self.engine.lock:
+            if at is None:
+                self.sound = None
+                self.queued = None
+                self.engine.deactivate(self)
+            else:
+                self.stopAt = at
+
+    # Fade out to silence over a time in ms, then stop
+    def fadeout(self, time, at=None, curve=None):
+        with self.engine.lock:
+            if not time:
+                self.stop(at)
+                return
+            self.curve = curve or self.curve
+            self.fade = [float(synth_fade.curves[self.curve][1](self.gain)), 0.0, self.engine.frames(time), 0, True]
+            self.fadeAt = at
+
+    # Give a fade that is under way (or only a rising or falling one) a new length in ms, carrying on from where it has got to
+    def retarget(self, time, rising=None):
+        with self.engine.lock:
+            fade = self.fade
+            if fade is None or (rising is not None and (fade[1] > fade[0]) != rising):
+                return
+            progress = min(1.0, float(fade[3]) / max(1, fade[2]))
+            fade[0] += (fade[1] - fade[0]) * progress
+            fade[2] = int(round(self.engine.frames(time) * (1.0 - progress)))
+            fade[3] = 0
+
+    def pause(self):
+        self.paused = True
+
+    # Carry on, from a frame on the engine's clock if one is given (a voice that was started paused starts there)
+    def unpause(self, at=None):
+        with self.engine.lock:
+            if at is not None and not self.started:
+                self.startAt = at
+            self.paused = False
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+    def get_volume(self):
+        return self.volume
+
+    def get_busy(self):
+        return self.sound is not None
+
+    def get_sound(self):
+        return self.media if self.sound is not None else None
+
+    def get_queue(self):
+        return self.queued
+
+    # How far into the current sound we are, in ms
+    def get_pos(self):
+        return int(self.pos * 1000 / self.engine.rate)
+
+    # Whether a fade has been set for later, and its moment hasn't come yet
+    def _fadeWaiting(self, here):
+        return self.fadeAt is not None and self.fadeAt > here
+
+    # The gain for each of the next count frames, as a column to multiply samples by
+    def _gains(self, count, here):
+        fade = self.fade
+        if fade is None or self._fadeWaiting(here):
+            return self.gain * self.volume
+        start, end, length, done = fade[:4]
+        steps = numpy.minimum(numpy.arange(done + 1, done + count + 1, dtype=numpy.float32), length) / max(1, length)
+        gains = synth_fade.curves[self.curve][0](start + (end - start) * steps).astype(numpy.float32).reshape((-1, 1))
+        fade[3] = done + count
+        self.gain = float(gains[-1, 0])
+        return gains * self.volume
+
+    # Add this voice into an output block starting at frame now, returning False once it has finished
+    #   What happens along the way is reported through the engine's events
+    def mix(self, out, now):
+        if self.paused:
+            return True
+        playing = self.sound is not None
+        frames = len(out)
+        offset = max(0, self.startAt - now)
+        while offset < frames and self.sound is not None:
+            if not len(self.sound):
+                self.sound = None
+                break
+            here = now + offset
+            count = min(frames - offset, len(self.sound) - self.pos)
+            if self.stopAt is not None:
+                count = min(count, self.stopAt - here)
+            # Changes of gain land on their exact frame: the start of a fade, and the end of a fade-out
+            if self.fade:
+                if self._fadeWaiting(here):
+                    count = min(count, self.fadeAt - here)
+                elif self.fade[4]:
+                    count = min(count, self.fade[2] - self.fade[3])
+            if count > 0:
+                if not self.started:
+                    self.started = True
+                    self.engine.event(synth_events.STARTED, self)
+                out[offset:offset+count] += self.sound[self.pos:self.pos+count] * self._gains(count, here)
+                self.pos += count
+                offset += count
+                here += count
+            # Stopped, or faded all the way out
+            if self.stopAt is not None and here >= self.stopAt:
+                self.sound = None
+                break
+            if self.fade and self.fade[3] >= self.fade[2] and not self._fadeWaiting(here):
+                self.engine.event(synth_events.FADED, self)
+                if self.fade[4]:
+                    self.sound = None
+                    break
+                self.fade = None
+            # The end of the sound: loop it, move on to the queued sound, or finish
+            if self.pos >= len(self.sound):
+                self.pos = 0
+                if self.loops:
+                    if self.loops > 0:
+                        self.loops -= 1
+                    self.engine.event(synth_events.LOOPED, self)
+                elif self.queued is not None:
+                    self.media = self.queued
+                    self.sound = self.engine.samples(self.queued)
+                    self.loops = self.queuedLoops
+                    self.queued = None
+                    self.engine.event(synth_events.LOOPED, self)
+                else:
+                    self.sound = None
+        if self.sound is None:
+            self.queued = None
+            if playing:
+                self.engine.event(synth_events.ENDED, self)
+        return self.sound is not None
+
+
+# --------------------------------------------------------
+# A summing bus, with a gain that can be ramped, mute and solo
+#   Ramps are linear in gain and are in frames of the engine's clock
+# --------------------------------------------------------
+class Bus(object):
+
+    def __init__(self, name, gain=1.0):
+        self.name = name
+        self.gain = gain
+        self.mute = False
+        self.solo = False
+        # The gain the bus is on its way to
+        self.target = gain
+        # [start gain, end gain, length, frames done], or None if the gain is steady
+        self.ramp = None
+        # Whether the bus could be heard in the last block
+        self.audible = True
+
+    # Ramp to a new gain over a number of frames, carrying on from wherever the gain is now
+    def rampTo(self, gain, frames=0):
+        self.target = gain
+        if frames <= 0:
+            self.gain = gain
+            self.ramp = None
+        else:
+            self.ramp = [self.gain, gain, frames, 0]
+
+    # The gain for every frame of the next block, as a column to multiply the block by (or just a number,
+    #   if the gain is steady), or None if the bus can't be heard; this moves any ramp along
+    def gains(self, frames, soloed=False):
+        gains = self.gain
+        if self.ramp:
+            start, end, length, done = self.ramp
+            position = numpy.minimum(1.0, (done + numpy.arange(1, frames + 1)) / float(length))
+            gains = (start + (end - start) * position).astype(numpy.float32).reshape((-1, 1))
+            self.gain = float(gains[-1, 0])
+            if done + frames >= length:
+                self.ramp = None
+            else:
+                self.ramp[3] += frames
+        # Switching on or off is a short ramp of its own
+        audible = not self.mute and (self.solo or not soloed)
+        was, self.audible = self.audible, audible
+        if not audible and not was:
+            return None
+        if audible != was:
+            switch = numpy.minimum(1.0, numpy.arange(1, frames + 1, dtype=numpy.float32) / min(BUS_SWITCH, frames))
+            if not audible:
+                switch = 1.0 - switch
+            gains = gains * switch.reshape((-1, 1))
+        return gains
+
+
+# The least of every run of a number of values, in one pass: each run spans at most two blocks of that many
+#   values, so it's the least of what's left of one block and what's been seen so far of the next
+def slidingMin(values, width):
+    count = len(values) - width + 1
+    padded = numpy.concatenate((values, numpy.full((-len(values)) % width, numpy.inf, values.dtype)))
+    blocks = padded.reshape((-1, width))
+    forward = numpy.minimum.accumulate(blocks, axis=1).reshape(-1)
+    backward = numpy.minimum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1)
+    return numpy.minimum(backward[:count], forward[width - 1:width - 1 + count])
+
+
+# --------------------------------------------------------
+# A look-ahead limiter, which turns the output down just before a peak instead of clipping it
+#   The output is delayed by the look-ahead, so the gain can be on its way down before a peak arrives:
+#   each frame's gain is the least that anything in the look-ahead needs, smoothed over the look-ahead
+#   (which still gets there in time), and recovers no faster than the release
+# --------------------------------------------------------
+class Limiter(object):
+
+    def __init__(self, rate, channels, threshold=LIMITER_THRESHOLD, lookahead=LIMITER_LOOKAHEAD, release=LIMITER_RELEASE):
+        self.threshold = 10 ** (threshold / 20.0)
+        self.lookahead = max(1, int(round(lookahead * rate / 1000.0)))
+        # How much the gain may recover in a frame
+        self.release = 1.0 / max(1.0, release * rate / 1000.0)
+        # What's still to come out, the gains the look-ahead needs, and the released gains being smoothed
+        self._delay = numpy.zeros((self.lookahead, channels), dtype=numpy.float32)
+        self._needs = numpy.ones(self.lookahead, dtype=numpy.float32)
+        self._released = numpy.ones(self.lookahead - 1, dtype=numpy.float32)
+        self._gain = 1.0
+        # The least gain in the last block, for metering
+        self.reduction = 1.0
+
+    def process(self, block):
+        frames = len(block)
+        span = self.lookahead
+        # The block comes out a look-ahead late
+        signal = numpy.concatenate((self._delay, block))
+        self._delay = signal[frames:]
+        delayed = signal[:frames]
+        # The gain each incoming frame needs to stay under the threshold
+        peaks = numpy.abs(block).max(axis=1)
+        # Nothing to do while everything is under the threshold and the gain is all the way back up
+        if self.reduction >= 1.0 and self._gain >= 1.0 and self._needs.min() >= 1.0 and peaks.max() <= self.threshold:
+            return delayed
+        needs = numpy.concatenate((self._needs, numpy.minimum(1.0, self.threshold / numpy.maximum(peaks, 1e-9))))
+        self._needs = needs[frames:]
+        # Hold the least gain needed by anything from each frame to the end of its look-ahead
+        held = slidingMin(needs, span + 1)
+        # Recover no faster than the release: gain[n] = min(held[n], gain[n-1] + release)
+        ramp = self.release * numpy.arange(frames, dtype=numpy.float32)
+        released = numpy.minimum(1.0, ramp + numpy.minimum(self._gain + self.release, numpy.minimum.accumulate(held - ramp)))
+        self._gain = float(released[-1])
+        # Smooth over the look-ahead, so the gain glides down rather than jumps
+        smoothed = numpy.concatenate((self._released, released))
+        self._released = smoothed[frames:]
+        sums = numpy.concatenate(([0.0], numpy.cumsum(smoothed, dtype=numpy.float64)))
+        gains = ((sums[span:] - sums[:-span]) / span).astype(numpy.float32)
+        self.reduction = float(gains.min())
+        return delayed * gains.reshape((-1, 1))
+
+
+# --------------------------------------------------------
+# The engine, which mixes every active voice into a single output stream
+# --------------------------------------------------------
+class NumpyEngine(object):
+
+    def __init__(self, rate, size=-16, channels=2, blocksize=DEFAULT_BLOCKSIZE):
+        self.rate = rate
+        self.size = size
+        self.channels = channels
+        self.blocksize = blocksize
+        # The audio clock: how many frames have been mixed so far
+        self.frame = 0
+        self.active = []
+        self.lock = threading.RLock()
+        # Every group's bus, which are summed on the master bus and then limited (unless the limiter is None)
+        self.buses = {}
+        self.master = Bus(MASTER_BUS)
+        self.limiter = Limiter(rate, channels)
+        # Told listener(kind, voice) about each voice event, once the block it happened in has been mixed
+        self.listener = None
+        self._events = []
+        # How many times the output has run dry, with no block ready behind the one that finished
+        self.underruns = 0
+        self._running = False
+        self._thread = None
+        # The voices pauseAll() paused, which are the only ones resumeAll() starts again (armed voices wait as they were)
+        self._paused = []
+
+    # A new voice, which makes no sound until it is played
+    def voice(self):
+        return Voice(self)
+
+    def activate(self, voice):
+        if not voice in self.active:
+            self.active.append(voice)
+
+    def deactivate(self, voice):
+        if voice in self.active:
+            self.active.remove(voice)
+
+    # Note an event, to be passed on after the current block
+    def event(self, kind, voice):
+        self._events.append((kind, voice))
+
+    # Convert a time in ms to frames
+    def frames(self, ms):
+        return int(round(ms * self.rate / 1000.0))
+
+    # The float32 samples of a sound, which may be a NumpySound or a pygame Sound
+    def samples(self, sound):
+        if isinstance(sound, NumpySound):
+            data = sound.data
+        else:
+            data = toFloat(pygame.sndarray.array(sound), self.size, self.channels)
+        # A mono sound goes to every output channel
+        if data.shape[1] != self.channels:
+            data = numpy.repeat(data[:, :1], self.channels, axis=1)
+        return data
+
+    # A group's bus (or the master bus), which is made the first time it's asked for
+    def bus(self, name):
+        if name == MASTER_BUS:
+            return self.master
+        with self.lock:
+            if not name in self.buses:
+                self.buses[name] = Bus(name)
+            return self.buses[name]
+
+    # Whether any voice is playing
+    def busy(self):
+        return bool(self.active)
+
+    # Mix the next block of frames, advancing the clock
+    def render(self, frames=None):
+        frames = frames or self.blocksize
+        out = numpy.zeros((frames, self.channels), dtype=numpy.float32)
+        with self.lock:
+            # Each voice is summed on its bus
+            mixes = {}
+            for voice in list(self.active):
+                mix = mixes.get(voice.bus)
+                if mix is None:
+                    mix = mixes[voice.bus] = numpy.zeros((frames, self.channels), dtype=numpy.float32)
+                    self.bus(voice.bus)
+                if not voice.mix(mix, self.frame):
+                    self.active.remove(voice)
+            # Then every bus that can be heard on the master bus (the others' ramps still move along)
+            soloed = any(bus.solo for bus in self.buses.values())
+            for name, bus in list(self.buses.items()):
+                gains = bus.gains(frames, soloed)
+                mix = mixes.pop(name, None)
+                if mix is not None and gains is not None:
+                    out += mix * gains
+            gains = self.master.gains(frames)
+            out = out * gains if gains is not None else out * 0.0
+            self.frame += frames
+            events, self._events = self._events, []
+        # Listeners are told outside the lock, so they can play and stop voices
+        if self.listener:
+            for kind, voice in events:
+                self.listener(kind, voice)
+        if self.limiter:
+            out = self.limiter.process(out)
+        return numpy.clip(out, -1.0, 1.0, out)
+
+    # Start streaming into the reserved pygame channel
+    def start(self):
+        pygame.mixer.set_reserved(OUTPUT_CHANNEL + 1)
+        self.output = pygame.mixer.Channel(OUTPUT_CHANNEL)
+        self._running = True
+        self._thread = threading.Thread(target=self._feed, name="NumpyEngine")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _feed(self):
+        blockTime = float(self.blocksize) / self.rate
+        started = False
+        while self._running:
+            # Keep one block playing and one queued behind it
+            if self.output.get_queue() is None:
+                if started and not self.output.get_busy():
+                    self.underruns += 1
+                started = True
+                block = fromFloat(self.render(), self.size)
+                if self.channels == 1:
+                    block = block.reshape(-1)
+                sound = pygame.sndarray.make_sound(block)
+                if self.output.get_busy():
+                    self.output.queue(sound)
+                else:
+                    self.output.play(sound)
+            else:
+                time.sleep(blockTime / 4)
+
+    # Give the fades under way a new length in ms
+    def retarget(self, time, rising=None):
+        with self.lock:
+            for voice in self.active:
+                voice.retarget(time, rising)
+
+    # Pause every voice that's playing, and carry on with them again
+    def pauseAll(self):
+        with self.lock:
+            self._paused = [voice for voice in self.active if not voice.paused]
+            for voice in self._paused:
+                voice.pause()
+
+    def resumeAll(self):
+        with self.lock:
+            for voice in self._paused:
+                voice.unpause()
+            self._paused = []
+
+    # Stop every voice
+    def stopAll(self):
+        with self.lock:
+            for voice in list(self.active):
+                voice.stop()
+
+    def close(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(1)
+
+
+# Push bursts far over the threshold through the limiter, and check that nothing gets past it, that it
+#   recovers in the quiet afterwards, and that everything else just comes out a look-ahead late
+def testLimiter(rate=44100, blocksize=1000):
+    limiter = Limiter(rate, 2)
+    signal = 0.2 * numpy.sin(2 * numpy.pi * 441.0 * numpy.arange(rate * 2) / rate).astype(numpy.float32)
+    signal = numpy.repeat(signal.reshape((-1, 1)), 2, axis=1)
+    signal[20000:20100] *= 20
+    signal[40000:50000] *= 6
+    out = numpy.concatenate([limiter.process(signal[start:start+blocksize]) for start in range(0, len(signal), blocksize)])
+    delay = limiter.lookahead
+    assert numpy.abs(out).max() <= limiter.threshold + 1e-6, "the limiter let a peak through"
+    assert numpy.allclose(out[delay:20000], signal[:20000-delay]), "the limiter changed a signal under its threshold"
+    assert numpy.allclose(out[-10000:], signal[-10000-delay:-delay]), "the limiter didn't recover"
+    logger.info("Limited peaks of %.1f to %.3f, %.1f ms late" % (numpy.abs(signal).max(), numpy.abs(out).max(), 1000.0 * delay / rate))
+
+
+# Render a loop intro and its loop offline, and check that the handoff has no gap, overlap or click
+#   The intro and loop are cut from one continuous sine wave, so the output must match it exactly
+def testLoopHandoff(rate=44100, blocksize=DEFAULT_BLOCKSIZE, introFrames=10007, loopFrames=4400, passes=3):
+    engine = NumpyEngine(rate, -16, 2, blocksize)
+    # The limiter delays the output by its look-ahead, so compare what goes into it
+    engine.limiter = None
+    # 441Hz is exactly 100 frames per cycle, and the loop is a whole number of cycles long
+    wave = 0.5 * numpy.sin(2 * numpy.pi * 441.0 * numpy.arange(introFrames + loopFrames * passes) / rate)
+    wave = numpy.repeat(wave.astype(numpy.float32).reshape((-1, 1)), 2, axis=1)
+    voice = engine.voice()
+    voice.play(NumpySound(wave[:introFrames], rate))
+    voice.queue(NumpySound(wave[introFrames:introFrames+loopFrames], rate), loops=-1)
+    blocks = []
+    while engine.frame < len(wave):
+        blocks.append(engine.render())
+    out = numpy.concatenate(blocks)[:len(wave)]
+    # Anything missing, doubled or out of place shows up as a difference from the original wave
+    error = float(numpy.abs(out - wave).max())
+    # And a click shows up as a jump between neighbouring samples bigger than the wave ever makes
+    jump = float(numpy.abs(numpy.diff(out[:, 0])).max())
+    limit = float(numpy.abs(numpy.diff(wave[:, 0])).max()) + 1e-6
+    logger.info("Loop handoff at frame %d: max error %g, max step %g (limit %g)" % (introFrames, error, jump, limit))
+    assert error < 1e-6, "the loop doesn't follow the intro exactly"
+    assert jump <= limit, "there is a discontinuity at the handoff"
+    return error
+
+
+# Time how long it takes from unlocking the board to the first sample of its queued cues, with the cues
+#   started at unlock or armed while locked. The engine is rendered against the wall clock, as the output
+#   stream would be, and each block is heard once the block ahead of it has played
+def benchmarkUnlock(rate=44100, blocksize=DEFAULT_BLOCKSIZE, cues=8, trials=20, fade_ms=0):
+    import random
+    blockTime = float(blocksize) / rate
+    sounds = [NumpySound(numpy.full((rate, 2), 0.1, numpy.float32), rate) for n in range(cues)]
+    results = {}
+    for armed in (False, True):
+        latencies = []
+        spreads = []
+        for trial in range(trials):
+            engine = NumpyEngine(rate, -16, 2, blocksize)
+            voices = [engine.voice() for sound in sounds]
+            if armed:
+                for voice, sound in zip(voices, sounds):
+                    voice.play(sound, fade_ms=fade_ms, paused=True)
+            # When each cue's first sample was mixed, and when the first of them was heard
+            startFrames = []
+            heard = []
+            engine.listener = lambda kind, voice: startFrames.append(engine.frame) if kind == synth_events.STARTED else None
+            running = threading.Event()
+            running.set()
+            def feed():
+                began = time.time()
+                while running.is_set():
+                    wait = began + float(engine.frame) / rate - time.time()
+                    if wait > 0:
+                        time.sleep(wait)
+                    rendered = time.time()
+                    block = engine.render()
+                    sounding = numpy.nonzero(block[:, 0])[0]
+                    if len(sounding) and not heard:
+                        heard.append(rendered + blockTime + float(sounding[0]) / rate)
+            feeder = threading.Thread(target=feed)
+            feeder.start()
+            # Unlock at some random point in a block
+            time.sleep(blockTime * (2 + random.random()))
+            unlocked = time.time()
+            if armed:
+                with engine.lock:
+                    for voice in voices:
+                        voice.unpause()
+            else:
+                for voice, sound in zip(voices, sounds):
+                    voice.play(sound, fade_ms=fade_ms)
+            while len(startFrames) < cues or not heard:
+                time.sleep(blockTime / 4)
+            running.clear()
+            feeder.join()
+            latencies.append((heard[0] - unlocked) * 1000)
+            spreads.append(float(max(startFrames) - min(startFrames)) * 1000 / rate)
+        latencies.sort()
+        results[armed] = (latencies[len(latencies) // 2], latencies[-1], max(spreads))
+        logger.info("%s: unlock to first sample median %.1f ms, worst %.1f ms; the %d cues started up to %.1f ms apart" % (
+            "Armed while locked" if armed else "Started at unlock", results[armed][0], results[armed][1], cues, results[armed][2]))
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "test":
+        testLoopHandoff()
+        testLoopHandoff(blocksize=333, introFrames=333*4)
+        logger.info("Loop handoff is sample-accurate")
+        testLimiter()
+    # python synth_mixer_0_1.py bench [cues]
+    elif len(sys.argv) > 1 and sys.argv[1] == "bench":
+        benchmarkUnlock(cues=int(sys.argv[2]) if len(sys.argv) > 2 else 8)
@@ -0,0 +1,162 @@
+############
+## This keeps decoded sounds on disk, so they don't have to be decoded every launch
+##   Each sound is stored as raw PCM in the mixer's output format, in the
+##   project's .synthea/pcm folder, named after a hash of its path, its
+##   modification time and size, and the mixer settings. A later launch
+##   memory-maps that file instead of decoding the source again.
+##   Run this module with a project folder to fill the cache ahead of time:
+##       python synth_pcm_0_1.py Projects/MyBoard
+##   -- (0.1) Initial version, pygame playback only
+############
+
+import os
+import sys
+import mmap
+import hashlib
+import threading
+
+import synth_layout_0_92 as synth_layout
+
+import logging
+logger = logging.getLogger(__name__)
+logger.addHandler( logging.StreamHandler() )
+logger.setLevel(logging.INFO)
+
+# The decoded sounds live in their own folder inside the project's cache folder
+pcmDir = "pcm"
+pcmExtension = ".pcm"
+
+
+# --------------------------------------------------------
+# An on-disk cache of decoded PCM for a single project
+# --------------------------------------------------------
+class PCMCache(object):
+
+    def __init__(self, projectroot, settings):
+        self.folder = os.path.join(projectroot, synth_layout.cacheDir, pcmDir)
+        # The mixer's (frequency, size, channels); PCM decoded for other settings is no use to us
+        self.settings = tuple(settings)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    # The cache file for a source file as it is right now, or None if the source doesn't exist
+    def cachePath(self, path):
+        try:
+            fileStat = os.stat(path)
+        except(OSError):
+            return None
+        key = repr( (os.path.abspath(path), fileStat.st_mtime, fileStat.st_size, self.settings) )
+        return os.path.join(self.folder, hashlib.md5(key.encode("utf-8")).hexdigest() + pcmExtension)
+
+    # Memory-map the decoded PCM for a source file, or return None if it isn't cached
+    def load(self, path):
+        cachePath = self.cachePath(path)
+        try:
+            if cachePath and os.path.getsize(cachePath):
+                with open(cachePath, "rb") as f:
+                    # The map stays valid after the file is closed
+                    raw = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                with self._lock:
+                    self.hits += 1
+                return raw
+        except(IOError, OSError, ValueError):
+            pass
+        with self._lock:
+            self.misses += 1
+        return None
+
+    # Write the decoded PCM for a source file, being careful not to leave a half-written file behind
+    def store(self, path, raw):
+        cachePath = self.cachePath(path)
+        if cachePath is None or not raw:
+            return None
+        # Loader threads may store at the same time, so each gets its own temporary file
+        temp = "%s.%d.tmp" % (cachePath, threading.current_thread().ident)
+        try:
+            if not os.path.isdir(self.folder):
+                os.makedirs(self.folder)
+            with open(temp, "wb") as f:
+                f.write(raw)
+            # Windows won't rename over an existing file
+            if os.path.exists(cachePath):
+                os.remove(cachePath)
+            os.rename(temp, cachePath)
+        except(IOError, OSError):
+            logger.warn("  ! Warning: unable to write decoded sound for %s" % path)
+            return None
+        return cachePath
+
+    # Delete every cache file that isn't in keep, e.g. those for files that have since changed
+    def prune(self, keep):
+        keep = set(os.path.basename(cachePath) for cachePath in keep if cachePath)
+        removed = 0
+        try:
+            names = os.listdir(self.folder)
+        except(OSError):
+            return 0
+        for name in names:
+            if name in keep:
+                continue
+            try:
+                removed += os.path.getsize(os.path.join(self.folder, name))
+                os.remove(os.path.join(self.folder, name))
+            except(OSError):
+                pass
+        return removed
+
+    # How much disk space the cache takes up, in bytes
+    def usage(self):
+        try:
+            return sum(os.path.getsize(os.path.join(self.folder, name)) for name in os.listdir(self.folder))
+        except(OSError):
+            return 0
+
+
+# Decode every sound in every mode of a project into the cache, dropping anything stale
+def fillProject(projectroot):
+    import pygame
+    import synth_media_0_1 as synth_media
+    import synth_audio_0_1 as synth_audio
+
+    if not projectroot.endswith("/"):
+        projectroot += "/"
+    config = synth_layout.loadConfig(projectroot)
+    index = synth_layout.loadLayout(projectroot)
+    # The cache is filled in the same output format the board's mixer opens with, or the board would never find it
+    pygame.mixer.init(**synth_audio.outputSettings(config["sample_rate"], config["block_size"], config["channels"]))
+    cache = PCMCache(projectroot, pygame.mixer.get_init())
+    media = synth_media.MediaTable(projectroot, config["modes"])
+
+    keep = []
+    decoded = 0
+    for mode in config["modes"]:
+        sources = set()
+        for buttoncode in index:
+            sources.update(synth_layout.buttonFiles(buttoncode))
+        for source in sorted(sources):
+            path = media.path(mode, source)
+            if not media.playable(path):
+                continue
+            # Files that are already cached are left alone
+            cachePath = cache.cachePath(path)
+            if not os.path.exists(cachePath):
+                logger.info("Decoding %s" % path)
+                try:
+                    raw = pygame.mixer.Sound(path).get_raw()
+                except(pygame.error):
+                    logger.warn("  ! Warning: unable to decode %s" % path)
+                    continue
+                cache.store(path, raw)
+                decoded += 1
+            keep.append(cachePath)
+
+    removed = cache.prune(keep)
+    logger.info("Decoded %d sounds, %d cached in all (%.0f MB), removed %.0f MB of stale sounds" % (decoded, len(keep), float(cache.usage()) / 1048576, float(removed) / 1048576))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        logger.info("Usage: python %s <project folder>" % sys.argv[0])
+    else:
+        fillProject(sys.argv[1])
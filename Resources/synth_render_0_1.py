@@ -0,0 +1,236 @@
+############
+## This renders a cue script to a WAV file, as fast as it can be mixed
+##   A script is a list of timestamped actions: triggering cues, locking and
+##   unlocking the board, cancelling, changing the fades, and riding the mix
+##   buses (gain, mute and solo). The board is
+##   opened headless on the NumPy mixer with no output stream, and mixed a
+##   block at a time right here, so the mixer's clock is a virtual one that
+##   runs as fast as the CPU allows. Scripted actions land on their exact
+##   sample, and actions the MasterQueue deferred are run between blocks,
+##   a little ahead of time, just as the scheduler's thread would run them.
+##   The peak level, clipping, how hard the limiter worked, and when every
+##   cue started and ended are reported, to catch level and timing problems
+##   without any speakers.
+##   -- (0.1) Initial version
+############
+
+import math
+import os
+import sys
+import time
+import wave
+
+import numpy
+
+# Nothing here needs a window, or a sound card
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import synth_layout_0_92 as synth_layout
+import synth_mixer_0_1 as synth_mixer
+import synth_events_0_1 as synth_events
+import synth_headless_0_1 as synth_headless
+
+import logging
+logger = logging.getLogger(__name__)
+logger.addHandler( logging.StreamHandler() )
+logger.setLevel(logging.INFO)
+
+# How long to let things ring on after the last action, at most, in seconds
+DEFAULT_TAIL = 30.0
+
+
+# Seconds from a script time, as seconds, m:ss or h:mm:ss (with or without fractions)
+def parseTime(text):
+    seconds = 0.0
+    for part in text.strip().split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+# Script time from seconds, as h:mm:ss.ss
+def formatTime(seconds):
+    return "%d:%02d:%05.2f" % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+# Load a cue script, one "time|action|argument" line at a time (or tab delimited, or CSV, like the layout),
+#   returning (seconds, action, argument) in time order
+def loadScript(path):
+    script = []
+    for line in synth_layout.openDatafile(os.path.splitext(path)[0]):
+        try:
+            when = parseTime(line[0])
+        except(ValueError):
+            logger.warn("  ! Warning: %s is not a time, skipping script line" % line[0])
+            continue
+        action = line[1].strip().lower() if len(line) > 1 else ""
+        if not action in Renderer.actions:
+            logger.warn("  ! Warning: %s is not a script action, skipping script line" % action)
+            continue
+        script.append( (when, action, line[2].strip() if len(line) > 2 else "") )
+    # Actions at the same time keep the order they were written in
+    script.sort(key=lambda entry: entry[0])
+    return script
+
+
+# --------------------------------------------------------
+# Plays a script on an offline board, writing the mix out as it goes
+# --------------------------------------------------------
+class Renderer(object):
+
+    # The script actions, each of which is a method called with its argument
+    actions = ("play", "lock", "unlock", "cancel", "cut", "fadetime", "crossfade", "busgain", "mute", "unmute", "solo", "unsolo", "end")
+
+    def __init__(self, master):
+        self.master = master
+        self.frame = master.frame
+        self.engine = master.mixer.engine
+        self.scheduler = self.frame.master_queue.scheduler
+        self.peak = 0.0
+        self.clipped = 0
+        # The least gain the limiter applied
+        self.reduction = 1.0
+        # (seconds, kind, cue name) for every cue that started or ended
+        self.log = []
+        self._blockStart = 0.0
+        self._ended = False
+        master.mixer.events.subscribe(self.playbackEvent, (synth_events.STARTED, synth_events.ENDED))
+
+    # The time on the virtual clock, in seconds
+    def now(self):
+        return float(self.engine.frame) / self.engine.rate
+
+    def playbackEvent(self, kind, channel):
+        self.log.append( (self._blockStart, kind, channel.owner.name if channel.owner else "?") )
+
+    # Mix up to a frame on the virtual clock, running whatever falls due on the way
+    def advance(self, until, out):
+        while self.engine.frame < until:
+            self.scheduler.runDue()
+            self._blockStart = self.now()
+            block = self.engine.render(min(self.engine.blocksize, until - self.engine.frame))
+            # The mixer clips the block, so anything at full scale was (or was about to be) clipped
+            level = numpy.abs(block)
+            self.peak = max(self.peak, float(level.max()))
+            self.clipped += int(numpy.count_nonzero(level >= 1.0))
+            if self.engine.limiter:
+                self.reduction = min(self.reduction, self.engine.limiter.reduction)
+            out.writeframes(synth_mixer.fromFloat(block, self.engine.size).tobytes())
+
+    # Whether anything is left to play, or waiting to
+    def busy(self):
+        return self.engine.busy() or len(self.scheduler) > 0
+
+    def render(self, script, path, tail=DEFAULT_TAIL):
+        out = wave.open(path, "wb")
+        out.setnchannels(self.engine.channels)
+        out.setsampwidth(abs(self.engine.size) // 8)
+        out.setframerate(self.engine.rate)
+        try:
+            for when, action, argument in script:
+                self.advance(int(round(when * self.engine.rate)), out)
+                if self._ended:
+                    break
+                getattr(self, action)(argument)
+            # Let everything ring on, until it's finished or we run out of tail
+            if not self._ended:
+                last = self.engine.frame + int(tail * self.engine.rate)
+                while self.busy() and self.engine.frame < last:
+                    self.advance(min(last, self.engine.frame + self.engine.blocksize), out)
+        finally:
+            out.close()
+        return self.now()
+
+    # The script actions themselves
+    def play(self, name):
+        cue = self.frame.master_buttons.get(name)
+        if cue is None:
+            logger.warn("  ! Warning: there's no cue called %s, at %s" % (name, formatTime(self.now())))
+            return
+        cue.queue()
+
+    def lock(self, argument=None):
+        if not self.frame.locked:
+            self.frame.toggle()
+
+    def unlock(self, argument=None):
+        if self.frame.locked:
+            self.frame.toggle()
+
+    def cancel(self, argument=None):
+        self.frame.cancel()
+
+    def cut(self, argument=None):
+        self.frame.cancel(fadeOut=False)
+
+    # New fade times in seconds, as "out,in" or one time for both, as MyFrame.setFadeTime sets them
+    def fadetime(self, argument):
+        times = [int(float(value) * 1000) for value in argument.split(",")]
+        self.master.fadetime = [times[0], times[-1]]
+        self.master.mixer.retarget_fades(self.master.fadetime[0], self.master.fadetime[1])
+
+    # A new crossfade setting, as "cross" or "wait", then "fade" or "full", as in Config.txt
+    def crossfade(self, argument):
+        settings = argument.split(",")
+        self.master.crossfade = [1 if settings[0] == "cross" else 0, 1 if settings[-1] == "fade" else 0]
+
+    # A bus ramping to a gain, as "group,dB" or "group,dB,seconds" (with SFX for the general effects and MASTER for everything)
+    def busgain(self, argument):
+        settings = argument.split(",")
+        self.master.mixer.set_bus_gain(settings[0].strip(), float(settings[1]), int(float(settings[2]) * 1000) if len(settings) > 2 else 0)
+
+    def mute(self, group):
+        self.master.mixer.set_bus_mute(group, True)
+
+    def unmute(self, group):
+        self.master.mixer.set_bus_mute(group, False)
+
+    def solo(self, group):
+        self.master.mixer.set_bus_solo(group, True)
+
+    def unsolo(self, group):
+        self.master.mixer.set_bus_solo(group, False)
+
+    def end(self, argument=None):
+        self._ended = True
+
+    def close(self):
+        self.master.mixer.events.unsubscribe(self.playbackEvent)
+        self.frame.shutdown()
+        self.master.mixer.close()
+
+
+# Render a script against a project to a WAV file, logging how it went
+def renderScript(projectroot, scriptpath, outpath, tail=DEFAULT_TAIL, showLog=False):
+    master = synth_headless.openBoard(projectroot, offline=True)
+    # Everything is decoded before the show, as the loader would
+    master.frame.preload()
+    renderer = Renderer(master)
+    try:
+        script = loadScript(scriptpath)
+        start = time.time()
+        length = renderer.render(script, outpath, tail)
+        elapsed = time.time() - start
+    finally:
+        renderer.close()
+    if showLog:
+        for when, kind, name in renderer.log:
+            logger.info("%s  %-8s %s" % (formatTime(when), kind, name))
+    peak = 20 * math.log10(renderer.peak) if renderer.peak > 0 else float("-inf")
+    logger.info("Rendered %s of %d actions in %.1f sec (%.0fx realtime): peak %.1f dBFS, %d clipped samples, limited by up to %.1f dB" %
+        (formatTime(length), len(script), elapsed, length / max(elapsed, 1e-9), peak, renderer.clipped, -20 * math.log10(max(renderer.reduction, 1e-5))))
+    return renderer
+
+
+# python synth_render_0_1.py <project folder> <script> <output.wav> [--tail seconds] [--log]
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    showLog = "--log" in args
+    if showLog:
+        args.remove("--log")
+    tail = DEFAULT_TAIL
+    if "--tail" in args:
+        index = args.index("--tail")
+        tail = float(args[index + 1])
+        del args[index:index + 2]
+    if len(args) != 3:
+        sys.exit("Usage: python synth_render_0_1.py <project folder> <script> <output.wav> [--tail seconds] [--log]")
+    renderScript(args[0], args[1], args[2], tail, showLog)
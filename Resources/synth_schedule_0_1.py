@@ -0,0 +1,130 @@
+############
+## This schedules timed actions against the mixer's audio clock
+##   Any number of actions can be waiting at once, in a priority queue ordered
+##   by when they are due. Each one gets a handle it can be cancelled by, and a
+##   tag (e.g. the channel it acts on) so related actions can be cancelled
+##   together. Actions can be fired a little ahead of time and are told the
+##   exact moment they are for, so a mixer that can schedule ahead of itself
+##   (like the NumPy mixer) can land them on the right sample.
+##   -- (0.1) Initial version
+############
+
+import heapq
+import itertools
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+logger.addHandler( logging.StreamHandler() )
+logger.setLevel(logging.INFO)
+
+# The longest the scheduler sleeps before checking the clock again, in seconds
+#   (the audio clock may not run at exactly the same speed as the wall clock)
+MAX_WAIT = 0.05
+
+
+# --------------------------------------------------------
+# A priority queue of timed actions, run on a thread of its own
+# --------------------------------------------------------
+class Scheduler(object):
+
+    def __init__(self, clock, lead=0.0, threaded=True):
+        # clock() is the current time on the audio clock, in seconds
+        self.clock = clock
+        # How far ahead of time to fire actions, in seconds
+        self.lead = lead
+        # A heap of [when, handle, action, args, tag] entries; cancelled entries have their action set to None
+        self._heap = []
+        self._entries = {}
+        self._handles = itertools.count(1)
+        self._cond = threading.Condition()
+        self._stopped = False
+        # Without a thread, whoever drives the clock has to runDue() as it goes (e.g. an offline render)
+        if threaded:
+            self._thread = threading.Thread(target=self._run, name="Scheduler")
+            self._thread.daemon = True
+            self._thread.start()
+
+    # Run action(when, *args) after a delay in ms, returning a handle to cancel it by
+    def schedule(self, delay, action, args=(), tag=None):
+        return self.scheduleAt(self.clock() + delay / 1000.0, action, args, tag)
+
+    # Run action(when, *args) at a time on the audio clock, returning a handle to cancel it by
+    def scheduleAt(self, when, action, args=(), tag=None):
+        with self._cond:
+            handle = next(self._handles)
+            entry = [when, handle, action, args, tag]
+            self._entries[handle] = entry
+            heapq.heappush(self._heap, entry)
+            self._cond.notify()
+        return handle
+
+    # Cancel an action that hasn't run yet, returning whether there was one to cancel
+    def cancel(self, handle):
+        with self._cond:
+            entry = self._entries.pop(handle, None)
+            if entry is None:
+                return False
+            entry[2] = None
+            return True
+
+    # Cancel every waiting action whose tag passes a test (or every action, with no test)
+    def cancelWhere(self, test=None):
+        with self._cond:
+            handles = [handle for handle, entry in self._entries.items() if test is None or test(entry[4])]
+        for handle in handles:
+            self.cancel(handle)
+        return len(handles)
+
+    # The handles of the waiting actions with a given tag (or all of them)
+    def pending(self, tag=None):
+        with self._cond:
+            return [handle for handle, entry in self._entries.items() if tag is None or entry[4] is tag]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    # Run every action that's due by now (less the lead) on the caller's thread, returning how many ran
+    def runDue(self):
+        ran = 0
+        while True:
+            with self._cond:
+                while self._heap and self._heap[0][2] is None:
+                    heapq.heappop(self._heap)
+                if self._stopped or not self._heap or self._heap[0][0] - self.lead > self.clock():
+                    return ran
+                when, handle, action, args, tag = heapq.heappop(self._heap)
+                del self._entries[handle]
+            try:
+                action(when, *args)
+            except Exception:
+                logger.exception("  ! Scheduled action %s failed" % getattr(action, "__name__", action))
+            ran += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Skip over cancelled entries, sleeping until the next one is due
+                while not self._stopped:
+                    if self._heap and self._heap[0][2] is None:
+                        heapq.heappop(self._heap)
+                    elif not self._heap:
+                        self._cond.wait()
+                    else:
+                        wait = self._heap[0][0] - self.lead - self.clock()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(min(wait, MAX_WAIT))
+                if self._stopped:
+                    return
+                when, handle, action, args, tag = heapq.heappop(self._heap)
+                del self._entries[handle]
+            try:
+                action(when, *args)
+            except Exception:
+                logger.exception("  ! Scheduled action %s failed" % getattr(action, "__name__", action))
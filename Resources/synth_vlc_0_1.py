@@ -1,7 +1,213 @@
 # A connector for Synthea playback via VLC
 
+import os
+import sys
+import time
+import resource
+import threading
+
 import vlc
 
+import synth_events_0_1 as synth_events
+
+# How long to wait for a parse that somebody needs the result of, in seconds
+PARSE_TIMEOUT = 5.0
+# How long the benchmark waits for a trigger to start playing, in seconds
+TRIGGER_TIMEOUT = 2.0
+
+
+# Parses media in the background through VLC's own preparser, so nothing waits on disk I/O
+class MediaParser(object):
+
+	def __init__(self, timeout=PARSE_TIMEOUT):
+		self.timeout = timeout
+		self.pending = 0
+		self._lock = threading.Lock()
+
+	# Start parsing a media object and return it straight away; it will be parsed by the time it's needed
+	def parse(self, media):
+		media.synthea_parsed = threading.Event()
+		if media.is_parsed():
+			media.synthea_parsed.set()
+			return media
+		with self._lock:
+			self.pending += 1
+		# The event manager has to live as long as the media does, or its callback goes with it
+		media.synthea_events = media.event_manager()
+		media.synthea_events.event_attach(vlc.EventType.MediaParsedChanged, self._parsed, media)
+		media.parse_async()
+		# It may have finished before we were listening (in which case we get no event)
+		if media.is_parsed():
+			self._parsed(None, media)
+		return media
+
+	# Called back on a VLC thread once a media object has been parsed
+	def _parsed(self, event, media):
+		if media.synthea_parsed.is_set():
+			return
+		media.synthea_parsed.set()
+		with self._lock:
+			self.pending -= 1
+
+	# Wait for a media object to be parsed, returning whether it was
+	def wait(self, media, timeout=None):
+		parsed = getattr(media, "synthea_parsed", None)
+		if parsed is None:
+			return media.is_parsed()
+		return parsed.wait(self.timeout if timeout is None else timeout) or media.is_parsed()
+
+
+# A pool of media players, all made from one VLC instance, so a cue never waits for VLC to start up
+#   Each player calls back its owner when it reaches the end (off VLC's own thread, since VLC can't
+#   be controlled from there), and is reset for the next cue; its owner can also be told when it starts and stops
+class PlayerPool(object):
+
+	def __init__(self, instance=None, size=0):
+		self.instance = instance or vlc.Instance()
+		self.created = 0
+		self._free = []
+		self._lock = threading.Lock()
+		self._prepare = None
+		for n in range(size):
+			self._free.append(self._create())
+
+	def _create(self):
+		player = self.instance.media_player_new()
+		player.synthea_ended = None
+		player.synthea_notify = None
+		# The event manager has to live as long as the player does, or its callback goes with it
+		player.synthea_events = player.event_manager()
+		player.synthea_events.event_attach(vlc.EventType.MediaPlayerEndReached, self._endReached, player)
+		player.synthea_events.event_attach(vlc.EventType.MediaPlayerPlaying, self._changed, player, synth_events.STARTED)
+		player.synthea_events.event_attach(vlc.EventType.MediaPlayerStopped, self._changed, player, synth_events.ENDED)
+		if self._prepare:
+			self._prepare(player)
+		self.created += 1
+		return player
+
+	# Run prepare(player) on every player, the ones waiting now and any made later (e.g. to send their audio somewhere else)
+	def prepare(self, prepare):
+		with self._lock:
+			self._prepare = prepare
+			for player in self._free:
+				prepare(player)
+
+	# A player that nobody else is using, calling ended() (or just resetting itself) when it reaches the end,
+	#   and notify(kind) when it starts or stops playing
+	def acquire(self, ended=None, notify=None):
+		with self._lock:
+			player = self._free.pop() if self._free else None
+		if player is None:
+			player = self._create()
+		player.synthea_ended = ended
+		player.synthea_notify = notify
+		return player
+
+	# Give a player back, for the next cue
+	def release(self, player):
+		player.synthea_ended = None
+		player.synthea_notify = None
+		self.reset(player)
+		with self._lock:
+			self._free.append(player)
+
+	# Ready a player for another cue: stopped, unpaused and at full volume
+	def reset(self, player):
+		player.stop()
+		player.audio_set_volume(100)
+
+	# A new media object from our instance
+	def media(self, mrl):
+		return self.instance.media_new(mrl)
+
+	def _endReached(self, event, player):
+		threading.Timer(0, self._ended, (player,)).start()
+
+	def _changed(self, event, player, kind):
+		if player.synthea_notify:
+			threading.Timer(0, player.synthea_notify, (kind,)).start()
+
+	def _ended(self, player):
+		if player.synthea_ended:
+			player.synthea_ended()
+		else:
+			self.reset(player)
+
+	def __len__(self):
+		return len(self._free)
+
+
+# The resident memory of this process, in KB (or the most it has ever been, where we can't tell)
+def residentKB():
+	try:
+		with open("/proc/self/status") as f:
+			for line in f:
+				if line.startswith("VmRSS:"):
+					return int(line.split()[1])
+	except(IOError):
+		pass
+	usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# macOS reports bytes, Linux reports KB
+	return usage / 1024 if sys.platform == "darwin" else usage
+
+# Wait for a player to start playing, up to the benchmark's timeout
+def waitForPlaying(player, start):
+	while not player.is_playing() and time.time() - start < TRIGGER_TIMEOUT:
+		time.sleep(0.0005)
+
+# Play a file a number of times, returning the time from each trigger until VLC was playing, in ms
+#   The old way made a new instance and player for every cue, and kept them all; an armed player
+#   has opened and buffered the file already, and is paused at the start (as when the board is locked)
+def benchmarkTriggers(path, triggers=1000, pooled=True, armed=False):
+	pool = PlayerPool(size=1) if pooled else None
+	kept = []
+	latencies = []
+	for n in range(triggers):
+		if armed:
+			player = pool.acquire()
+			player.set_media(pool.media(path))
+			player.audio_set_volume(0)
+			player.play()
+			waitForPlaying(player, time.time())
+			player.set_pause(True)
+			player.set_time(0)
+			player.audio_set_volume(100)
+			pausing = time.time()
+			while player.is_playing() and time.time() - pausing < TRIGGER_TIMEOUT:
+				time.sleep(0.0005)
+		start = time.time()
+		if armed:
+			player.set_pause(False)
+		elif pooled:
+			player = pool.acquire()
+			player.set_media(pool.media(path))
+		else:
+			player = vlc.MediaPlayer(vlc.Instance())
+			player.set_media(vlc.Media(path))
+			kept.append(player)
+		if not armed:
+			player.play()
+		waitForPlaying(player, start)
+		latencies.append((time.time() - start) * 1000)
+		if pooled:
+			pool.release(player)
+		else:
+			player.stop()
+	return latencies
+
+def benchmark(path, triggers=1000):
+	results = []
+	for pooled, armed, name in ((False, False, "New player per cue"), (True, False, "Pooled players"), (True, True, "Pooled and armed")):
+		before = residentKB()
+		latencies = sorted(benchmarkTriggers(path, triggers, pooled, armed))
+		grown = residentKB() - before
+		results.append(grown)
+		print "%s: median %.1f ms, 95th percentile %.1f ms, worst %.1f ms, RSS grew %d KB over %d triggers" % (
+			name, latencies[len(latencies) // 2],
+			latencies[int(len(latencies) * 0.95)], latencies[-1], grown, triggers)
+	return results
+
+
 def test():
 
 
@@ -23,4 +229,8 @@ def test():
 
 
 if __name__ == "__main__":
-	test()
\ No newline at end of file
+	# python synth_vlc_0_1.py bench <sound file> [triggers]
+	if len(sys.argv) > 2 and sys.argv[1] == "bench":
+		benchmark(os.path.abspath(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else 1000)
+	else:
+		test()
@@ -0,0 +1,241 @@
+############
+## This watches a project's folders and reports which files have changed
+##   On Linux it listens to inotify, everywhere else it polls the folders.
+##   Bursts of changes (like an editor saving a file, or a batch of audio
+##   being copied in) are collected and reported together once they settle.
+##   -- (0.1) Initial version, inotify with polling fallback
+############
+
+import os
+import sys
+import time
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+
+import logging
+logger = logging.getLogger(__name__)
+logger.addHandler( logging.StreamHandler() )
+logger.setLevel(logging.INFO)
+
+# The inotify events we care about: written, created, deleted or moved in or out
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+watchMask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+# Each event is followed by a null-padded file name of the given length
+eventHeader = struct.Struct("iIII")
+
+# How long to wait for a burst of changes to settle, in seconds
+DEFAULT_DEBOUNCE = 0.5
+# How often to scan folders when inotify isn't available, in seconds
+DEFAULT_INTERVAL = 1.0
+
+# Load inotify from the C library, if this platform has it
+def loadInotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init
+        libc.inotify_add_watch
+    except(OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+# --------------------------------------------------------
+# A background thread that watches some folders and calls back with changed paths
+# --------------------------------------------------------
+class ProjectWatcher(threading.Thread):
+
+    def __init__(self, folders, callback, debounce=DEFAULT_DEBOUNCE, interval=DEFAULT_INTERVAL, polling=False):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        # Only watch the folders that actually exist
+        self.folders = [os.path.abspath(folder) for folder in folders if os.path.isdir(folder)]
+        self.callback = callback
+        self.debounce = debounce
+        self.interval = interval
+        self._libc = None if polling else loadInotify()
+        self._stopped = threading.Event()
+        # Changed paths waiting for the burst to settle, and when the last one arrived
+        self._pending = set()
+        self._lastChange = 0
+
+    # Which method is doing the watching
+    @property
+    def method(self):
+        return "inotify" if self._libc else "polling"
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        logger.debug("Watching %d folders using %s" % (len(self.folders), self.method))
+        try:
+            if self._libc:
+                self._runInotify()
+            else:
+                self._runPolling()
+        except Exception:
+            logger.exception("  ! Project watcher has stopped")
+
+    # Remember a changed path, ignoring hidden files like our own caches and editor swap files
+    def _changed(self, path):
+        name = os.path.basename(path)
+        if name.startswith(".") or name.endswith("~"):
+            return
+        self._pending.add(path)
+        self._lastChange = time.time()
+
+    # Send the pending changes to the callback if things have quietened down
+    def _flush(self):
+        if self._pending and time.time() - self._lastChange >= self.debounce:
+            changes = self._pending
+            self._pending = set()
+            logger.debug("Project files changed: %s" % ", ".join(sorted(changes)))
+            self.callback(changes)
+
+    # How long to sleep before something needs doing
+    def _timeout(self, idle):
+        if self._pending:
+            return max(0, self.debounce - (time.time() - self._lastChange))
+        return idle
+
+    def _runInotify(self):
+        fd = self._libc.inotify_init()
+        if fd < 0:
+            logger.warn("  ! Warning: inotify unavailable, polling instead")
+            self._libc = None
+            return self._runPolling()
+        try:
+            # Map each watch descriptor back to its folder
+            watches = {}
+            for folder in self.folders:
+                path = folder if isinstance(folder, bytes) else folder.encode(sys.getfilesystemencoding() or "utf-8")
+                wd = self._libc.inotify_add_watch(fd, path, watchMask)
+                if wd >= 0:
+                    watches[wd] = folder
+            while not self._stopped.is_set():
+                # Wake up regularly so that stop() is noticed
+                ready = select.select([fd], [], [], min(self._timeout(self.interval), self.interval))[0]
+                if ready:
+                    data = os.read(fd, 65536)
+                    offset = 0
+                    while offset + eventHeader.size <= len(data):
+                        wd, mask, cookie, length = eventHeader.unpack_from(data, offset)
+                        name = data[offset+eventHeader.size:offset+eventHeader.size+length].rstrip(b"\0")
+                        offset += eventHeader.size + length
+                        if wd in watches and name:
+                            if not isinstance(watches[wd], bytes):
+                                name = name.decode(sys.getfilesystemencoding() or "utf-8")
+                            self._changed(os.path.join(watches[wd], name))
+                self._flush()
+        finally:
+            os.close(fd)
+
+    # Take a snapshot of the modification time and size of every file in the folders
+    def _scan(self):
+        snapshot = {}
+        for folder in self.folders:
+            try:
+                names = os.listdir(folder)
+            except(OSError):
+                continue
+            for name in names:
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except(OSError):
+                    continue
+                # Sub-folders are reported through the files inside them, if we watch them
+                if os.path.isdir(path):
+                    continue
+                snapshot[path] = (stat.st_mtime, stat.st_size)
+        return snapshot
+
+    def _runPolling(self):
+        previous = self._scan()
+        while not self._stopped.is_set():
+            self._stopped.wait(min(self._timeout(self.interval), self.interval))
+            current = self._scan()
+            for path in set(previous) | set(current):
+                if previous.get(path) != current.get(path):
+                    self._changed(path)
+            previous = current
+            self._flush()
+
+
+# Make bursts of edits to a project in a temporary folder, the way an editor or a file copy would, and check
+#   that each burst is reported once, with every file that changed in it and none of the hidden ones
+def testBursts(polling=False, debounce=0.3, interval=0.05, bursts=3):
+    import shutil
+    import tempfile
+    root = tempfile.mkdtemp()
+    try:
+        modeDir = os.path.join(root, "normal")
+        os.mkdir(modeDir)
+        reports = []
+        reported = threading.Event()
+        def callback(changes):
+            reports.append(changes)
+            reported.set()
+        watcher = ProjectWatcher([root, modeDir], callback, debounce, interval, polling)
+        watcher.start()
+        # Give the watcher time to take its first look at the folders
+        time.sleep(3 * interval)
+        try:
+            for burst in range(bursts):
+                expected = set()
+                # The layout and config are saved over, and a few sounds are copied in, a little apart
+                for name, size in (("Layout.txt", 100), ("Config.txt", 50), (".Layout.txt.swp", 10)):
+                    with open(os.path.join(root, name), "w") as f:
+                        f.write("x" * (size + burst))
+                    if not name.startswith("."):
+                        expected.add(os.path.join(watcher.folders[0], name))
+                    time.sleep(debounce / 10)
+                for n in range(3):
+                    name = "cue_%d_%d.wav" % (burst, n)
+                    with open(os.path.join(modeDir, name), "wb") as f:
+                        f.write(b"\0" * 4096)
+                    expected.add(os.path.join(watcher.folders[1], name))
+                    time.sleep(debounce / 10)
+                assert reported.wait(debounce + 10 * interval + 2), "burst %d wasn't reported (%s)" % (burst, watcher.method)
+                # Nothing more should turn up once the burst has been reported
+                time.sleep(debounce + 4 * interval)
+                assert len(reports) == 1, "burst %d was reported %d times (%s)" % (burst, len(reports), watcher.method)
+                assert reports[0] == expected, "burst %d reported %s, not %s (%s)" % (burst, sorted(reports[0]), sorted(expected), watcher.method)
+                del reports[:]
+                reported.clear()
+        finally:
+            watcher.stop()
+            watcher.join()
+        logger.info("%d bursts of edits were each reported once, using %s" % (bursts, watcher.method))
+    finally:
+        shutil.rmtree(root)
+
+
+# Watch a folder from the command line, which is handy for checking what we see
+#   python synth_watch_0_1.py test checks the watcher against a temporary project instead
+if __name__ == "__main__":
+    if sys.argv[1:] == ["test"]:
+        if loadInotify():
+            testBursts()
+        else:
+            logger.info("inotify isn't available here, so only polling is tested")
+        testBursts(polling=True)
+        sys.exit()
+    logger.setLevel(logging.DEBUG)
+    watcher = ProjectWatcher(sys.argv[1:] or ["."], lambda changes: logger.info("\n".join(sorted(changes))))
+    watcher.start()
+    try:
+        while watcher.is_alive():
+            watcher.join(1)
+    except(KeyboardInterrupt):
+        watcher.stop()
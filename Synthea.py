@@ -20,6 +20,8 @@ import wx
 sys.path.append("Resources")
 # load the latest version of the gui module
 import synth_board_0_4_3 as synth_board
+# the project catalog lets us list projects without opening every one
+import synth_catalog_0_1 as synth_catalog
 
 # Do we include a checkbox to toggle test mode?
 enabletestmode = True
@@ -119,25 +121,27 @@ class ContentPage(wx.Panel):
                 
         # Store a list of all the buttons
         self.projects = []
-        # Read through the Projects folder looking for projects
-        for folder in os.listdir("Projects"):
-            # Exception catching is useful, since we don't know what's in the Projects folder
-            try:
-                # Attempt to open the config file
-                f = open("Projects/"+folder+"/Config.txt")
-                # Read the config file to find the name
-                for line in f.readlines():
-                    if line.split(":")[0] == "name":
-                        # Parse the long title of the project
-                        title = line.split(":")[1].strip()
-                # Generate the button for that project file
-                project = PJ_Button(self,-1,title,folder)
-                # Set an event handler for the clicking of the button
-                self.Bind(wx.EVT_TOGGLEBUTTON, project.open, project)
-                # Add that button to the list of buttons
-                self.projects.append(project)
-            except:
-                continue
+        # Read the catalog of projects we've seen before, and check which ones have changed
+        self.catalog = synth_catalog.loadCatalog("Projects")
+        fresh, stale = synth_catalog.checkCatalog(self.catalog, "Projects")
+        # Forget about projects that have been removed
+        removed = set(self.catalog) - set(fresh) - set(folder for folder, stamp in stale)
+        for folder in removed:
+            del self.catalog[folder]
+        # Projects with a current catalog entry get their button straight away
+        for folder in fresh:
+            if self.catalog[folder]["title"]:
+                self.addProject(self.catalog[folder]["title"],folder)
+        # The others get a placeholder until they've been scanned
+        self.scanning = {}
+        for folder, stamp in stale:
+            self.scanning[folder] = self.addProject(folder+"...",folder)
+            self.scanning[folder].Disable()
+        # Scan the changed projects in the background, filling in their buttons as they finish
+        if stale:
+            self.scanner = synth_catalog.scanProjects(stale, lambda folder, entry: wx.CallAfter(self.projectScanned, folder, entry), "Projects")
+        elif removed:
+            synth_catalog.saveCatalog(self.catalog, "Projects")
                 
         aboutb = wx.Button(self, -1, "About Synthea", (50,50))
         self.Bind(wx.EVT_BUTTON, self.aboutSynthea, aboutb)
@@ -154,6 +158,7 @@ class ContentPage(wx.Panel):
         # Add the text
         outerbox.Add(self.title, 0, wx.ALIGN_CENTER|wx.ALL, 10)
         # Mount each group of buttons in the internal sizer
+        self.innerbox = innerbox
         for project in self.projects:
             # No relative scaling, align top, 5-pixel border on all sides
             innerbox.Add(project, 0, wx.ALIGN_CENTER|wx.ALL, 15)
@@ -170,6 +175,36 @@ class ContentPage(wx.Panel):
         self.SetSizer(outerbox)
         self.Layout()   
         
+    # Generate the button for a project folder
+    def addProject(self,title,folder):
+        project = PJ_Button(self,-1,title,folder)
+        # Set an event handler for the clicking of the button
+        self.Bind(wx.EVT_TOGGLEBUTTON, project.open, project)
+        # Add that button to the list of buttons
+        self.projects.append(project)
+        return project
+
+    # Fill in a placeholder button once its project has been scanned
+    def projectScanned(self,folder,entry):
+        # The window may have gone away while we were scanning
+        if not self:
+            return
+        project = self.scanning.pop(folder)
+        self.catalog[folder] = entry
+        # Without a name, it isn't a project after all
+        if entry["title"]:
+            project.SetLabel(entry["title"])
+            project.Enable()
+        else:
+            self.projects.remove(project)
+            self.innerbox.Detach(project)
+            project.Destroy()
+        self.Layout()
+        self.GetParent().Fit()
+        # Once everything's been scanned, remember it for next time
+        if not self.scanning:
+            synth_catalog.saveCatalog(self.catalog, "Projects")
+
     def aboutSynthea(self,evt):
         info = wx.AboutDialogInfo()
         info.Name = "Synthea"